@@ -0,0 +1,179 @@
+"""
+This file decides whether the API takes on a request or turns it away.
+Every route gets a limit on how many of its requests run at once and on
+how many may wait for a slot. When a route is full, or the whole worker
+is too busy for the route's priority, the request is refused straight
+away with a 503 and a Retry-After, instead of queuing behind a slow
+database until it times out.
+The limits are sized from how many requests the worker runs at once,
+its threads, set by configure() when gunicorn starts the worker.
+Requests gunicorn holds in its backlog never reach the app, so a worker
+behind a router that stamps X-Request-Start also sheds requests that
+already waited too long in front of it.
+"""
+
+import threading
+import time
+from collections import Counter
+
+CRITICAL = "critical"
+NORMAL = "normal"
+EXPENSIVE = "expensive"
+
+# requests a worker runs at once unless configure() is told otherwise,
+# gunicorn.conf.py's default threads
+THREADS = 8
+# how many requests of a route may run at once
+CONCURRENCY = {}
+# how many more may wait for a slot, and for how long
+QUEUE = {}
+WAIT = {CRITICAL: 2.0, NORMAL: 0.5, EXPENSIVE: 0.0}
+# busy requests in the whole worker past which a priority is shed
+HIGH_WATER = {}
+# seconds a request may have waited before reaching the worker
+MAX_QUEUED = {CRITICAL: None, NORMAL: 5.0, EXPENSIVE: 1.0}
+RETRY_AFTER = {CRITICAL: 1, NORMAL: 2, EXPENSIVE: 5}
+START_HEADER = "X-Request-Start"
+
+ADMITTED = "admitted"
+SHED = "shed"
+ACTIVE = "active"
+WAITING = "waiting"
+
+lock = threading.Lock()
+gates = {}
+waiting = Counter()
+active = Counter()
+admitted = Counter()
+shed = Counter()
+
+
+def configure(threads):
+    """
+    sizes the limits for a worker that runs threads requests at once
+    a request never counts itself as busy, so it sees at most threads - 1
+    others: normal routes are shed once all of them are taken, keeping
+    the last thread for critical ones, and expensive ones at half
+    """
+    with lock:
+        CONCURRENCY.update({CRITICAL: threads,
+                            NORMAL: max(1, threads * 3 // 4),
+                            EXPENSIVE: max(1, threads // 4)})
+        QUEUE.update({CRITICAL: threads, NORMAL: threads // 4,
+                      EXPENSIVE: 0})
+        HIGH_WATER.update({CRITICAL: None, NORMAL: max(1, threads - 1),
+                           EXPENSIVE: max(1, threads // 2)})
+        gates.clear()
+
+
+def queued_for(start, now=None):
+    """
+    how many seconds a request waited before reaching the app, from its
+    X-Request-Start: milliseconds since the epoch as Heroku sends it,
+    or t= seconds as nginx does; None without one
+    """
+    if not start:
+        return None
+    try:
+        stamp = float(start.strip().removeprefix("t="))
+    except ValueError:
+        return None
+    if stamp > 1e14:
+        stamp /= 1e6
+    elif stamp > 1e11:
+        stamp /= 1e3
+    return max(0.0, (time.time() if now is None else now) - stamp)
+
+
+def gate(route, priority):
+    """
+    returns the semaphore that bounds how many requests of a route run
+    """
+    with lock:
+        if route not in gates:
+            gates[route] = threading.BoundedSemaphore(CONCURRENCY[priority])
+        return gates[route]
+
+
+def busy():
+    """
+    how many requests this worker is running or holding right now
+    """
+    return sum(active.values()) + sum(waiting.values())
+
+
+def admit(route, priority, queued=None):
+    """
+    takes a slot for a request to route, waiting a little if allowed
+    queued is how long it waited before reaching the worker, if known
+    returns False if the request should be shed
+    a request that was admitted must be let go of with release()
+    """
+    limit = HIGH_WATER[priority]
+    patience = MAX_QUEUED[priority]
+    slot = gate(route, priority)
+    with lock:
+        if limit is not None and busy() >= limit or \
+                patience is not None and queued is not None \
+                and queued > patience:
+            shed[route] += 1
+            return False
+        if slot.acquire(blocking=False):
+            active[route] += 1
+            admitted[route] += 1
+            return True
+        if waiting[route] >= QUEUE[priority]:
+            shed[route] += 1
+            return False
+        waiting[route] += 1
+    got = slot.acquire(timeout=WAIT[priority]) if WAIT[priority] else False
+    with lock:
+        waiting[route] -= 1
+        if got:
+            active[route] += 1
+            admitted[route] += 1
+        else:
+            shed[route] += 1
+    return got
+
+
+def release(route):
+    """
+    gives back the slot taken by admit()
+    """
+    with lock:
+        active[route] -= 1
+    gates[route].release()
+
+
+def retry_after(priority):
+    """
+    how many seconds a shed client should wait before trying again
+    """
+    return RETRY_AFTER[priority]
+
+
+def stats():
+    """
+    per route counts of admitted, shed, running and waiting requests
+    """
+    with lock:
+        routes = set(admitted) | set(shed) | set(gates)
+        return {route: {ADMITTED: admitted[route], SHED: shed[route],
+                        ACTIVE: active[route], WAITING: waiting[route]}
+                for route in sorted(routes)}
+
+
+def reset():
+    """
+    forgets every gate and count
+    """
+    with lock:
+        gates.clear()
+        waiting.clear()
+        active.clear()
+        admitted.clear()
+        shed.clear()
+
+
+configure(THREADS)
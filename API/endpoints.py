@@ -3,26 +3,112 @@ This is the file containing all of the endpoints for our flask app.
 The endpoint called `endpoints` will return all available endpoints.
 """
 
+import gzip
+import hmac
+import io
+import os
+import threading
+import time
+from contextlib import ExitStack
 from http import HTTPStatus
-from flask import Flask, request
+from flask import (Flask, Response, g, request, has_request_context,
+                   stream_with_context)
 from flask_cors import CORS
 from flask_restx import Resource, Api, fields
 import werkzeug.exceptions as wz
+import API.admission as adm
+from API.idempotency import idempotent
+import db.bulk_io as bio
+import db.cache_invalidation as ci
+import db.db_connect as dbc
+import db.feed as feed
 import db.data_playlists as dbp
 import db.data_users as dbu
+import db.friend_index as fi
+import db.like_queue as lq
+import db.prefix_index as pi
+import db.recommend as rec
+import db.trigram_index as ti
 
 app = Flask(__name__)
 api = Api(app)
 CORS(app)
 app.config['ERROR_404_HELP'] = False
 
+if os.environ.get("WATCH_CHANGES", ''):
+    ci.start()
+if lq.enabled():
+    lq.start()
+if rec.every():
+    rec.start()
+
 user_ns = api.namespace('users', description="User related endpoints")
 playlist_ns = api.namespace('playlists',
                             description="Playlist related endpoints")
+admin_ns = api.namespace('admin', description="Maintenance endpoints, "
+                         "open to requests carrying the ADMIN_TOKEN")
 
 HELLO = 'Hola'
 WORLD = 'mundo'
 
+COUNTS = 'counts'
+LIMIT = 'limit'
+FIELDS = 'fields'
+OFFSET = 'offset'
+AFTER = 'after'
+BEFORE = 'before'
+TRUTHY = ('1', 'true', 'yes')
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+DEFAULT_FEED_PAGE = 20
+MAX_FEED_PAGE = 100
+DEFAULT_SONG_PAGE = 100
+MAX_SONG_PAGE = 1000
+MAX_OFFSET = 1000000
+# seconds every database call of one request has to share
+REQUEST_BUDGET = float(os.environ.get("REQUEST_BUDGET", 10))
+UNAVAILABLE_RETRY = 5
+# unset turns the admin endpoints off
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", '')
+ADMIN_HEADER = 'Admin-Token'
+BATCH = 'batch'
+WORKERS = 'workers'
+GZIP = 'gzip'
+MAX_BATCH = 10000
+MAX_WORKERS = 16
+
+endpoints = None
+
+# routes kept alive under load, and routes shed first
+CRITICAL_ROUTES = {
+    '/hello',
+    '/endpoints',
+    '/users/login/',
+    '/users/logout/',
+    '/users/get/<username>',
+    '/users/autocomplete/<prefix>',
+    '/users/<usern1>/relationship/<usern2>',
+    '/playlists/top',
+    '/playlists/trending',
+}
+EXPENSIVE_ROUTES = {
+    '/users/list',
+    '/users/delete/<username>',
+    '/users/search/<username>',
+    '/users/suggest_friends/<username>',
+    '/users/recommend_playlists/<username>',
+    '/playlists/list',
+    '/playlists/search/<playlist_name>',
+    '/playlists/delete/<playlist_name>',
+    '/admin/export/<collection>',
+    '/admin/import/<collection>',
+}
+# routes that move whole collections, so they aren't held to the budget
+UNBUDGETED_ROUTES = {
+    '/admin/export/<collection>',
+    '/admin/import/<collection>',
+}
+
 TOKEN_FIELDS = api.model('User_Token', {
     dbu.USERNAME: fields.String,
     dbu.TOKEN: fields.String
@@ -46,6 +132,168 @@ def verify_header(json, username=None):
         raise (wz.NotAcceptable("INVALID SESSION"))
 
 
+def verify_admin():
+    """
+    refuses the request unless it carries the admin token
+    """
+    given = request.headers.get(ADMIN_HEADER, '')
+    if not ADMIN_TOKEN or not hmac.compare_digest(given.encode(),
+                                                  ADMIN_TOKEN.encode()):
+        raise (wz.Forbidden("ADMIN ONLY"))
+
+
+def query_flag(name):
+    """
+    true if the query string of the current request turns on an option
+    """
+    if not has_request_context():
+        return False
+    return request.args.get(name, '').lower() in TRUTHY
+
+
+def query_int(name, default, maximum):
+    """
+    reads a non-negative int option from the query string,
+    capped at maximum
+    """
+    if not has_request_context():
+        return default
+    try:
+        val = int(request.args.get(name, default))
+    except ValueError:
+        raise (wz.BadRequest(f"{name} must be an integer"))
+    if val < 0:
+        raise (wz.BadRequest(f"{name} cannot be negative"))
+    return min(val, maximum)
+
+
+def query_list(name, choices):
+    """
+    reads a comma separated option from the query string,
+    every one of choices if it isn't there
+    """
+    if not has_request_context() or name not in request.args:
+        return choices
+    picked = [val.strip() for val in request.args[name].split(',')
+              if val.strip()]
+    if not set(picked) <= set(choices):
+        raise (wz.BadRequest(f"{name} can only hold {', '.join(choices)}"))
+    return picked
+
+
+def query_float(name):
+    """
+    reads an optional number from the query string, else None
+    """
+    if not has_request_context() or name not in request.args:
+        return None
+    try:
+        return float(request.args[name])
+    except ValueError:
+        raise (wz.BadRequest(f"{name} must be a number"))
+
+
+def endpoint_list():
+    """
+    the sorted routes of the app, worked out once
+    flask doesn't allow adding routes once it has served a request
+    """
+    global endpoints
+    if endpoints is None:
+        endpoints = sorted(rule.rule for rule in app.url_map.iter_rules())
+    return endpoints
+
+
+def build_spec():
+    """
+    builds and caches the swagger spec and the endpoint list,
+    which would otherwise be built by the first request for them
+    """
+    with app.test_request_context():
+        api.__schema__
+    endpoint_list()
+
+
+def build_indexes():
+    """
+    loads the in-memory indexes ahead of the first request that needs them
+    if the database can't be reached they are loaded on first use instead
+    """
+    try:
+        pi.build()
+        ti.build()
+    except dbc.DatabaseUnavailable as err:
+        print(f"Could not load the search indexes yet: {err}")
+
+
+def warm_up():
+    """
+    does the work left out of startup in the background,
+    once the worker is up and can already take requests
+    """
+    dbc.warm_up()
+    threading.Thread(target=build_spec, name="spec-warm-up",
+                     daemon=True).start()
+    threading.Thread(target=build_indexes, name="index-warm-up",
+                     daemon=True).start()
+
+
+def priority(route):
+    """
+    the admission priority of a route
+    """
+    if route in CRITICAL_ROUTES:
+        return adm.CRITICAL
+    if route in EXPENSIVE_ROUTES:
+        return adm.EXPENSIVE
+    return adm.NORMAL
+
+
+@app.before_request
+def admit_request():
+    """
+    sheds the request with a 503 if its route or the worker is saturated
+    """
+    if request.url_rule is None:
+        return None
+    route = request.url_rule.rule
+    level = priority(route)
+    queued = adm.queued_for(request.headers.get(adm.START_HEADER))
+    if not adm.admit(route, level, queued):
+        return ({"message": "SERVER BUSY, TRY AGAIN LATER"},
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                {"Retry-After": str(adm.retry_after(level))})
+    g.admitted = route
+    g.budget = ExitStack()
+    if route not in UNBUDGETED_ROUTES:
+        g.budget.enter_context(dbc.deadline(REQUEST_BUDGET))
+    return None
+
+
+@app.teardown_request
+def release_request(exc):
+    """
+    frees the slot and the time budget taken by the request,
+    however it ended
+    """
+    budget = g.pop('budget', None)
+    if budget is not None:
+        budget.close()
+    route = g.pop('admitted', None)
+    if route is not None:
+        adm.release(route)
+
+
+@api.errorhandler(dbc.DatabaseUnavailable)
+def database_unavailable(err):
+    """
+    answers 503 when the database is failing or the request ran out of time
+    """
+    return ({"message": "DATABASE UNAVAILABLE, TRY AGAIN LATER"},
+            HTTPStatus.SERVICE_UNAVAILABLE,
+            {"Retry-After": str(UNAVAILABLE_RETRY)})
+
+
 @api.route('/hello')
 class HelloWorld(Resource):
     """
@@ -72,8 +320,19 @@ class Endpoints(Resource):
         """
         The `get()` method will return a list of available endpoints.
         """
-        endpoints = sorted(rule.rule for rule in api.app.url_map.iter_rules())
-        return {"Available endpoints": endpoints}
+        return {"Available endpoints": endpoint_list()}
+
+
+@api.route('/admission')
+class Admission(Resource):
+    """
+    This class reports how many requests each route took on and shed.
+    """
+    def get(self):
+        """
+        Returns admitted, shed, running and waiting counts per route.
+        """
+        return adm.stats()
 
 # USER METHODS
 
@@ -85,11 +344,12 @@ class ListUsers(Resource):
     """
     @user_ns.response(HTTPStatus.OK, 'Success')
     @user_ns.response(HTTPStatus.NOT_FOUND, 'Not Found')
+    @user_ns.param(COUNTS, 'Return counters instead of arrays')
     def get(self):
         """
         Returns a list of all the users
         """
-        users = dbu.get_users()
+        users = dbu.get_users(query_flag(COUNTS))
         return users
 
 
@@ -141,6 +401,26 @@ class LoginUser(Resource):
             return {dbu.TOKEN: token}
 
 
+@user_ns.route('/logout/')
+class LogoutUser(Resource):
+    """
+    This class supports a user ending one of their sessions
+    """
+    @user_ns.expect(TOKEN_FIELDS)
+    @user_ns.response(HTTPStatus.OK, 'Success')
+    @user_ns.response(HTTPStatus.NOT_FOUND, 'Not Found')
+    def patch(self):
+        """
+        This method ends the session the token belongs to,
+        the user's other sessions stay logged in
+        """
+        username = request.json[dbu.USERNAME]
+        ret = dbu.logout(username, request.json[dbu.TOKEN])
+        if ret == dbu.NOT_FOUND:
+            raise (wz.NotFound("Session not found"))
+        return f"{username} logged out."
+
+
 @user_ns.route('/get/<username>')
 class GetUser(Resource):
     """
@@ -178,6 +458,22 @@ class SearchUser(Resource):
         return ret
 
 
+@user_ns.route('/autocomplete/<prefix>')
+class AutocompleteUser(Resource):
+    """
+    This class supports search-as-you-type for usernames
+    """
+    @user_ns.response(HTTPStatus.OK, 'Success')
+    @user_ns.param(LIMIT, 'How many usernames to return')
+    def get(self, prefix):
+        """
+        This method returns the usernames starting with prefix,
+        ignoring case, in alphabetical order
+        """
+        return pi.complete(prefix, query_int(LIMIT, DEFAULT_LIMIT,
+                                             MAX_LIMIT))
+
+
 @user_ns.route('/delete/<username>')
 class DeleteUser(Resource):
     """
@@ -222,15 +518,17 @@ class RequestUser(Resource):
     @user_ns.response(HTTPStatus.OK, 'Success')
     @user_ns.response(HTTPStatus.NOT_FOUND, 'Not Found')
     @user_ns.response(HTTPStatus.NOT_ACCEPTABLE, 'A duplicate key')
+    @idempotent
     def post(self, usern1, usern2):
         """
         This method adds two users to each others friend lists
         """
         if usern1 != usern2:
-            user1, user2 = dbu.get_user(usern1), dbu.get_user(usern2)
-            if user1 == dbu.NOT_FOUND or user2 == dbu.NOT_FOUND:
+            pair = dbu.get_pair(usern1, usern2)
+            if pair == dbu.NOT_FOUND:
                 raise(wz.NotFound("At least one user not found"))
-            elif usern1 in user2["friends"] or usern2 in user1["friends"]:
+            user1, user2 = pair
+            if usern1 in user2["friends"] or usern2 in user1["friends"]:
                 raise(wz.NotAcceptable("Users are already friends"))
             elif usern1 in user2['outgoingRequests'] or \
                     usern2 in user1['incomingRequests']:
@@ -261,9 +559,10 @@ class DecRequest(Resource):
         This method removes two users to each others request lists
         """
         if usern1 != usern2:
-            user1, user2 = dbu.get_user(usern1), dbu.get_user(usern2)
-            if user1 == dbu.NOT_FOUND or user2 == dbu.NOT_FOUND:
+            pair = dbu.get_pair(usern1, usern2)
+            if pair == dbu.NOT_FOUND:
                 raise(wz.NotFound("At least one user not found"))
+            user1, user2 = pair
             if usern1 in user2['outgoingRequests'] and \
                     usern2 in user1['incomingRequests']:
                 dbu.dec_req(usern1, usern2)
@@ -290,10 +589,11 @@ class BefriendUser(Resource):
         This method adds two users to each others friend lists
         """
         if usern1 != usern2:
-            user1, user2 = dbu.get_user(usern1), dbu.get_user(usern2)
-            if user1 == dbu.NOT_FOUND or user2 == dbu.NOT_FOUND:
+            pair = dbu.get_pair(usern1, usern2)
+            if pair == dbu.NOT_FOUND:
                 raise(wz.NotFound("At least one user not found"))
-            elif usern1 in user2["friends"] or usern2 in user1["friends"]:
+            user1, user2 = pair
+            if usern1 in user2["friends"] or usern2 in user1["friends"]:
                 raise(wz.NotAcceptable("Users are already friends"))
             elif usern1 in user2['outgoingRequests'] and \
                     usern2 in user1['incomingRequests']:
@@ -332,6 +632,28 @@ class UnfriendUser(Resource):
             raise(wz.NotAcceptable("Users are not friends"))
 
 
+@user_ns.route('/<usern1>/relationship/<usern2>')
+class Relationship(Resource):
+    """
+    This class supports checking how two users are connected
+    """
+    @user_ns.response(HTTPStatus.OK, 'Success')
+    @user_ns.response(HTTPStatus.NOT_FOUND, 'Not Found')
+    @user_ns.response(HTTPStatus.NOT_ACCEPTABLE, 'Same user')
+    def get(self, usern1, usern2):
+        """
+        This method returns whether two users are friends,
+        have a pending friend request, or neither,
+        along with the friends they have in common
+        """
+        if usern1 == usern2:
+            raise wz.NotAcceptable("A user has no relationship to themself")
+        ret = dbu.relationship(usern1, usern2)
+        if ret == dbu.NOT_FOUND:
+            raise wz.NotFound("At least one user not found")
+        return ret
+
+
 @user_ns.route('/<username>/like_playlist/<playlist_name>')
 class LikePlaylist(Resource):
     """
@@ -340,18 +662,18 @@ class LikePlaylist(Resource):
     @user_ns.response(HTTPStatus.OK, 'Success')
     @user_ns.response(HTTPStatus.NOT_FOUND, 'Not Found')
     @user_ns.response(HTTPStatus.NOT_ACCEPTABLE, 'A duplicate key')
+    @idempotent
     def post(self, username, playlist_name):
         """
         This method supports a user liking a playlist
         """
         user = dbu.get_user(username)
-        playlist = dbp.get_playlist(playlist_name)
+        liked = lq.liked_by(playlist_name, username)
         if user == dbu.NOT_FOUND:
             raise(wz.NotFound(f"User {username} not found"))
-        elif playlist == dbp.NOT_FOUND:
+        elif liked is None:
             raise(wz.NotFound(f"Playlist {playlist_name} not found"))
-        elif playlist_name in user['likedPlaylists'] or \
-                username in playlist['likes']:
+        elif playlist_name in user['likedPlaylists'] or liked:
             raise(wz.NotAcceptable(f"{username} has already\
              liked {playlist_name}"))
         else:
@@ -372,13 +694,12 @@ class UnlikePlaylist(Resource):
         This method supports a user unliking a playlist
         """
         user = dbu.get_user(username)
-        playlist = dbp.get_playlist(playlist_name)
+        liked = lq.liked_by(playlist_name, username)
         if user == dbu.NOT_FOUND:
             raise(wz.NotFound(f"User {username} not found"))
-        elif playlist == dbp.NOT_FOUND:
+        elif liked is None:
             raise(wz.NotFound(f"Playlist {playlist_name} not found"))
-        elif playlist_name not in user["likedPlaylists"] or \
-                username not in playlist['likes']:
+        elif playlist_name not in user["likedPlaylists"] or not liked:
             raise(wz.NotFound(f"{playlist_name} not in {username}'s likes"))
         else:
             dbu.unlike_playlist(username, playlist_name)
@@ -436,6 +757,101 @@ class GetLikedPlaylists(Resource):
             return dbu.get_liked_playlists(username)
 
 
+@user_ns.route('/profile/<username>')
+class UserProfile(Resource):
+    """
+    This class supports fetching everything a user's page shows at once
+    """
+    @user_ns.response(HTTPStatus.OK, 'Success')
+    @user_ns.response(HTTPStatus.NOT_FOUND, 'User not found')
+    @user_ns.response(HTTPStatus.BAD_REQUEST, 'Unknown section')
+    @user_ns.param(FIELDS, 'Comma separated sections to return, of '
+                   + ', '.join(dbu.PROFILE_SECTIONS) + '; all by default')
+    @user_ns.param(LIMIT, 'How many of each list to return')
+    @user_ns.doc(params={field + LIMIT.title(): f'How many {field} to '
+                         'return, in place of limit'
+                         for field in dbu.PROFILE_LISTS})
+    def get(self, username):
+        """
+        This method returns a user with their first friends, owned
+        playlists and liked playlists, and how many of each they have,
+        in a few batched queries instead of a request for each
+        """
+        limit = query_int(LIMIT, DEFAULT_LIMIT, MAX_LIMIT)
+        limits = {field: query_int(field + LIMIT.title(), limit, MAX_LIMIT)
+                  for field in dbu.PROFILE_LISTS}
+        ret = dbu.get_profile(username,
+                              query_list(FIELDS, dbu.PROFILE_SECTIONS),
+                              limits)
+        if ret == dbu.NOT_FOUND:
+            raise wz.NotFound(f"User {username} not found")
+        return ret
+
+
+@user_ns.route('/suggest_friends/<username>')
+class SuggestFriends(Resource):
+    """
+    This class supports suggesting friends of a user's friends
+    """
+    @user_ns.response(HTTPStatus.OK, 'Success')
+    @user_ns.response(HTTPStatus.NOT_FOUND, 'User not found')
+    @user_ns.param(LIMIT, 'How many suggestions to return')
+    def get(self, username):
+        """
+        This method lists users who share friends with a user,
+        most mutual friends first, leaving out current friends
+        and anyone with a pending friend request either way
+        """
+        ret = fi.suggest(username, query_int(LIMIT, DEFAULT_LIMIT,
+                                             fi.MAX_SUGGESTIONS))
+        if ret is None:
+            raise wz.NotFound(f"User {username} not found")
+        return ret
+
+
+@user_ns.route('/recommend_playlists/<username>')
+class RecommendPlaylists(Resource):
+    """
+    This class supports recommending playlists to a user
+    """
+    @user_ns.response(HTTPStatus.OK, 'Success')
+    @user_ns.response(HTTPStatus.NOT_FOUND, 'User not found')
+    @user_ns.param(LIMIT, 'How many playlists to return')
+    def get(self, username):
+        """
+        This method lists playlists liked by the same people
+        as the playlists this user likes, best match first
+        """
+        ret = rec.recommend(username, query_int(LIMIT, DEFAULT_LIMIT,
+                                                rec.MAX_PICKS))
+        if ret is None:
+            raise wz.NotFound(f"User {username} not found")
+        return ret
+
+
+@user_ns.route('/<username>/feed')
+class Feed(Resource):
+    """
+    This class supports showing a user what their friends have been doing
+    """
+    @user_ns.response(HTTPStatus.OK, 'Success')
+    @user_ns.response(HTTPStatus.NOT_FOUND, 'User not found')
+    @user_ns.param(LIMIT, 'How many events to return')
+    @user_ns.param(BEFORE, 'Only return events older than this time')
+    def get(self, username):
+        """
+        This method returns friends' playlist creations, likes and song
+        adds, newest first; passing the last event's ts back as before
+        fetches the next page
+        """
+        ret = feed.get_feed(username, query_int(LIMIT, DEFAULT_FEED_PAGE,
+                                                MAX_FEED_PAGE),
+                            query_float(BEFORE))
+        if ret is None:
+            raise wz.NotFound(f"User {username} not found")
+        return ret
+
+
 # PLAYLIST METHODS
 
 
@@ -446,17 +862,48 @@ class ListPlaylists(Resource):
     """
     @playlist_ns.response(HTTPStatus.OK, 'Success')
     @playlist_ns.response(HTTPStatus.NOT_FOUND, 'Not Found')
+    @playlist_ns.param(COUNTS, 'Return counters instead of arrays')
     def get(self):
         """
         Returns a list of all the playlists
         """
-        playlists = dbp.get_playlists()
+        playlists = dbp.get_playlists(query_flag(COUNTS))
         if playlists is None:
             raise (wz.NotFound("Users db not found."))
         else:
             return playlists
 
 
+@playlist_ns.route('/top')
+class TopPlaylists(Resource):
+    """
+    This class supports listing the most liked playlists
+    """
+    @playlist_ns.response(HTTPStatus.OK, 'Success')
+    @playlist_ns.param(LIMIT, 'How many playlists to return')
+    def get(self):
+        """
+        Returns the most liked playlists, most likes first
+        """
+        return dbp.top_playlists(query_int(LIMIT, DEFAULT_LIMIT, MAX_LIMIT))
+
+
+@playlist_ns.route('/trending')
+class TrendingPlaylists(Resource):
+    """
+    This class supports listing the playlists with the most recent likes
+    """
+    @playlist_ns.response(HTTPStatus.OK, 'Success')
+    @playlist_ns.param(LIMIT, 'How many playlists to return')
+    def get(self):
+        """
+        Returns the playlists ranked by likes decayed over time,
+        so a like from today counts twice as much as one from yesterday
+        """
+        return dbp.trending_playlists(query_int(LIMIT, DEFAULT_LIMIT,
+                                                MAX_LIMIT))
+
+
 @playlist_ns.route('/create/<user_name>/<playlist_name>')
 class CreatePlaylist(Resource):
     """
@@ -466,6 +913,7 @@ class CreatePlaylist(Resource):
     @playlist_ns.response(HTTPStatus.NOT_FOUND, 'Not Found')
     @playlist_ns.response(HTTPStatus.NOT_ACCEPTABLE, 'A duplicate key')
     @playlist_ns.expect(TOKEN_FIELDS)
+    @idempotent
     def post(self, user_name, playlist_name):
         """
         This method adds a playlist to the database
@@ -487,16 +935,15 @@ class SearchPlaylist(Resource):
     """
     @playlist_ns.response(HTTPStatus.OK, 'Success')
     @playlist_ns.response(HTTPStatus.NOT_FOUND, 'Not Found')
-    @playlist_ns.response(HTTPStatus.NOT_ACCEPTABLE, 'A duplicate key')
+    @playlist_ns.param(LIMIT, 'How many playlists to return')
     def get(self, playlist_name):
         """
-        This method searches for a playlist in the database
+        This method finds the playlists whose names are most like
+        playlist_name, typos and all, best match first
         """
-        ret = dbp.get_playlists()
-        ret = [pl for pl in ret if playlist_name in pl['playlistName']]
-        if ret == dbp.NOT_FOUND:
-            raise (wz.NotFound("playlist not found."))
-        return ret
+        return dbp.search_playlists(playlist_name,
+                                    query_int(LIMIT, DEFAULT_LIMIT,
+                                              MAX_LIMIT))
 
 
 @playlist_ns.route('/delete/<playlist_name>')
@@ -511,17 +958,39 @@ class DeletePlaylist(Resource):
         """
         This method deletes a playlist from the database
         """
-        playlist = dbp.get_playlist(playlist_name)
-        if playlist == dbp.NOT_FOUND:
+        if not dbp.playlist_exists(playlist_name):
             raise (wz.NotFound("Playlist db not found."))
         else:
-            up = UnlikePlaylist(Resource)
-            for user in playlist['likes']:
-                up.post(user, playlist_name)
+            dbu.drop_likes(playlist_name)
             dbp.del_playlist(playlist_name)
             return f"{playlist_name} deleted."
 
 
+@playlist_ns.route('/<pl_name>/songs')
+class ListSongs(Resource):
+    """
+    This class supports paging through the songs in a playlist
+    """
+    @playlist_ns.response(HTTPStatus.OK, 'Success')
+    @playlist_ns.response(HTTPStatus.NOT_FOUND, 'Not Found')
+    @playlist_ns.param(OFFSET, 'How many songs to skip')
+    @playlist_ns.param(LIMIT, 'How many songs to return')
+    @playlist_ns.param(AFTER, 'Only return songs past this position')
+    def get(self, pl_name):
+        """
+        This method returns a page of a playlist's songs in order,
+        each with its position; passing the last position back as after
+        fetches the next page without skipping through the earlier ones
+        """
+        ret = dbp.get_songs(pl_name, query_int(OFFSET, 0, MAX_OFFSET),
+                            query_int(LIMIT, DEFAULT_SONG_PAGE,
+                                      MAX_SONG_PAGE),
+                            query_float(AFTER))
+        if not ret and not dbp.playlist_exists(pl_name):
+            raise (wz.NotFound("Playlist not found."))
+        return ret
+
+
 @playlist_ns.route('/<pl_name>/add_song/<song_name>')
 class AddToPlaylist(Resource):
     """
@@ -536,15 +1005,12 @@ class AddToPlaylist(Resource):
         This method adds a song to a playlist in the database
         """
         verify_header(request.json)
-        playlist = dbp.get_playlist(pl_name)
-        if playlist == dbp.NOT_FOUND:
+        ret = dbp.add_song(pl_name, song_name, request.json[dbu.USERNAME])
+        if ret == dbp.NOT_FOUND:
             raise (wz.NotFound("Playlist db not found."))
-        else:
-            if song_name in playlist["songs"]:
-                raise (wz.NotAcceptable("song already in playlist"))
-            else:
-                dbp.add_song(pl_name, song_name)
-                return f"{song_name} added to {pl_name}."
+        elif ret == dbp.DUPLICATE:
+            raise (wz.NotAcceptable("song already in playlist"))
+        return f"{song_name} added to {pl_name}."
 
 
 @playlist_ns.route('/<pl_name>/remove_song/<song_name>')
@@ -561,12 +1027,100 @@ class RemoveFromPlaylist(Resource):
         This method removes a song from a playlist in the database
         """
         verify_header(request.json)
-        playlist = dbp.get_playlist(pl_name)
-        if playlist == dbp.NOT_FOUND:
+        ret = dbp.rem_song(pl_name, song_name)
+        if ret == dbp.NOT_FOUND:
             raise (wz.NotFound("Playlist not found."))
-        else:
-            if song_name not in playlist["songs"]:
-                raise (wz.NotFound("song not in playlist"))
-            else:
-                dbp.rem_song(pl_name, song_name)
-                return f"{song_name} removed from {pl_name}."
+        elif ret == dbp.NOT_IN_PLAYLIST:
+            raise (wz.NotFound("song not in playlist"))
+        return f"{song_name} removed from {pl_name}."
+
+
+@playlist_ns.route('/<pl_name>/move_song/<song_name>')
+class MoveSong(Resource):
+    """
+    This class supports reordering the songs in a playlist
+    """
+    @playlist_ns.expect(TOKEN_FIELDS)
+    @playlist_ns.response(HTTPStatus.OK, 'Success')
+    @playlist_ns.response(HTTPStatus.NOT_FOUND, 'Not Found')
+    @playlist_ns.param(BEFORE, 'The song to move it in front of, '
+                       'or leave out to move it to the end')
+    def patch(self, pl_name, song_name):
+        """
+        This method moves a song to just before another song,
+        or to the end of the playlist
+        """
+        verify_header(request.json)
+        before = request.args.get(BEFORE)
+        ret = dbp.move_song(pl_name, song_name, before)
+        if ret == dbp.NOT_FOUND:
+            raise (wz.NotFound("Playlist not found."))
+        elif ret == dbp.NOT_IN_PLAYLIST:
+            raise (wz.NotFound("song not in playlist"))
+        if before is None:
+            return f"{song_name} moved to the end of {pl_name}."
+        return f"{song_name} moved before {before} in {pl_name}."
+
+
+# ADMIN METHODS
+
+
+@admin_ns.route('/export/<collection>')
+class Export(Resource):
+    """
+    This class streams a whole collection out as NDJSON
+    """
+    @admin_ns.response(HTTPStatus.OK, 'Success')
+    @admin_ns.response(HTTPStatus.FORBIDDEN, 'Admin only')
+    @admin_ns.response(HTTPStatus.NOT_FOUND, 'Not Found')
+    @admin_ns.param(GZIP, 'Gzip the export')
+    def get(self, collection):
+        """
+        Returns every doc of users, playlists, playlistSongs or
+        playlistLikes, one per line in MongoDB extended JSON
+        """
+        verify_admin()
+        if collection not in bio.COLLECTIONS:
+            raise (wz.NotFound(f"{collection} can't be exported"))
+        body = bio.lines(collection)
+        if query_flag(GZIP):
+            return Response(stream_with_context(bio.gzipped(body)),
+                            mimetype="application/gzip")
+        return Response(stream_with_context(body),
+                        mimetype="application/x-ndjson")
+
+
+@admin_ns.route('/import/<collection>')
+class Import(Resource):
+    """
+    This class loads a collection from an NDJSON upload
+    """
+    @admin_ns.response(HTTPStatus.OK, 'Success')
+    @admin_ns.response(HTTPStatus.FORBIDDEN, 'Admin only')
+    @admin_ns.response(HTTPStatus.NOT_FOUND, 'Not Found')
+    @admin_ns.param(BATCH, 'How many docs to insert at once')
+    @admin_ns.param(WORKERS, 'How many batches to insert at once')
+    def post(self, collection):
+        """
+        Inserts the docs of an NDJSON body, gzipped if it is sent with
+        Content-Encoding: gzip, skipping docs already there; returns how
+        many were read and inserted and how long it took
+        """
+        verify_admin()
+        if collection not in bio.COLLECTIONS:
+            raise (wz.NotFound(f"{collection} can't be imported"))
+        batch = max(1, query_int(BATCH, bio.BATCH, MAX_BATCH))
+        workers = max(1, query_int(WORKERS, bio.WORKERS, MAX_WORKERS))
+        body = request.stream
+        if request.content_encoding == GZIP:
+            body = gzip.GzipFile(fileobj=body)
+        start = time.monotonic()
+        try:
+            read, inserted = bio.import_docs(
+                collection, io.TextIOWrapper(body, encoding="utf-8"),
+                batch, workers)
+        except (ValueError, OSError) as err:
+            raise (wz.BadRequest(f"Bad NDJSON: {err}"))
+        seconds = time.monotonic() - start
+        return {"read": read, "inserted": inserted,
+                "seconds": round(seconds, 3)}
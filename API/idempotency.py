@@ -0,0 +1,57 @@
+"""
+This file lets write endpoints honor an Idempotency-Key header.
+The first request with a key runs as usual and its response is stored;
+a retry with the same key, method and path gets that response replayed,
+with an Idempotent-Replayed header, without running the endpoint again.
+"""
+
+import functools
+import hashlib
+from http import HTTPStatus
+from flask import request, has_request_context
+import werkzeug.exceptions as wz
+import db.data_idempotency as dbi
+
+HEADER = "Idempotency-Key"
+REPLAYED = "Idempotent-Replayed"
+MAX_KEY = 255
+
+
+def idempotent(method):
+    """
+    decorates a Resource method so retries with the same key are replayed
+    client errors are stored like successes; server errors aren't,
+    so a request that failed on our side can be retried for real
+    """
+    @functools.wraps(method)
+    def call(self, *args, **kwargs):
+        key = request.headers.get(HEADER) if has_request_context() else None
+        if not key:
+            return method(self, *args, **kwargs)
+        if len(key) > MAX_KEY:
+            raise (wz.BadRequest(f"{HEADER} is too long"))
+        scope = f"{request.method} {request.path} {key}"
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        stored = dbi.claim(scope, fingerprint)
+        if stored is not None:
+            if stored[dbi.FINGERPRINT] != fingerprint:
+                raise (wz.UnprocessableEntity(
+                    f"{HEADER} was already used with another request body"))
+            if not stored[dbi.DONE]:
+                raise (wz.Conflict(
+                    f"A request with this {HEADER} is still running"))
+            return stored[dbi.BODY], stored[dbi.STATUS], {REPLAYED: "true"}
+        try:
+            ret = method(self, *args, **kwargs)
+        except wz.HTTPException as err:
+            if err.code < HTTPStatus.INTERNAL_SERVER_ERROR:
+                dbi.save(scope, err.code, {"message": err.description})
+            else:
+                dbi.forget(scope)
+            raise
+        except Exception:
+            dbi.forget(scope)
+            raise
+        dbi.save(scope, HTTPStatus.OK, ret)
+        return ret
+    return call
@@ -0,0 +1,72 @@
+"""
+This file holds the admin tests for endpoints.py
+"""
+
+import gzip
+from http import HTTPStatus
+from unittest import TestCase
+
+import API.endpoints as ep
+import db.data_playlists as dbp
+import db.data_users as dbu
+import db.db_connect as dbc
+
+TEST_CLIENT = ep.app.test_client()
+FAKE_TOKEN = "fake admin token"
+FAKE_PASSWORD = "FakePassword"
+ADMIN = {ep.ADMIN_HEADER: FAKE_TOKEN}
+
+
+class AdminTestCase(TestCase):
+    def setUp(self):
+        self.token = ep.ADMIN_TOKEN
+        ep.ADMIN_TOKEN = FAKE_TOKEN
+
+    def tearDown(self):
+        ep.ADMIN_TOKEN = self.token
+
+    def test_admin_only(self):
+        """
+        admin endpoints refuse requests without the right token
+        """
+        resp = TEST_CLIENT.get('/admin/export/users')
+        self.assertEqual(HTTPStatus.FORBIDDEN, resp.status_code)
+        resp = TEST_CLIENT.get('/admin/export/users',
+                               headers={ep.ADMIN_HEADER: "wrong"})
+        self.assertEqual(HTTPStatus.FORBIDDEN, resp.status_code)
+        resp = TEST_CLIENT.get('/admin/export/users',
+                               headers={ep.ADMIN_HEADER: "wr\u00f6ng"})
+        self.assertEqual(HTTPStatus.FORBIDDEN, resp.status_code)
+
+    def test_turned_off(self):
+        """
+        without an ADMIN_TOKEN set no token gets in
+        """
+        ep.ADMIN_TOKEN = ''
+        resp = TEST_CLIENT.get('/admin/export/users',
+                               headers={ep.ADMIN_HEADER: ''})
+        self.assertEqual(HTTPStatus.FORBIDDEN, resp.status_code)
+
+    def test_unknown_collection(self):
+        """
+        only users, playlists and their songs can be moved
+        """
+        resp = TEST_CLIENT.get('/admin/export/sessions', headers=ADMIN)
+        self.assertEqual(HTTPStatus.NOT_FOUND, resp.status_code)
+
+    def test_export_import(self):
+        """
+        a gzipped export can be imported back
+        """
+        dbu.empty()
+        dbp.empty()
+        for i in range(5):
+            dbu.add_user(f"user {i}", FAKE_PASSWORD)
+        resp = TEST_CLIENT.get('/admin/export/users?gzip=1', headers=ADMIN)
+        self.assertEqual(5, len(gzip.decompress(resp.data).splitlines()))
+        dbu.empty()
+        resp = TEST_CLIENT.post('/admin/import/users?batch=2', data=resp.data,
+                                headers={**ADMIN,
+                                         "Content-Encoding": "gzip"})
+        self.assertEqual(5, resp.get_json()["inserted"])
+        self.assertEqual(5, dbc.count(dbu.USERS))
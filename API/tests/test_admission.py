@@ -0,0 +1,195 @@
+"""
+This file holds the tests for admission.py
+"""
+
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from unittest import TestCase
+
+import API.admission as adm
+
+ROUTE = "/fake/route"
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+THREADS = 4
+LIKE_ROUTE = '/users/<username>/like_playlist/<playlist_name>'
+# a like whose body never finishes arriving, so it holds its thread
+STALLED_LIKE = ("POST /users/fake/like_playlist/fake HTTP/1.1\r\n"
+                "Host: localhost\r\nIdempotency-Key: {}\r\n"
+                "Content-Type: application/json\r\n"
+                "Content-Length: 100\r\n\r\n{{")
+
+
+class AdmissionTestCase(TestCase):
+    def setUp(self):
+        adm.reset()
+
+    def tearDown(self):
+        adm.reset()
+
+    def test_admit(self):
+        """
+        a request is admitted while its route has free slots
+        """
+        self.assertTrue(adm.admit(ROUTE, adm.NORMAL))
+        self.assertEqual(1, adm.stats()[ROUTE][adm.ACTIVE])
+        adm.release(ROUTE)
+        self.assertEqual(0, adm.stats()[ROUTE][adm.ACTIVE])
+        self.assertEqual(1, adm.stats()[ROUTE][adm.ADMITTED])
+
+    def test_shed_full_route(self):
+        """
+        an expensive route with every slot taken sheds at once
+        """
+        for i in range(adm.CONCURRENCY[adm.EXPENSIVE]):
+            self.assertTrue(adm.admit(ROUTE, adm.EXPENSIVE))
+        self.assertFalse(adm.admit(ROUTE, adm.EXPENSIVE))
+        self.assertEqual(1, adm.stats()[ROUTE][adm.SHED])
+
+    def test_wait_for_slot(self):
+        """
+        a queued request gets the slot another request gives back
+        """
+        for i in range(adm.CONCURRENCY[adm.CRITICAL]):
+            adm.admit(ROUTE, adm.CRITICAL)
+        threading.Timer(0.1, adm.release, [ROUTE]).start()
+        self.assertTrue(adm.admit(ROUTE, adm.CRITICAL))
+
+    def test_configure(self):
+        """
+        the limits follow the worker's threads and can all be reached
+        """
+        adm.configure(THREADS)
+        try:
+            self.assertEqual(THREADS - 1, adm.HIGH_WATER[adm.NORMAL])
+            self.assertEqual(THREADS // 2, adm.HIGH_WATER[adm.EXPENSIVE])
+            self.assertEqual(THREADS, adm.CONCURRENCY[adm.CRITICAL])
+        finally:
+            adm.configure(adm.THREADS)
+
+    def test_queued_for(self):
+        """
+        the time spent in front of the worker is read in either format
+        """
+        self.assertEqual(2.5, adm.queued_for("1000000000000", 1000000002.5))
+        self.assertEqual(2.5, adm.queued_for("t=1000000000.0", 1000000002.5))
+        self.assertEqual(0.0, adm.queued_for("1000000005000", 1000000002.5))
+        self.assertIsNone(adm.queued_for(None))
+        self.assertIsNone(adm.queued_for("soon"))
+
+    def test_queued_too_long(self):
+        """
+        a request that waited too long to get in is shed unless critical
+        """
+        self.assertFalse(adm.admit(ROUTE, adm.EXPENSIVE, queued=30))
+        self.assertTrue(adm.admit(ROUTE, adm.CRITICAL, queued=30))
+
+    def test_high_water(self):
+        """
+        a busy worker sheds expensive routes but not critical ones
+        """
+        for i in range(adm.HIGH_WATER[adm.EXPENSIVE]):
+            adm.admit(f"{ROUTE}/{i}", adm.CRITICAL)
+        self.assertFalse(adm.admit(ROUTE, adm.EXPENSIVE))
+        self.assertTrue(adm.admit(ROUTE, adm.CRITICAL))
+
+
+class WorkerTestCase(TestCase):
+    """
+    runs the app under gunicorn with the shipped config, so requests are
+    admitted by real gthread workers rather than a test client
+    """
+    @classmethod
+    def setUpClass(cls):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            cls.port = probe.getsockname()[1]
+        env = dict(os.environ, PORT=str(cls.port), WEB_CONCURRENCY="1",
+                   GUNICORN_THREADS=str(THREADS), LOCAL_MONGO="0",
+                   TEST_MODE="1")
+        cls.server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+             "--bind", f"127.0.0.1:{cls.port}", "API.endpoints:app"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL)
+        end = time.monotonic() + 30
+        while True:
+            try:
+                cls.get('/endpoints')
+                return
+            except OSError:
+                if time.monotonic() > end:
+                    cls.server.kill()
+                    raise
+                time.sleep(0.2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.wait()
+
+    @classmethod
+    def get(cls, path, headers={}):
+        """
+        the status and body of a GET to the server
+        """
+        conn = http.client.HTTPConnection("127.0.0.1", cls.port, timeout=30)
+        try:
+            conn.request("GET", path, headers=headers)
+            resp = conn.getresponse()
+            return resp.status, resp.read()
+        finally:
+            conn.close()
+
+    def stall(self, count):
+        """
+        ties up count worker threads with likes that never finish
+        """
+        stalled = []
+        for i in range(count):
+            conn = socket.create_connection(("127.0.0.1", self.port))
+            conn.sendall(STALLED_LIKE.format(time.time_ns()).encode())
+            stalled.append(conn)
+        self.addCleanup(lambda: [conn.close() for conn in stalled])
+        end = time.monotonic() + 10
+        while self.running(LIKE_ROUTE) < count:
+            self.assertLess(time.monotonic(), end)
+            time.sleep(0.05)
+        return stalled
+
+    def running(self, route):
+        """
+        how many requests to route the worker is running
+        """
+        status, body = self.get('/admission')
+        return json.loads(body).get(route, {}).get(adm.ACTIVE, 0)
+
+    def test_busy_worker_sheds_expensive(self):
+        """
+        with half the threads busy, expensive routes are shed and
+        critical ones still answered
+        """
+        stalled = self.stall(THREADS // 2)
+        status, body = self.get('/users/list')
+        self.assertEqual(503, status)
+        self.assertIn(b"SERVER BUSY", body)
+        self.assertEqual(200, self.get('/endpoints')[0])
+        for conn in stalled:
+            conn.close()
+
+    def test_queued_too_long(self):
+        """
+        a request that waited in front of the worker too long is shed
+        unless critical
+        """
+        stamp = {adm.START_HEADER: str(int((time.time() - 30) * 1000))}
+        status, body = self.get('/users/list', stamp)
+        self.assertEqual(503, status)
+        self.assertIn(b"SERVER BUSY", body)
+        self.assertEqual(200, self.get('/endpoints', stamp)[0])
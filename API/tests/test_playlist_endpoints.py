@@ -66,6 +66,50 @@ class EndpointTestCase(TestCase):
         for val in ret:
             self.assertIsInstance(val, dict)
 
+    def test_list_playlists4(self):
+        """
+        Post-condition 4: with counts on, playlists carry counters
+        instead of arrays
+        """
+        dbp.add_playlist(new_entity_name("playlist"), FAKE_USER)
+        ret = TEST_CLIENT.get('/playlists/list?counts=true').json
+        for pl in ret:
+            self.assertIn(dbp.LIKE_COUNT, pl)
+            self.assertNotIn(dbp.LIKES, pl)
+
+    def test_top_playlists1(self):
+        """
+        Post-condition 1: playlists come back most liked first, up to limit
+        """
+        user = new_user()
+        liked = new_entity_name("playlist")
+        dbp.add_playlist(liked, FAKE_USER)
+        dbp.add_playlist(new_entity_name("playlist"), FAKE_USER)
+        dbu.like_playlist(user, liked)
+        ret = TEST_CLIENT.get('/playlists/top?limit=1').json
+        self.assertEqual([pl['playlistName'] for pl in ret], [liked])
+
+    def test_top_playlists2(self):
+        """
+        Post-condition 2: a limit that isn't a number is rejected
+        """
+        resp = TEST_CLIENT.get('/playlists/top?limit=many')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_trending_playlists1(self):
+        """
+        Post-condition 1: liking a playlist makes it trend, unliking undoes it
+        """
+        user = new_user()
+        newpl = new_entity_name("playlist")
+        dbp.add_playlist(newpl, FAKE_USER)
+        dbu.like_playlist(user, newpl)
+        ret = TEST_CLIENT.get('/playlists/trending').json
+        self.assertEqual([pl['playlistName'] for pl in ret], [newpl])
+        dbu.unlike_playlist(user, newpl)
+        ret = TEST_CLIENT.get('/playlists/trending').json
+        self.assertEqual(ret, [])
+
     def test_create_playlist1(self):
         """
         Post-condition 1: create playlist and check if in db
@@ -86,6 +130,22 @@ class EndpointTestCase(TestCase):
         resp = TEST_CLIENT.post(f'/playlists/create/{body[dbu.USERNAME]}/{FAKE_PLAYLIST}', json=body)
         self.assertEqual(resp.json['message'], 'Playlist already exists.')
         
+    def test_create_playlist_idempotent(self):
+        """
+        a retry with the same Idempotency-Key replays the first response
+        """
+        body = login()
+        url = f'/playlists/create/{body[dbu.USERNAME]}/{FAKE_PLAYLIST}'
+        headers = {'Idempotency-Key': new_entity_name("KEY")}
+        first = TEST_CLIENT.post(url, json=body, headers=headers)
+        again = TEST_CLIENT.post(url, json=body, headers=headers)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(first.json, again.json)
+        self.assertEqual(again.headers['Idempotent-Replayed'], 'true')
+        resp = TEST_CLIENT.post(url, json={}, headers=headers)
+        self.assertEqual(resp.status_code, 422)
+
     def test_search_playlist1(self):
         """
         Post-condition 1: successfully search for a playlist that exists
@@ -161,6 +221,66 @@ class EndpointTestCase(TestCase):
         resp = TEST_CLIENT.post(f"/playlists/{newplaylist}/add_song/{newsong}", json=body)
         self.assertEqual(resp.json['message'], "song already in playlist")
 
+    def test_add_song3(self):
+        """
+        Post-condition 3: adding a song to a playlist that doesn't exist
+        results in an error
+        """
+        body = login()
+        newsong = new_entity_name("song")
+        newplaylist = new_entity_name("playlist")
+        resp = TEST_CLIENT.post(
+            f"/playlists/{newplaylist}/add_song/{newsong}", json=body)
+        self.assertEqual(resp.status_code, 404)
+
+    def test_list_songs1(self):
+        """
+        Post-condition 1: songs can be paged through in order
+        """
+        newpl = new_entity_name("playlist")
+        dbp.add_playlist(newpl, FAKE_USER)
+        for i in range(3):
+            dbp.add_song(newpl, f"song{i}")
+        resp = TEST_CLIENT.get(f"/playlists/{newpl}/songs?offset=1&limit=1")
+        self.assertEqual([item[dbp.SONG] for item in resp.json], ["song1"])
+        after = resp.json[0][dbp.POS]
+        resp = TEST_CLIENT.get(f"/playlists/{newpl}/songs?after={after}")
+        self.assertEqual([item[dbp.SONG] for item in resp.json], ["song2"])
+
+    def test_list_songs2(self):
+        """
+        Post-condition 2: paging through a playlist that doesn't exist
+        results in an error
+        """
+        newpl = new_entity_name("playlist")
+        resp = TEST_CLIENT.get(f"/playlists/{newpl}/songs")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_move_song1(self):
+        """
+        Post-condition 1: a song can be moved in front of another
+        """
+        body = login()
+        newpl = new_entity_name("playlist")
+        dbp.add_playlist(newpl, body[dbu.USERNAME])
+        dbp.add_song(newpl, "first")
+        dbp.add_song(newpl, "second")
+        TEST_CLIENT.patch(f"/playlists/{newpl}/move_song/second?before=first",
+                          json=body)
+        self.assertEqual(dbp.get_playlist(newpl)["songs"], ["second", "first"])
+
+    def test_move_song2(self):
+        """
+        Post-condition 2: moving a song that isn't in the playlist
+        results in an error
+        """
+        body = login()
+        newpl = new_entity_name("playlist")
+        dbp.add_playlist(newpl, body[dbu.USERNAME])
+        resp = TEST_CLIENT.patch(f"/playlists/{newpl}/move_song/song",
+                                 json=body)
+        self.assertEqual(resp.json['message'], "song not in playlist")
+
     def test_remove_song1(self):
         """
         Post-condition 1: we can remove a song from a playlist given that it is present
@@ -0,0 +1,61 @@
+"""
+This file holds the tests for how the app starts up
+"""
+
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+import API.endpoints as ep
+
+CONNECTED = """
+import API.endpoints
+import db.db_connect as dbc
+print(dbc.client is not None)
+"""
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(ep.__file__)))
+
+
+class StartupTestCase(TestCase):
+    def test_import_does_not_connect(self):
+        """
+        importing the app makes no mongo client, even for the cloud cluster
+        """
+        env = {name: val for name, val in os.environ.items()
+               if name != "LOCAL_MONGO"}
+        found = subprocess.run([sys.executable, "-c", CONNECTED],
+                               capture_output=True, text=True, env=env,
+                               cwd=ROOT)
+        self.assertEqual(0, found.returncode, found.stderr)
+        self.assertEqual("False", found.stdout.split()[-1])
+
+    def test_import_with_listener(self):
+        """
+        the change stream listener connects in its own thread, so the app
+        imports even when mongo can't be reached
+        """
+        env = {name: val for name, val in os.environ.items()
+               if name != "LOCAL_MONGO"}
+        env["WATCH_CHANGES"] = "1"
+        found = subprocess.run([sys.executable, "-c", CONNECTED],
+                               capture_output=True, text=True, env=env,
+                               cwd=ROOT, timeout=30)
+        self.assertEqual(0, found.returncode, found.stderr)
+
+    def test_endpoint_list(self):
+        """
+        the endpoint list is every route, sorted, worked out once
+        """
+        rules = sorted(rule.rule for rule in ep.app.url_map.iter_rules())
+        self.assertEqual(rules, ep.endpoint_list())
+        self.assertIs(ep.endpoint_list(), ep.endpoint_list())
+
+    def test_build_spec(self):
+        """
+        the swagger spec is cached once built, and served from the cache
+        """
+        ep.build_spec()
+        self.assertIn("paths", ep.api._schema)
+        resp = ep.app.test_client().get('/swagger.json')
+        self.assertEqual(ep.api._schema, resp.get_json())
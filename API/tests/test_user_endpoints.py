@@ -82,6 +82,17 @@ class EndpointTestCase(TestCase):
         for obj in ret:
             self.assertIsInstance(obj["password"], str)
 
+    def test_list_users5(self):
+        """
+        Post-condition 5: with counts on, users carry counters
+        instead of arrays
+        """
+        new_entity()
+        ret = TEST_CLIENT.get('/users/list?counts=true').json
+        for obj in ret:
+            self.assertIn(dbu.FRIEND_COUNT, obj)
+            self.assertNotIn(dbu.FRIENDS, obj)
+
     def test_create_user1(self):
         """
         Post-condition 1: create user and check if in db
@@ -325,7 +336,72 @@ class EndpointTestCase(TestCase):
         df = ep.DecRequest(Resource)
         self.assertRaises(wz.NotFound, df.post, new1, new2)
 
-        
+    def test_relationship1(self):
+        """
+        Post-condition 1: a pending request shows up from both sides
+        """
+        user1, user2 = new_entity(), new_entity()
+        TEST_CLIENT.post(f'/users/{user1}/req_friend/{user2}')
+        resp = TEST_CLIENT.get(f'/users/{user1}/relationship/{user2}')
+        self.assertEqual(resp.json[dbu.STATUS], dbu.REQUESTED)
+        resp = TEST_CLIENT.get(f'/users/{user2}/relationship/{user1}')
+        self.assertEqual(resp.json[dbu.STATUS], dbu.RECEIVED)
+
+    def test_relationship2(self):
+        """
+        Post-condition 2: friends see each other as friends and their
+        mutual friends
+        """
+        user1, user2, user3 = new_entity(), new_entity(), new_entity()
+        dbu.bef_user(user1, user2)
+        dbu.bef_user(user1, user3)
+        dbu.bef_user(user2, user3)
+        resp = TEST_CLIENT.get(f'/users/{user1}/relationship/{user2}')
+        self.assertEqual(resp.json, {dbu.STATUS: dbu.ARE_FRIENDS,
+                                     dbu.MUTUAL: [user3]})
+
+    def test_relationship3(self):
+        """
+        Post-condition 3: a user that does not exist will return a 404
+        """
+        user = new_entity()
+        resp = TEST_CLIENT.get(f'/users/{user}/relationship/{FAKE_USER}')
+        self.assertEqual(resp.status_code, 404)
+
+    def test_suggest_friends1(self):
+        """
+        Post-condition 1: a user that does not exist will return a 404
+        """
+        user = new_entity_name("user")
+        resp = TEST_CLIENT.get(f'/users/suggest_friends/{user}')
+        self.assertEqual(resp.status_code, 404)
+
+    def test_suggest_friends2(self):
+        """
+        Post-condition 2: a friend of a friend is suggested
+        """
+        user1, user2, user3 = new_entity(), new_entity(), new_entity()
+        dbu.bef_user(user1, user2)
+        dbu.bef_user(user2, user3)
+        resp = TEST_CLIENT.get(f'/users/suggest_friends/{user1}')
+        self.assertEqual([s[dbu.USERNAME] for s in resp.json], [user3])
+
+    def test_recommend_playlists1(self):
+        """
+        Post-condition 1: a user that does not exist will return a 404
+        """
+        user = new_entity_name("user")
+        resp = TEST_CLIENT.get(f'/users/recommend_playlists/{user}')
+        self.assertEqual(resp.status_code, 404)
+
+    def test_recommend_playlists2(self):
+        """
+        Post-condition 2: a user with no likes gets an empty list
+        """
+        user = new_entity()
+        resp = TEST_CLIENT.get(f'/users/recommend_playlists/{user}')
+        self.assertEqual(resp.json, [])
+
     def test_like_playlist1(self):
         """
         Post-condition1: we can like a playlist from a new user, and have the change reflected in both objects
@@ -446,6 +522,24 @@ class EndpointTestCase(TestCase):
         assrt = TEST_CLIENT.patch('/users/login/', json={"userName": user, "password": FAKE_PASSWORD})
         self.assertIn("Username not found", assrt.json['message'])
 
+    def test_logout1(self):
+        """
+        Post-condition 1: a logged out token no longer works
+        """
+        body = login()
+        TEST_CLIENT.patch('/users/logout/', json=body)
+        response = TEST_CLIENT.post("/hello", json=body)
+        self.assertEqual(response.status_code, 406)
+
+    def test_logout2(self):
+        """
+        Post-condition 2: logging out of a session that doesn't exist fails
+        """
+        body = login()
+        body[dbu.TOKEN] = "not a token"
+        response = TEST_CLIENT.patch('/users/logout/', json=body)
+        self.assertEqual(response.status_code, 404)
+
     def test_get_friends1(self):
         """
         Post-condition 1: a user that does not exist will return a wz.NotFound error
@@ -483,7 +577,8 @@ class EndpointTestCase(TestCase):
         dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
         dbu.like_playlist(user, FAKE_PLAYLIST)
         gl = ep.GetLikedPlaylists(Resource)
-        self.assertEqual([dbp.get_playlist(FAKE_PLAYLIST)], gl.get(user))
+        self.assertEqual([FAKE_PLAYLIST],
+                         [pl[dbp.PLNAME] for pl in gl.get(user)])
 
     def test_get_made1(self):
         """
@@ -500,4 +595,42 @@ class EndpointTestCase(TestCase):
         body = login()
         TEST_CLIENT.post(f'/playlists/create/{body[dbu.USERNAME]}/{FAKE_PLAYLIST}', json=body)
         gp = ep.GetOwnedPlaylists(Resource)
-        self.assertEqual([dbp.get_playlist(FAKE_PLAYLIST)], gp.get(body[dbu.USERNAME]))
+        self.assertEqual([FAKE_PLAYLIST],
+                         [pl[dbp.PLNAME] for pl in gp.get(body[dbu.USERNAME])])
+
+    def test_profile1(self):
+        """
+        Post-condition 1: a user that does not exist will return
+        a wz.NotFound error
+        """
+        user = new_entity_name('user')
+        up = ep.UserProfile(Resource)
+        self.assertRaises(wz.NotFound, up.get, user)
+
+    def test_profile2(self):
+        """
+        Post-condition 2: the profile has the sections asked for,
+        with each list limited
+        """
+        user1 = new_entity()
+        user2 = new_entity()
+        dbu.bef_user(user1, user2)
+        dbp.add_playlist(FAKE_PLAYLIST, user1)
+        dbu.create_playlist(user1, FAKE_PLAYLIST)
+        resp = TEST_CLIENT.get(f'/users/profile/{user1}?fields=user,friends')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json[dbu.PROFILE][dbu.USERNAME], user1)
+        self.assertEqual(resp.json[dbu.FRIENDS][0][dbu.USERNAME], user2)
+        self.assertNotIn(dbu.OWNED, resp.json)
+        resp = TEST_CLIENT.get(f'/users/profile/{user1}?friendsLimit=0')
+        self.assertEqual(resp.json[dbu.FRIENDS], [])
+        self.assertEqual(resp.json[dbu.TOTALS][dbu.FRIENDS], 1)
+        self.assertEqual(resp.json[dbu.OWNED][0][dbp.PLNAME], FAKE_PLAYLIST)
+
+    def test_profile3(self):
+        """
+        Post-condition 3: asking for a section that does not exist
+        is a bad request
+        """
+        resp = TEST_CLIENT.get(f'/users/profile/{FAKE_USER}?fields=passwords')
+        self.assertEqual(resp.status_code, 400)
@@ -0,0 +1,114 @@
+"""
+Measures how many likes a second one hot playlist takes: threads of
+users like and unlike the same playlist back to back through the db
+layer, and one CSV row gives likes a second and latency percentiles
+in ms. Run it from the project root against the database being
+measured, once plainly and once with WRITE_BEHIND_LIKES=1, e.g.
+`python -m bench.hot_likes --seconds 20 --threads 32`
+It makes its own users and playlist, named bench-*, and removes them.
+"""
+
+import argparse
+import random
+import statistics
+import threading
+import time
+import db.data_playlists as dbp
+import db.data_users as dbu
+import db.db_connect as dbc
+import db.like_counters as lc
+import db.like_queue as lq
+
+PLAYLIST = "bench-hot"
+USERS = 1000
+
+HEADER = "name,threads,seconds,likes,likes_per_s,p50,p95,p99,count_ok"
+
+
+def seed():
+    """
+    makes the playlist and USERS users to like it, returns their names
+    """
+    clean()
+    names = [f"bench-{i}" for i in range(USERS)]
+    dbc.insert_docs(dbu.USERS, [{dbu.USERNAME: name, "likedPlaylists": []}
+                                for name in names])
+    dbp.add_playlist(PLAYLIST, names[0])
+    return names
+
+
+def clean():
+    """
+    removes what seed() made
+    """
+    dbc.del_matching(dbu.USERS, {dbu.USERNAME: {"$regex": "^bench-"}})
+    dbc.del_matching(dbp.PLAYLISTS, {dbp.PLNAME: PLAYLIST})
+    dbc.del_matching(dbp.LIKE_ITEMS, {dbp.PLNAME: PLAYLIST})
+    lc.forget(PLAYLIST)
+
+
+def run(seconds, threads, names):
+    """
+    runs threads of back to back likes and unlikes for seconds
+    returns each one's latency
+    """
+    results = []
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def liker(mine):
+        times = []
+        while time.monotonic() < stop:
+            user = random.choice(mine)
+            for change in (dbu.like_playlist, dbu.unlike_playlist):
+                start = time.monotonic()
+                change(user, PLAYLIST)
+                times.append(time.monotonic() - start)
+        with lock:
+            results.extend(times)
+
+    workers = [threading.Thread(target=liker, args=(names[i::threads],))
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+def counted_right():
+    """
+    whether the playlist's likeCount matches its likes once written
+    and its shards folded in
+    """
+    if lq.enabled():
+        lq.flush()
+    lc.fold()
+    playlist = dbp.get_playlist_fields(PLAYLIST, [dbp.LIKE_COUNT])
+    likes = dbc.count(dbp.LIKE_ITEMS, {dbp.PLNAME: PLAYLIST})
+    return likes == playlist.get(dbp.LIKE_COUNT, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--name", default="direct")
+    parser.add_argument("--header", action="store_true")
+    args = parser.parse_args()
+    names = seed()
+    try:
+        results = run(args.seconds, args.threads, names)
+        ok = counted_right()
+    finally:
+        clean()
+    cuts = statistics.quantiles([t * 1000 for t in results], n=100)
+    if args.header:
+        print(HEADER)
+    print(f"{args.name},{args.threads},{args.seconds},{len(results)},"
+          f"{len(results) / args.seconds:.1f},{cuts[49]:.2f},"
+          f"{cuts[94]:.2f},{cuts[98]:.2f},{ok}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Drives a running API with our usual mix of requests and prints one CSV
+row: requests a second, latency percentiles in ms, and error and 503
+rates. Run it from the project root against a server started with the
+settings being measured, e.g.
+`python -m bench.mix --url http://127.0.0.1:8000 --seconds 30 --clients 64`
+It makes its own users and playlists first, named bench-*.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+
+USERS = 50
+PLAYLISTS = 20
+PASSWORD = "bench-password"
+
+# (weight, name) of each kind of request, roughly what the app sees
+MIX = [
+    (30, "get_user"),
+    (15, "songs"),
+    (15, "feed"),
+    (10, "top"),
+    (10, "trending"),
+    (8, "like"),
+    (5, "add_song"),
+    (4, "login"),
+    (3, "suggest"),
+]
+
+HEADER = "name,clients,seconds,requests,rps,p50,p95,p99,errors,shed"
+
+
+def call(url, method="GET", body=None):
+    """
+    makes one request, returns its status code
+    """
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method,
+                                 headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as err:
+        return err.code
+    except OSError:
+        return 0
+
+
+def fetch(url, method="GET", body=None):
+    """
+    makes one request and returns its decoded json
+    """
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method,
+                                 headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        return json.loads(resp.read())
+
+
+def seed(base):
+    """
+    makes the users, friendships and playlists the mix works on
+    returns the users' names and tokens, and the playlists' names
+    """
+    tokens = {}
+    for i in range(USERS):
+        name = f"bench-user-{i}"
+        call(f"{base}/users/create/", "POST",
+             {"userName": name, "password": PASSWORD})
+        tokens[name] = fetch(f"{base}/users/login/", "PATCH",
+                             {"userName": name, "password": PASSWORD})["token"]
+    names = list(tokens)
+    for i, name in enumerate(names):
+        friend = names[(i + 1) % len(names)]
+        call(f"{base}/users/{quote(name)}/req_friend/{quote(friend)}",
+             "POST")
+        call(f"{base}/users/{quote(friend)}/add_friend/{quote(name)}",
+             "POST", {"userName": friend, "token": tokens[friend]})
+    playlists = []
+    for i in range(PLAYLISTS):
+        owner = names[i % len(names)]
+        playlist = f"bench-playlist-{i}"
+        call(f"{base}/playlists/create/{quote(owner)}/{quote(playlist)}",
+             "POST", {"userName": owner, "token": tokens[owner]})
+        playlists.append((playlist, owner))
+    return tokens, playlists
+
+
+def one(base, kind, tokens, playlists):
+    """
+    makes one request of a kind with random users and playlists
+    """
+    user = random.choice(list(tokens))
+    playlist, owner = random.choice(playlists)
+    if kind == "get_user":
+        return call(f"{base}/users/get/{quote(user)}")
+    if kind == "songs":
+        return call(f"{base}/playlists/{quote(playlist)}/songs?limit=50")
+    if kind == "feed":
+        return call(f"{base}/users/{quote(user)}/feed")
+    if kind == "top":
+        return call(f"{base}/playlists/top")
+    if kind == "trending":
+        return call(f"{base}/playlists/trending")
+    if kind == "like":
+        action = random.choice(["like_playlist", "unlike_playlist"])
+        return call(f"{base}/users/{quote(user)}/{action}/{quote(playlist)}",
+                    "POST")
+    if kind == "add_song":
+        song = f"bench-song-{random.randrange(10 ** 9)}"
+        return call(f"{base}/playlists/{quote(playlist)}/add_song/"
+                    f"{quote(song)}", "POST",
+                    {"userName": owner, "token": tokens[owner]})
+    if kind == "login":
+        return call(f"{base}/users/login/", "PATCH",
+                    {"userName": user, "password": PASSWORD})
+    return call(f"{base}/users/suggest_friends/{quote(user)}")
+
+
+def run(base, seconds, clients, tokens, playlists):
+    """
+    runs clients threads of back to back requests for seconds
+    returns each request's (latency, status)
+    """
+    kinds = [kind for weight, kind in MIX for i in range(weight)]
+    results = []
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def client():
+        mine = []
+        while time.monotonic() < stop:
+            kind = random.choice(kinds)
+            start = time.monotonic()
+            status = one(base, kind, tokens, playlists)
+            mine.append((time.monotonic() - start, status))
+        with lock:
+            results.extend(mine)
+
+    threads = [threading.Thread(target=client) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def report(name, clients, seconds, results):
+    """
+    one CSV row summing up a run
+    """
+    latencies = sorted(latency * 1000 for latency, status in results)
+    cuts = statistics.quantiles(latencies, n=100)
+    errors = sum(1 for latency, status in results
+                 if status == 0 or status >= 500)
+    shed = sum(1 for latency, status in results if status == 503)
+    return (f"{name},{clients},{seconds},{len(results)},"
+            f"{len(results) / seconds:.1f},{cuts[49]:.1f},{cuts[94]:.1f},"
+            f"{cuts[98]:.1f},{errors / len(results):.4f},"
+            f"{shed / len(results):.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--seconds", type=int, default=30)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--name", default="run")
+    parser.add_argument("--header", action="store_true")
+    args = parser.parse_args()
+    tokens, playlists = seed(args.url)
+    results = run(args.url, args.seconds, args.clients, tokens, playlists)
+    if args.header:
+        print(HEADER)
+    print(report(args.name, args.clients, args.seconds, results))
+
+
+if __name__ == "__main__":
+    main()
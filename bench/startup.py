@@ -0,0 +1,84 @@
+"""
+Measures how long a fresh worker takes to get going: the slowest imports
+of API.endpoints, then the time from starting Python until the first
+request for /endpoints and /swagger.json is answered.
+It fails if that is over the budget, e.g.
+`python -m bench.startup --budget 1.0`
+No database is needed; starting up shouldn't touch it.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+IMPORT_LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)")
+
+# run in a fresh interpreter, prints the seconds each step took
+FIRST_REQUEST = """
+import time
+start = time.perf_counter()
+import API.endpoints as ep
+import db.db_connect as dbc
+imported = time.perf_counter()
+client = ep.app.test_client()
+client.get('/endpoints')
+listed = time.perf_counter()
+client.get('/swagger.json')
+done = time.perf_counter()
+print(imported - start, listed - imported, done - listed,
+      dbc.client is not None)
+"""
+
+
+def slowest_imports(count):
+    """
+    the top level modules, and the ones they import directly,
+    that took longest to import with their own imports, as (ms, name)
+    """
+    found = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                            "import API.endpoints"],
+                           capture_output=True, text=True, check=True)
+    times = []
+    for line in found.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match and len(match.group(2)) <= 3:
+            times.append((int(match.group(1)) / 1000, match.group(3)))
+    return sorted(times, reverse=True)[:count]
+
+
+def first_request():
+    """
+    seconds spent importing, listing the endpoints and building the spec
+    in a fresh interpreter, and whether a client was made along the way
+    """
+    found = subprocess.run([sys.executable, "-c", FIRST_REQUEST],
+                           capture_output=True, text=True, check=True,
+                           env={**os.environ, "TEST_MODE": "1"})
+    imported, listed, spec, connected = found.stdout.split()[-4:]
+    return float(imported), float(listed), float(spec), connected == "True"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budget", type=float, default=1.0,
+                        help="seconds allowed until the first response")
+    parser.add_argument("--imports", type=int, default=10)
+    args = parser.parse_args()
+    print("slowest imports (ms):")
+    for ms, name in slowest_imports(args.imports):
+        print(f"  {ms:8.1f}  {name}")
+    imported, listed, spec, connected = first_request()
+    total = imported + listed
+    print(f"import {imported * 1000:.0f} ms, first request "
+          f"{listed * 1000:.0f} ms, swagger spec {spec * 1000:.0f} ms")
+    if connected:
+        print("importing the app connected to mongo")
+    print(f"first response after {total:.2f} s, budget {args.budget:.2f} s")
+    if total > args.budget or connected:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+#!/bin/bash
+# Runs bench/mix.py against gunicorn for every worker class, worker count
+# and thread count below, appending one CSV row per setting to
+# bench/results.csv. Point it at a database like production's, e.g.
+#   LOCAL_MONGO=1 MONGO_UN=... MONGO_PSSWD=... bench/sweep.sh
+# then copy the best setting into gunicorn.conf.py. It needs a database
+# the mix can write to: every request goes to mongo, so without one the
+# rows only measure how fast the breaker answers 503.
+
+PORT=${PORT:-8123}
+SECONDS_PER_RUN=${SECONDS_PER_RUN:-30}
+CLIENTS=${CLIENTS:-64}
+CLASSES=${CLASSES:-"sync gthread"}
+WORKER_COUNTS=${WORKER_COUNTS:-"2 4 8"}
+THREAD_COUNTS=${THREAD_COUNTS:-"1 4 8 16"}
+OUT=${OUT:-bench/results.csv}
+
+[ -f "$OUT" ] || python -c "import bench.mix as m; print(m.HEADER)" > "$OUT"
+
+for class in $CLASSES; do
+    for workers in $WORKER_COUNTS; do
+        for threads in $THREAD_COUNTS; do
+            # threads only mean something to gthread
+            if [ "$class" != "gthread" ] && [ "$threads" != "1" ]; then
+                continue
+            fi
+            PORT=$PORT GUNICORN_WORKER_CLASS=$class WEB_CONCURRENCY=$workers \
+                GUNICORN_THREADS=$threads \
+                gunicorn -c gunicorn.conf.py API.endpoints:app \
+                > /tmp/bench-gunicorn.log 2>&1 &
+            pid=$!
+            # wait for the workers to answer before measuring them
+            for i in $(seq 30); do
+                curl -sf "http://127.0.0.1:$PORT/endpoints" > /dev/null && break
+                sleep 1
+            done
+            if ! python -m bench.mix --url "http://127.0.0.1:$PORT" \
+                    --seconds "$SECONDS_PER_RUN" --clients "$CLIENTS" \
+                    --name "$class-w$workers-t$threads" >> "$OUT"; then
+                echo "$class-w$workers-t$threads failed, see /tmp/bench-gunicorn.log" >&2
+            fi
+            kill $pid
+            wait $pid 2>/dev/null
+        done
+    done
+done
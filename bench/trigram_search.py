@@ -0,0 +1,110 @@
+"""
+Times fuzzy playlist search against catalogs of growing size and prints
+one CSV row per size: the time to load the index, query latency
+percentiles in microseconds, and the same for a full scan of the names
+for the query as a substring, which is what search used to do. Queries
+are catalog names with a typo or two, so every one has a right answer.
+Run it from the project root, no database needed:
+`python -m bench.trigram_search --sizes 10000 100000 1000000`
+"""
+
+import argparse
+import random
+import statistics
+import time
+import db.trigram_index as ti
+
+SYLLABLES = ["ba", "ki", "lo", "mu", "ne", "ra", "so", "ti", "vo", "ze",
+             "chi", "dra", "fen", "gal", "hum", "jor", "kes", "lun", "mor",
+             "nix", "pol", "quin", "rus", "sha", "tor", "ul", "vex", "wen"]
+QUERIES = 500
+
+HEADER = ("size,load_s,p50_us,p95_us,p99_us,found,"
+          "scan_p50_us,scan_p95_us")
+
+
+def word(rng):
+    """
+    a made up word of two to four syllables
+    """
+    return "".join(rng.choice(SYLLABLES) for i in range(rng.randint(2, 4)))
+
+
+def catalog(size, rng):
+    """
+    size playlist names of one to four words, from a vocabulary that
+    grows with the catalog like real ones do
+    """
+    vocab = [word(rng).title() for i in range(max(1000, size // 20))]
+    return [" ".join(rng.choice(vocab) for i in range(rng.randint(1, 4)))
+            + ("" if rng.random() < .5 else f" {i}") for i in range(size)]
+
+
+def typo(name, rng):
+    """
+    a name with one or two letters dropped, swapped or changed
+    """
+    letters = list(name)
+    for i in range(rng.randint(1, 2)):
+        spot = rng.randrange(len(letters))
+        edit = rng.choice(["drop", "swap", "change"])
+        if edit == "drop" and len(letters) > 4:
+            del letters[spot]
+        elif edit == "swap" and spot + 1 < len(letters):
+            letters[spot], letters[spot + 1] = letters[spot + 1], \
+                letters[spot]
+        else:
+            letters[spot] = rng.choice("aeiourstln")
+    return "".join(letters)
+
+
+def percentiles(times):
+    """
+    p50, p95 and p99 of times in seconds, in microseconds
+    """
+    cuts = statistics.quantiles(times, n=100)
+    return cuts[49] * 1e6, cuts[94] * 1e6, cuts[98] * 1e6
+
+
+def run(size, seed):
+    """
+    one CSV row for a catalog of size
+    """
+    rng = random.Random(seed)
+    names = catalog(size, rng)
+    start = time.perf_counter()
+    ti.load(names)
+    loaded = time.perf_counter() - start
+    targets = rng.sample(names, QUERIES)
+    queries = [typo(name, rng) for name in targets]
+    times = []
+    found = 0
+    for target, query in zip(targets, queries):
+        start = time.perf_counter()
+        ret = ti.search(query, 10)
+        times.append(time.perf_counter() - start)
+        found += target in [name for name, score in ret]
+    scans = []
+    for query in queries[:max(20, QUERIES * 10000 // size)]:
+        start = time.perf_counter()
+        [name for name in names if query in name]
+        scans.append(time.perf_counter() - start)
+    p50, p95, p99 = percentiles(times)
+    scan50, scan95, scan99 = percentiles(scans)
+    return (f"{size},{loaded:.2f},{p50:.0f},{p95:.0f},{p99:.0f},"
+            f"{found / QUERIES:.3f},{scan50:.0f},{scan95:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10000, 100000, 1000000])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print(HEADER, flush=True)
+    for size in args.sizes:
+        print(run(size, args.seed), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+One-off job that fills in the like/friend/song counters
+for documents that were created before the counters existed.
+Run it from the project root with `python -m db.backfill_counts`
+"""
+
+import db.db_connect as dbc
+import db.data_playlists as dbp
+import db.data_users as dbu
+import db.like_counters as lc
+
+BATCH = 1000
+
+
+def size_of(field):
+    """
+    aggregation expression for the length of an array field
+    treating a missing field as an empty array
+    """
+    return {"$size": {"$ifNull": [f"${field}", []]}}
+
+
+def counts_of(collect_nm):
+    """
+    counts the docs stored for every playlist that has any in a
+    collection of one doc per song or like
+    """
+    grouped = dbc.aggregate(collect_nm, [
+        {"$group": {"_id": f"${dbp.PLNAME}", "n": {"$sum": 1}}}])
+    return {group["_id"]: group["n"] for group in grouped}
+
+
+def backfill_from(collect_nm, counter):
+    """
+    corrects every playlist's counter that doesn't match its docs
+    in a collection, returns how many playlists were touched
+    """
+    counts = counts_of(collect_nm)
+    fixed = 0
+    batch = []
+    for pl in dbc.fetch_iter(dbp.PLAYLISTS, {},
+                             {dbp.PLNAME: 1, counter: 1, "_id": 0}):
+        n_docs = counts.get(pl[dbp.PLNAME], 0)
+        if pl.get(counter) != n_docs:
+            batch.append({dbp.PLNAME: pl[dbp.PLNAME], counter: n_docs})
+        if len(batch) == BATCH:
+            dbc.set_each(dbp.PLAYLISTS, dbp.PLNAME, batch)
+            fixed += len(batch)
+            batch = []
+    dbc.set_each(dbp.PLAYLISTS, dbp.PLNAME, batch)
+    return fixed + len(batch)
+
+
+def backfill():
+    """
+    recomputes every counter from what it summarizes
+    like counts are recounted whole, so their shards are folded in,
+    for their trend scores, and dropped first
+    returns how many friend, like and song counts were corrected
+    """
+    users = dbc.update_many(dbu.USERS, {}, [
+        {"$set": {dbu.FRIEND_COUNT: size_of(dbu.FRIENDS)}}])
+    lc.fold()
+    lc.reset()
+    likes = backfill_from(dbp.LIKE_ITEMS, dbp.LIKE_COUNT)
+    return (users.modified_count, likes,
+            backfill_from(dbp.SONG_ITEMS, dbp.SONG_COUNT))
+
+
+if __name__ == "__main__":
+    friends, likes, songs = backfill()
+    print(f"Corrected {friends} friend counts, {likes} like counts"
+          f" and {songs} song counts")
@@ -0,0 +1,178 @@
+"""
+This file streams whole collections to and from NDJSON, one doc per line
+in MongoDB extended JSON, for backups, migrations and seeding staging.
+Exports walk a cursor and imports send unordered insert_many batches from
+a few threads, so memory stays bounded however big the collection is.
+Docs keep their _id, so importing a file twice inserts each doc once.
+Files ending in .gz are compressed. Run it from the project root:
+`python -m db.bulk_io export users users.ndjson.gz`
+`python -m db.bulk_io import users users.ndjson.gz --batch 1000 --workers 4`
+"""
+
+import argparse
+import gzip
+import json
+import sys
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import bson.json_util as bsutil
+import db.db_connect as dbc
+import db.data_playlists as dbp
+import db.data_users as dbu
+
+# the collections that can be moved, songs and likes being part of
+# their playlists
+COLLECTIONS = (dbu.USERS, dbp.PLAYLISTS, dbp.SONG_ITEMS, dbp.LIKE_ITEMS)
+
+BATCH = 1000
+WORKERS = 4
+# seconds between progress reports
+REPORT_EVERY = 5.0
+# gzip header and trailer for zlib
+GZIP_WBITS = 31
+
+
+def lines(collect_nm):
+    """
+    yields every doc of a collection as one line of NDJSON
+    """
+    if collect_nm not in COLLECTIONS:
+        raise ValueError(f"{collect_nm} can't be exported")
+    for doc in dbc.fetch_iter(collect_nm):
+        yield json.dumps(doc) + "\n"
+
+
+def gzipped(chunks):
+    """
+    gzips a stream of text as it goes
+    """
+    packer = zlib.compressobj(wbits=GZIP_WBITS)
+    for chunk in chunks:
+        packed = packer.compress(chunk.encode())
+        if packed:
+            yield packed
+    yield packer.flush()
+
+
+def open_file(path, mode):
+    """
+    opens a text file, or stdin/stdout for '-', gzipped if it ends in .gz
+    """
+    if path == "-":
+        return sys.stdout if mode == "w" else sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t")
+    return open(path, mode)
+
+
+def export(collect_nm, out):
+    """
+    writes a collection to an open file, returns how many docs it wrote
+    """
+    written = 0
+    for line in lines(collect_nm):
+        out.write(line)
+        written += 1
+    return written
+
+
+def batches(source, size):
+    """
+    groups the docs of NDJSON lines into lists of size
+    """
+    batch = []
+    for line in source:
+        if line.strip():
+            batch.append(bsutil.loads(line))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert_batches(collect_nm, docs, workers=WORKERS, progress=None):
+    """
+    inserts batches of docs into a collection unordered from a few
+    threads, skipping docs that are already there
+    at most two batches per thread are held in memory at once
+    progress(read, inserted, seconds) is called after every batch
+    returns how many docs were read and how many were inserted
+    """
+    start = time.monotonic()
+    read = inserted = 0
+    running = set()
+
+    def finish(done):
+        nonlocal inserted
+        for future in done:
+            inserted += future.result()
+            running.remove(future)
+            if progress is not None:
+                progress(read, inserted, time.monotonic() - start)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch in docs:
+            if len(running) >= 2 * workers:
+                finish(wait(running, return_when=FIRST_COMPLETED).done)
+            read += len(batch)
+            running.add(pool.submit(dbc.insert_docs, collect_nm, batch))
+        finish(wait(running).done)
+    return read, inserted
+
+
+def import_docs(collect_nm, source, batch=BATCH, workers=WORKERS,
+                progress=None):
+    """
+    inserts the docs of NDJSON lines into a collection
+    with insert_batches, returns how many were read and inserted
+    """
+    if collect_nm not in COLLECTIONS:
+        raise ValueError(f"{collect_nm} can't be imported")
+    return insert_batches(collect_nm, batches(source, batch), workers,
+                          progress)
+
+
+def reporter(collect_nm, every=REPORT_EVERY):
+    """
+    a progress callback that prints throughput at most every few seconds
+    """
+    last = -every
+
+    def report(read, inserted, seconds):
+        nonlocal last
+        if seconds - last >= every:
+            last = seconds
+            print(f"{collect_nm}: {read} read, {inserted} inserted, "
+                  f"{inserted / max(seconds, 1e-9):.0f} docs/s",
+                  file=sys.stderr)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("collection", choices=COLLECTIONS)
+    parser.add_argument("path", help="NDJSON file, .gz to compress, - for "
+                        "stdin/stdout")
+    parser.add_argument("--batch", type=int, default=BATCH)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+    start = time.monotonic()
+    if args.action == "export":
+        with open_file(args.path, "w") as out:
+            done = export(args.collection, out)
+        verb = "Exported"
+    else:
+        with open_file(args.path, "r") as source:
+            read, done = import_docs(args.collection, source, args.batch,
+                                     args.workers, reporter(args.collection))
+        verb = f"Read {read} and imported"
+    seconds = time.monotonic() - start
+    print(f"{verb} {done} {args.collection} in {seconds:.1f} s "
+          f"({done / max(seconds, 1e-9):.0f} docs/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
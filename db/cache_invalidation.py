@@ -0,0 +1,252 @@
+"""
+This file keeps the in-process caches of every worker in step with the
+database. A background thread follows a change stream on the collections
+that caches registered for, and hands each change to those caches.
+Deletes are passed on one doc at a time, named from the doc's pre-image,
+which start() turns on for the watched collections (MongoDB 6.0 and up).
+A change a cache couldn't apply because the database was down is tried
+again a little later; one it failed on for any other reason resets that
+cache, so a bad change is passed over rather than redelivered forever.
+The resume token of the last change seen is kept, so after a dropped
+connection the stream picks up where it left off; if the server no
+longer has that history, every cache is reset instead.
+Change streams need a replica set; a single local node is enough
+(`make replset`). Set WATCH_CHANGES=1 to run the listener in the API.
+"""
+
+import threading
+from collections import defaultdict
+from pymongo.errors import OperationFailure, PyMongoError
+import db.db_connect as dbc
+
+NAMES = {"users": "userName", "playlists": "playlistName"}
+FIELDS = "fields"
+BEFORE = "fullDocumentBeforeChange"
+# what handlers get as fields for a deleted doc
+DELETED = "deleted"
+# changes kept for another try before the cache is reset instead
+MAX_FAILED = 10000
+
+# the server can't resume from the token given
+HISTORY_LOST = 286
+INVALID_TOKEN = 260
+
+BACKOFF = 1
+MAX_BACKOFF = 30
+
+handlers = defaultdict(list)
+# (handler, name, fields) of changes to try again
+failed = []
+resume_token = None
+thread = None
+stopping = threading.Event()
+rebuilding = set()
+rebuild_lock = threading.Lock()
+
+
+def register(collect_nm, handler):
+    """
+    calls handler(name, fields) for every change to collect_nm
+    name is the key of the changed doc, fields the top level fields
+    an update touched, None for inserts and replaces and DELETED for
+    deletes; name is None when it isn't known, as for a delete without
+    a pre-image, so handler(None, None) means anything may have changed
+    """
+    handlers[collect_nm].append(handler)
+
+
+def in_background(build):
+    """
+    runs build in a thread of its own unless it is already running,
+    so a cache is rebuilt while the old one keeps serving requests
+    rather than inside whichever request comes next
+    """
+    with rebuild_lock:
+        if build in rebuilding:
+            return
+        rebuilding.add(build)
+
+    def run_build():
+        try:
+            build()
+        except (PyMongoError, dbc.DatabaseUnavailable) as err:
+            print(f"Could not rebuild a cache: {err}")
+        finally:
+            with rebuild_lock:
+                rebuilding.discard(build)
+
+    threading.Thread(target=run_build, name="cache-rebuild",
+                     daemon=True).start()
+
+
+def pipeline():
+    """
+    trims each change to its collection, the changed doc's key
+    and the names of the updated fields
+    """
+    touched = {"$concatArrays": [
+        {"$map": {"input": {"$objectToArray": {
+            "$ifNull": ["$updateDescription.updatedFields", {}]}},
+            "in": "$$this.k"}},
+        {"$ifNull": ["$updateDescription.removedFields", []]}]}
+    keep = {"operationType": 1, "ns": 1, FIELDS: 1}
+    for name in NAMES.values():
+        keep[f"fullDocument.{name}"] = 1
+        keep[f"{BEFORE}.{name}"] = 1
+    return [{"$set": {FIELDS: touched}}, {"$project": keep}]
+
+
+def dispatch(change):
+    """
+    hands one change to the handlers of its collection
+    a handler that can't reach the database gets it again later
+    """
+    collect_nm = change["ns"]["coll"]
+    fields = None
+    if change["operationType"] == "update":
+        fields = {field.split(".")[0] for field in change.get(FIELDS, [])}
+    if change["operationType"] == "delete":
+        doc = change.get(BEFORE) or {}
+        fields = DELETED
+    else:
+        doc = change.get("fullDocument") or {}
+    name = doc.get(NAMES[collect_nm]) if collect_nm in NAMES else None
+    if name is None:
+        fields = None
+    for handler in handlers[collect_nm]:
+        apply(handler, name, fields)
+
+
+def apply(handler, name, fields):
+    """
+    hands a change to one handler, keeping it for later if the handler
+    can't reach the database; past MAX_FAILED the handler is reset
+    """
+    try:
+        handler(name, fields)
+    except dbc.DatabaseUnavailable:
+        if len(failed) < MAX_FAILED:
+            failed.append((handler, name, fields))
+        else:
+            reset(handler)
+    except Exception as err:
+        print(f"A cache failed on a change to {name}, resetting it: {err}")
+        reset(handler)
+
+
+def reset(handler):
+    """
+    tells one cache that anything may have changed
+    """
+    try:
+        handler(None, None)
+    except Exception as err:
+        print(f"Could not reset a cache: {err}")
+
+
+def retry_failed():
+    """
+    hands the changes that failed before to their handlers again
+    """
+    again = list(failed)
+    failed.clear()
+    for handler, name, fields in again:
+        apply(handler, name, fields)
+
+
+def reset_all():
+    """
+    tells every cache that anything may have changed
+    """
+    failed.clear()
+    for collect_nm in list(handlers):
+        for handler in handlers[collect_nm]:
+            reset(handler)
+
+
+def follow():
+    """
+    hands changes out until stopped, keeping the resume token current
+    """
+    global resume_token
+    with dbc.watch(list(handlers), pipeline(), resume_token) as stream:
+        while stream.alive and not stopping.is_set():
+            change = stream.try_next()
+            if change is not None:
+                try:
+                    dispatch(change)
+                except Exception as err:
+                    print(f"Skipped a change the caches couldn't read: "
+                          f"{err}")
+            elif failed:
+                retry_failed()
+            resume_token = stream.resume_token
+
+
+def run():
+    """
+    turns on pre-images, then follows the change stream, reconnecting
+    with backoff when it drops or anything else goes wrong
+    all of it happens in this thread, so starting the listener neither
+    connects nor fails when the database is down
+    """
+    global resume_token
+    delay = BACKOFF
+    prepared = False
+    while not stopping.is_set():
+        seen = resume_token
+        try:
+            if not prepared:
+                keep_pre_images()
+                prepared = True
+            follow()
+        except OperationFailure as err:
+            if err.code in (HISTORY_LOST, INVALID_TOKEN):
+                resume_token = None
+                reset_all()
+                continue
+            print(f"Change stream failed: {err}")
+        except (PyMongoError, dbc.DatabaseUnavailable) as err:
+            print(f"Change stream failed: {err}")
+        except Exception as err:
+            print(f"Change stream listener failed: {err!r}")
+        if resume_token != seen:
+            delay = BACKOFF
+        stopping.wait(delay)
+        delay = min(delay * 2, MAX_BACKOFF)
+
+
+def keep_pre_images():
+    """
+    has the server keep each doc's last version with its delete,
+    so deletes can be told apart without resetting the caches
+    without it, as on servers before 6.0, a delete resets them
+    errors other than the server refusing are raised, to try again
+    """
+    for collect_nm in NAMES:
+        try:
+            dbc.keep_pre_images(collect_nm)
+        except OperationFailure as err:
+            print(f"Deletes from {collect_nm} will reset caches: {err}")
+
+
+def start():
+    """
+    starts the listener thread unless it is already running
+    """
+    global thread
+    if thread is not None and thread.is_alive():
+        return
+    stopping.clear()
+    thread = threading.Thread(target=run, name="cache-invalidation",
+                              daemon=True)
+    thread.start()
+
+
+def stop():
+    """
+    stops the listener thread
+    """
+    stopping.set()
+    if thread is not None:
+        thread.join()
@@ -0,0 +1,79 @@
+"""
+This file stores the first response to requests sent with an
+Idempotency-Key, so a client retrying the same request gets that
+response back from one indexed read instead of running it again.
+Responses are kept for a day; mongo deletes them once they expire.
+"""
+
+import datetime
+import time
+import db.db_connect as dbc
+
+KEYS = "idempotencyKeys"
+KEY = "key"
+FINGERPRINT = "fingerprint"
+DONE = "done"
+STARTED = "started"
+STATUS = "status"
+BODY = "body"
+EXP = "exp"
+
+KEEP = datetime.timedelta(days=1)
+# a request still running after this long is assumed to have died
+PENDING = 60
+
+
+def ensure_indexes():
+    """
+    keys are unique and expire at their exp time
+    """
+    dbc.ensure_index(KEYS, [(KEY, 1)], unique=True)
+    dbc.ensure_index(KEYS, [(EXP, 1)], expireAfterSeconds=0)
+
+
+def claim(key, fingerprint):
+    """
+    marks a key as running, returns None if the caller should run it
+    else the stored doc: done with its status and body, or still running
+    """
+    ensure_indexes()
+    stored = dbc.fetch_one(KEYS, {KEY: key}, {"_id": 0, EXP: 0})
+    now = time.time()
+    if stored is None:
+        if dbc.insert_new(KEYS, {KEY: key, FINGERPRINT: fingerprint,
+                                 DONE: False, STARTED: now,
+                                 EXP: datetime.datetime.utcnow() + KEEP}):
+            return None
+        return dbc.fetch_one(KEYS, {KEY: key}, {"_id": 0, EXP: 0})
+    if not stored[DONE] and now - stored[STARTED] > PENDING:
+        taken = dbc.update_doc(KEYS, {KEY: key, DONE: False,
+                                      STARTED: stored[STARTED]},
+                               {"$set": {STARTED: now,
+                                         FINGERPRINT: fingerprint}})
+        if taken.modified_count:
+            return None
+    return stored
+
+
+def save(key, status, body):
+    """
+    stores the response to replay for a key
+    """
+    dbc.update_doc(KEYS, {KEY: key},
+                   {"$set": {DONE: True, STATUS: status, BODY: body,
+                             EXP: datetime.datetime.utcnow() + KEEP}})
+
+
+def forget(key):
+    """
+    drops a key whose request failed, so it can be tried again
+    """
+    dbc.del_one(KEYS, {KEY: key})
+
+
+def empty():
+    """
+    empty out the stored responses
+    ONLY IF IN TEST_MODE
+    """
+    dbc.del_many(KEYS)
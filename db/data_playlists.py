@@ -4,29 +4,69 @@ At first, it will just contain stubs that return fake data.
 Gradually, we will fill in actual calls to our datastore.
 Only for playlist related database calls
 """
+import threading
+import time
 import db.db_connect as dbc
+import db.feed as feed
+import db.like_counters as lc
+import db.trigram_index as ti
 
 PLAYLISTS = "playlists"
 USERS = "users"
+SONG_ITEMS = "playlistSongs"
+LIKE_ITEMS = "playlistLikes"
 
 PLNAME = "playlistName"
 USERNAME = "userName"
+OWNER = "owner"
 
-client = dbc.get_client()
-if client is None:
-    print("FAILED TO CONNECT TO MONGODB")
-    exit(1)
+LIKES = "likes"
+SONGS = "songs"
+LIKE_COUNT = "likeCount"
+SONG_COUNT = "songCount"
+SONG_SEQ = "songSeq"
+SONG = "song"
+POS = "pos"
+REBALANCE = "needsRebalance"
+TREND_SCORE = "trendScore"
+RECENT_LIKES = "recentLikes"
+SCORE = "score"
+SUMMARY = {LIKES: 0, SONGS: 0}
+ITEM = {SONG: 1, POS: 1, "_id": 0}
+LIKER = {USERNAME: 1, "_id": 0}
+# songs and likes attached to a playlist fetched whole
+PREVIEW_SONGS = 100
+PREVIEW_LIKES = 100
+
+# trend scores are log2 of a sum of likes, each worth 2 ** (half-lives
+# between TREND_EPOCH and the like), so newer likes weigh more and
+# sorting by the stored score ranks by time-decayed likes
+TREND_EPOCH = 1609459200
+HALF_LIFE = 24 * 60 * 60
+
+# moving songs halves the gap between positions, once a gap gets this
+# small the playlist's positions are renumbered in the background
+MIN_GAP = 1e-6
+# a move whose neighbours changed before it landed is worked out again
+REORDER_RETRIES = 5
+reorder_lock = threading.RLock()
+rebalancing = set()
 
 OK = 0
 NOT_FOUND = 1
 DUPLICATE = 2
+NOT_IN_PLAYLIST = 3
 
 
-def get_playlists():
+def get_playlists(counts=False):
     """
     returns all playlists
+    if counts is set, the likes and songs arrays are left out
+    and only their counters are returned
     """
-    return dbc.fetch_all(PLAYLISTS, PLNAME)
+    if counts:
+        return lc.live_counts(dbc.fetch_all(PLAYLISTS, PLNAME, SUMMARY))
+    return lc.live_counts(dbc.fetch_all(PLAYLISTS, PLNAME))
 
 
 def get_playlists_dict():
@@ -36,22 +76,82 @@ def get_playlists_dict():
     return dbc.fetch_all_dict(PLAYLISTS, PLNAME)
 
 
+def get_playlists_named(playlist_names):
+    """
+    returns the playlists with the names, in their order, with one query
+    the likes and songs arrays are left out for their counters
+    """
+    return lc.live_counts(dbc.fetch_in(PLAYLISTS, PLNAME, playlist_names,
+                                       SUMMARY))
+
+
+def search_playlists(query, limit):
+    """
+    returns up to limit playlists whose names are most like query,
+    best first, each with its match score, typos and all
+    """
+    found = ti.search(query, limit)
+    if not found:
+        return []
+    docs = {pl[PLNAME]: pl for pl in dbc.fetch_many(
+        PLAYLISTS, {PLNAME: {"$in": [name for name, score in found]}})}
+    ret = []
+    for name, score in found:
+        if name in docs:
+            docs[name][SCORE] = score
+            ret.append(docs[name])
+    return lc.live_counts(ret)
+
+
 def playlist_exists(playlist_name):
     """
     return true/false whether or not playlist exists
     """
-    rec = dbc.fetch_one(PLAYLISTS, filters={PLNAME: playlist_name})
+    rec = dbc.fetch_one(PLAYLISTS, {PLNAME: playlist_name}, {"_id": 1})
     return rec is not None
 
 
-def get_playlist(playlist_name):
+def get_playlist(playlist_name, songs=PREVIEW_SONGS, likes=PREVIEW_LIKES):
     """
     returns a playlist given its name, else NOT_FOUND
+    its first songs, up to songs of them, are attached in order as the
+    songs list; songCount says how many there are and get_songs pages
+    through the rest
+    the first users to like it, up to likes of them, are attached the
+    same way as the likes list, with likeCount and get_likes for the rest
     """
-    if playlist_exists(playlist_name):
-        return dbc.fetch_one(PLAYLISTS, filters={PLNAME: playlist_name})
-    else:
+    playlist = dbc.fetch_one(PLAYLISTS, filters={PLNAME: playlist_name})
+    if playlist is None:
         return NOT_FOUND
+    playlist[SONGS] = [item[SONG] for item in
+                       get_songs(playlist_name, limit=songs)] if songs else []
+    playlist[LIKES] = [like[USERNAME] for like in
+                       get_likes(playlist_name, limit=likes)] if likes else []
+    return lc.live_counts([playlist])[0]
+
+
+def get_playlist_fields(playlist_name, fields):
+    """
+    returns only the named fields of a playlist, else NOT_FOUND
+    one indexed read that never touches its songs, for the checks
+    that only need its counters or owner
+    """
+    projection = {field: 1 for field in fields}
+    projection.update({PLNAME: 1, "_id": 0})
+    playlist = dbc.fetch_one(PLAYLISTS, {PLNAME: playlist_name}, projection)
+    return NOT_FOUND if playlist is None else playlist
+
+
+def liked_by(playlist_name, username):
+    """
+    whether a user likes a playlist, None if it doesn't exist
+    an indexed lookup of the pair's like doc
+    """
+    ensure_like_indexes()
+    if dbc.fetch_one(LIKE_ITEMS, {PLNAME: playlist_name, USERNAME: username},
+                     {"_id": 1}) is not None:
+        return True
+    return False if playlist_exists(playlist_name) else None
 
 
 def add_playlist(playlist_name, username):
@@ -62,10 +162,12 @@ def add_playlist(playlist_name, username):
         return DUPLICATE
     else:
         dbc.insert_doc(PLAYLISTS, {PLNAME: playlist_name,
-                                   "likes": [],
-                                   "songs": [],
-                                   'owner': username
+                                   LIKE_COUNT: 0,
+                                   SONG_COUNT: 0,
+                                   SONG_SEQ: 0,
+                                   OWNER: username
                                    })
+        ti.add(playlist_name)
         return OK
 
 
@@ -85,23 +187,351 @@ def del_playlist(playlist_name):
     """
     if playlist_exists(playlist_name):
         dbc.del_one(PLAYLISTS, filters={PLNAME: playlist_name})
+        dbc.del_matching(SONG_ITEMS, {PLNAME: playlist_name})
+        dbc.del_matching(LIKE_ITEMS, {PLNAME: playlist_name})
+        lc.forget(playlist_name)
+        ti.remove(playlist_name)
         return OK
     else:
         return NOT_FOUND
 
 
-def add_song(pl_name, song_name):
+def ensure_song_indexes():
+    """
+    songs are unique within a playlist and read in position order
+    """
+    dbc.ensure_index(SONG_ITEMS, [(PLNAME, 1), (SONG, 1)], unique=True)
+    dbc.ensure_index(SONG_ITEMS, [(PLNAME, 1), (POS, 1)])
+
+
+def get_songs(pl_name, offset=0, limit=0, after=None):
     """
-    add a song to a playlist's song list
+    returns a page of a playlist's songs in order, each with its position
+    after skips straight to the songs past a position,
+    which stays fast however deep into the playlist it is
     """
-    update_playlist(pl_name, {"$push": {"songs": song_name}})
+    ensure_song_indexes()
+    filters = {PLNAME: pl_name}
+    if after is not None:
+        filters[POS] = {"$gt": after}
+    return dbc.fetch_many(SONG_ITEMS, filters, ITEM, sort=[(POS, 1)],
+                          limit=limit, skip=offset)
+
+
+def add_song(pl_name, song_name, username=None):
+    """
+    add a song to the end of a playlist
+    the user who added it, if given, gets the event in their friends' feeds
+    returns OK, DUPLICATE if the song is already there
+    or NOT_FOUND if the playlist doesn't exist
+    """
+    ensure_song_indexes()
+    playlist = dbc.update_and_fetch(PLAYLISTS, {PLNAME: pl_name},
+                                    {"$inc": {SONG_SEQ: 1}}, {SONG_SEQ: 1})
+    if playlist is None:
+        return NOT_FOUND
+    # the count moves only once the song is in, a failed insert just
+    # leaves a gap in the positions
+    if not dbc.insert_new(SONG_ITEMS, {PLNAME: pl_name, SONG: song_name,
+                                       POS: float(playlist[SONG_SEQ])}):
+        return DUPLICATE
+    dbc.update_doc(PLAYLISTS, {PLNAME: pl_name}, {"$inc": {SONG_COUNT: 1}})
+    if username:
+        feed.record(username, feed.ADDED_SONG, pl_name, song_name)
+    return OK
 
 
 def rem_song(pl_name, song_name):
     """
-    remove a song from a playlist's song list
+    remove a song from a playlist
+    returns OK, NOT_IN_PLAYLIST if the song isn't there
+    or NOT_FOUND if the playlist doesn't exist
+    """
+    ret = dbc.del_one(SONG_ITEMS, {PLNAME: pl_name, SONG: song_name})
+    if ret.deleted_count:
+        dbc.update_doc(PLAYLISTS, {PLNAME: pl_name},
+                       {"$inc": {SONG_COUNT: -1}})
+        return OK
+    return missing(pl_name)
+
+
+def missing(pl_name):
+    """
+    why a song wasn't found: NOT_IN_PLAYLIST or NOT_FOUND for the playlist
+    """
+    return NOT_IN_PLAYLIST if playlist_exists(pl_name) else NOT_FOUND
+
+
+def get_item(pl_name, song_name):
+    """
+    returns a song in a playlist with its position, else None
+    """
+    return dbc.fetch_one(SONG_ITEMS, {PLNAME: pl_name, SONG: song_name},
+                         ITEM)
+
+
+def item_before(pl_name, pos, skip=None):
+    """
+    returns the song just before a position other than skip, else None
+    """
+    prev = dbc.fetch_many(SONG_ITEMS, {PLNAME: pl_name, POS: {"$lt": pos},
+                                       SONG: {"$ne": skip}},
+                          ITEM, sort=[(POS, -1)], limit=1)
+    return prev[0] if prev else None
+
+
+def move_song(pl_name, song_name, before=None):
+    """
+    moves a song to just before another song, or to the end
+    only the moved song's position is rewritten
+    returns OK, NOT_IN_PLAYLIST if either song isn't there
+    or NOT_FOUND if the playlist doesn't exist
+    """
+    ensure_song_indexes()
+    with reorder_lock:
+        return reorder(pl_name, song_name, before)
+
+
+def reorder(pl_name, song_name, before):
+    """
+    works out and writes a moved song's new position
+    a move between two songs only stands if the playlist's songSeq, which
+    every add, move and rebalance bumps, is what it was when the
+    neighbours were read, else it is worked out again from fresh ones
+    """
+    for attempt in range(REORDER_RETRIES):
+        playlist = dbc.fetch_one(PLAYLISTS, {PLNAME: pl_name}, {SONG_SEQ: 1})
+        item = get_item(pl_name, song_name)
+        if playlist is None or item is None:
+            return missing(pl_name)
+        if before is None:
+            playlist = dbc.update_and_fetch(PLAYLISTS, {PLNAME: pl_name},
+                                            {"$inc": {SONG_SEQ: 1}},
+                                            {SONG_SEQ: 1})
+            dbc.update_doc(SONG_ITEMS, {PLNAME: pl_name, SONG: song_name},
+                           {"$set": {POS: float(playlist[SONG_SEQ])}})
+            return OK
+        target = get_item(pl_name, before)
+        if target is None:
+            return missing(pl_name)
+        prev = item_before(pl_name, target[POS], song_name)
+        low = prev[POS] if prev else target[POS] - 1
+        if before == song_name or low < item[POS] < target[POS]:
+            return OK
+        pos = (low + target[POS]) / 2
+        if not low < pos < target[POS]:
+            rebalance(pl_name)
+            continue
+        if target[POS] - low < MIN_GAP:
+            schedule_rebalance(pl_name)
+        dbc.update_doc(SONG_ITEMS, {PLNAME: pl_name, SONG: song_name},
+                       {"$set": {POS: pos}})
+        if dbc.update_doc(PLAYLISTS, {PLNAME: pl_name,
+                                      SONG_SEQ: playlist[SONG_SEQ]},
+                          {"$inc": {SONG_SEQ: 1}}).modified_count:
+            return OK
+    return OK
+
+
+def rebalance(pl_name):
+    """
+    renumbers a playlist's positions 1, 2, 3... keeping their order
+    a song moved meanwhile by another process keeps the position
+    it was moved to
+    """
+    with reorder_lock:
+        items = dbc.fetch_many(SONG_ITEMS, {PLNAME: pl_name}, ITEM,
+                               sort=[(POS, 1)])
+        dbc.update_each(SONG_ITEMS, [
+            ({PLNAME: pl_name, SONG: item[SONG], POS: item[POS]},
+             {"$set": {POS: float(i)}})
+            for i, item in enumerate(items, 1) if item[POS] != i])
+        dbc.update_doc(PLAYLISTS, {PLNAME: pl_name},
+                       {"$unset": {REBALANCE: ""}, "$inc": {SONG_SEQ: 1}})
+
+
+def schedule_rebalance(pl_name):
+    """
+    flags a playlist for renumbering and renumbers it in the background
+    anything left flagged is picked up by `python -m db.rebalance_songs`
+    """
+    dbc.update_doc(PLAYLISTS, {PLNAME: pl_name}, {"$set": {REBALANCE: True}})
+    with reorder_lock:
+        if pl_name in rebalancing:
+            return
+        rebalancing.add(pl_name)
+    threading.Thread(target=rebalance_once, args=(pl_name,),
+                     daemon=True).start()
+
+
+def rebalance_once(pl_name):
+    """
+    runs one scheduled rebalance, so a playlist only has one at a time
+    """
+    try:
+        rebalance(pl_name)
+    finally:
+        with reorder_lock:
+            rebalancing.discard(pl_name)
+
+
+def ensure_like_indexes():
+    """
+    a user likes a playlist once, and its likes are read in the order
+    they came
+    """
+    dbc.ensure_index(LIKE_ITEMS, [(PLNAME, 1), (USERNAME, 1)], unique=True)
+    dbc.ensure_index(LIKE_ITEMS, [(PLNAME, 1), ("_id", 1)])
+
+
+def get_likes(pl_name, offset=0, limit=0):
+    """
+    returns a page of the users who like a playlist, oldest like first
+    """
+    ensure_like_indexes()
+    return dbc.fetch_many(LIKE_ITEMS, {PLNAME: pl_name}, LIKER,
+                          sort=[("_id", 1)], limit=limit, skip=offset)
+
+
+def add_like(pl_name, username):
+    """
+    stores a user's like of a playlist as its own doc, then counts it
+    returns whether it is new, so False if the user already liked it
+    or the playlist doesn't exist
+    """
+    ensure_like_indexes()
+    like = {PLNAME: pl_name, USERNAME: username}
+    if not dbc.insert_new(LIKE_ITEMS, like):
+        return False
+    if count_likes(pl_name, 1):
+        return True
+    dbc.del_matching(LIKE_ITEMS, like)
+    return False
+
+
+def remove_likes(pl_name, usernames):
+    """
+    deletes users' likes of a playlist and takes them off its counts
+    returns how many of them liked it
+    """
+    removed = dbc.del_matching(LIKE_ITEMS, {
+        PLNAME: pl_name, USERNAME: {"$in": list(usernames)}}).deleted_count
+    if removed:
+        count_likes(pl_name, 0, removed)
+    return removed
+
+
+def count_likes(pl_name, added, removed=0):
+    """
+    adds likes to and takes unlikes off a playlist's likeCount and trend
+    score, returns whether the playlist exists
+    likes of a sharded playlist go to a shard instead of its doc
+    """
+    shard = lc.shard_for(pl_name) if added and not removed else None
+    if shard is not None:
+        lc.add(pl_name, shard, trend_added(added))
+        return True
+    playlist = dbc.update_and_fetch(PLAYLISTS, {PLNAME: pl_name},
+                                    count_update(added, removed),
+                                    {lc.SHARDS: 1})
+    if added:
+        lc.counted(pl_name, playlist)
+    return playlist is not None
+
+
+def trend_now():
+    """
+    the current time in half-lives since the trend epoch
+    """
+    return (time.time() - TREND_EPOCH) / HALF_LIFE
+
+
+def trend_added(added):
+    """
+    aggregation expression that adds added likes made right now to a
+    playlist's trend score, added being a number or an expression
+    """
+    score = {"$ifNull": [f"${TREND_SCORE}", None]}
+    x = {"$add": [trend_now(), {"$log": [{"$max": [added, 1]}, 2]}]}
+    return {"$cond": [{"$lte": [added, 0]}, score, lc.log_sum(score, x)]}
+
+
+def trend_removed(removed, count):
+    """
+    aggregation expression that takes removed of a playlist's count
+    likes out of its trend score, both numbers or expressions
+    the time of a removed like isn't kept, so each unlike takes off the
+    average weight of the playlist's likes, and the score goes once no
+    likes are left
+    """
+    score = {"$ifNull": [f"${TREND_SCORE}", None]}
+    left = {"$subtract": [count, removed]}
+    return {"$cond": [
+        {"$lte": [removed, 0]},
+        score,
+        {"$cond": [
+            {"$or": [{"$lte": [left, 0]}, {"$eq": [score, None]}]},
+            None,
+            {"$add": [score, {"$log": [{"$divide": [left, count]}, 2]}]}]}]}
+
+
+def trend_update(delta):
+    """
+    aggregation expression that adds delta likes made right now to a
+    playlist's trend score, or removes -delta of its likeCount likes
+    """
+    if delta > 0:
+        return trend_added(delta)
+    return trend_removed(-delta, {"$ifNull": [f"${LIKE_COUNT}", 0]})
+
+
+def record_likes(playlist_name, delta):
+    """
+    feeds delta new likes (or unlikes if negative) into the trending rank
+    unlikes are taken from the likes in its likeCount
+    """
+    if delta:
+        dbc.update_doc(PLAYLISTS, {PLNAME: playlist_name},
+                       [{"$set": {TREND_SCORE: trend_update(delta)}}])
+
+
+def count_update(added, removed):
+    """
+    pipeline update that counts added likes and removed unlikes in
+    likeCount and the trend score, unlikes coming out first
+    """
+    count = {"$ifNull": [f"${LIKE_COUNT}", 0]}
+    return [{"$set": {TREND_SCORE: trend_removed(removed, count)}},
+            {"$set": {TREND_SCORE: trend_added(added),
+                      LIKE_COUNT: {"$add": [count, added - removed]}}}]
+
+
+def top_playlists(limit):
+    """
+    returns the limit most liked playlists, without their arrays
+    they are ranked by likeCount as of the last fold of the like shards
+    """
+    dbc.ensure_index(PLAYLISTS, [(LIKE_COUNT, -1)])
+    return lc.live_counts(dbc.fetch_many(PLAYLISTS, {}, SUMMARY,
+                                         sort=[(LIKE_COUNT, -1)],
+                                         limit=limit))
+
+
+def trending_playlists(limit):
+    """
+    returns the limit playlists with the most recent likes,
+    without their arrays
+    each carries recentLikes, its like count decayed to the present,
+    as of the last fold of the like shards
     """
-    update_playlist(pl_name, {"$pull": {"songs": song_name}})
+    dbc.ensure_index(PLAYLISTS, [(TREND_SCORE, -1)])
+    ret = lc.live_counts(dbc.fetch_many(
+        PLAYLISTS, {TREND_SCORE: {"$ne": None}}, SUMMARY,
+        sort=[(TREND_SCORE, -1)], limit=limit))
+    now = trend_now()
+    for pl in ret:
+        pl[RECENT_LIKES] = 2 ** (pl[TREND_SCORE] - now)
+    return ret
 
 
 def empty():
@@ -110,3 +540,6 @@ def empty():
     ONLY IF IN TEST_MODE
     """
     dbc.del_many(PLAYLISTS)
+    dbc.del_many(SONG_ITEMS)
+    dbc.del_many(LIKE_ITEMS)
+    lc.empty()
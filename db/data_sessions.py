@@ -0,0 +1,149 @@
+"""
+This file manages login sessions, which live in their own collection.
+Each session is found by its token id, and mongo deletes it by itself
+once it expires, so a user can be logged in on many devices at once
+and checking a token never loads the user.
+Signed tokens aren't stored at all; only the ones revoked before they
+expire are, and that short list is cached and refreshed every REFRESH
+seconds.
+"""
+
+import datetime
+import threading
+import time
+import db.db_connect as dbc
+import db.cache_invalidation as ci
+import db.usertoken as token
+
+SESSIONS = "sessions"
+REVOKED = "revokedTokens"
+USERNAME = "userName"
+
+REFRESH = 30
+
+lock = threading.Lock()
+revoked_ids = set()
+revoked_users = {}
+refreshed = 0
+
+
+def ensure_indexes():
+    """
+    sessions are looked up by token id and expire at their exp time
+    """
+    dbc.ensure_index(SESSIONS, [(token.ID, 1)], unique=True)
+    dbc.ensure_index(SESSIONS, [(token.EXP, 1)], expireAfterSeconds=0)
+    dbc.ensure_index(SESSIONS, [(USERNAME, 1)])
+
+
+def create(username, session):
+    """
+    stores a new session made by usertoken.session for a user
+    """
+    ensure_indexes()
+    dbc.insert_doc(SESSIONS, {**session, USERNAME: username})
+
+
+def valid(username, token_id):
+    """
+    returns whether a token id is an unexpired session of this user
+    mongo only sweeps expired sessions once a minute, so exp is checked too
+    """
+    ensure_indexes()
+    now = datetime.datetime.utcnow()
+    found = dbc.fetch_one(SESSIONS, {token.ID: token_id, USERNAME: username,
+                                     token.EXP: {"$gt": now}}, {"_id": 1})
+    return found is not None
+
+
+def end(username, token_id):
+    """
+    ends one session, returns whether there was one to end
+    """
+    ret = dbc.del_one(SESSIONS, {token.ID: token_id, USERNAME: username})
+    return ret.deleted_count > 0
+
+
+def end_all(username):
+    """
+    ends every session of a user
+    """
+    dbc.del_matching(SESSIONS, {USERNAME: username})
+
+
+def revoke(claims):
+    """
+    revokes one signed token until it would have expired
+    """
+    dbc.ensure_index(REVOKED, [(token.EXP, 1)], expireAfterSeconds=0)
+    exp = datetime.datetime.utcfromtimestamp(claims[token.EXP])
+    dbc.insert_doc(REVOKED, {token.JTI: claims[token.JTI], token.EXP: exp})
+    with lock:
+        revoked_ids.add(claims[token.JTI])
+
+
+def revoke_user(username):
+    """
+    revokes every signed token issued to a user up to now
+    """
+    dbc.ensure_index(REVOKED, [(token.EXP, 1)], expireAfterSeconds=0)
+    now = time.time()
+    dbc.insert_doc(REVOKED, {USERNAME: username, token.IAT: now,
+                             token.EXP: token.expiry()})
+    with lock:
+        revoked_users[username] = now
+
+
+def refresh():
+    """
+    reloads the revocations other processes have made
+    """
+    global refreshed
+    ids, users = set(), {}
+    now = datetime.datetime.utcnow()
+    for doc in dbc.fetch_iter(REVOKED, {token.EXP: {"$gt": now}},
+                              {"_id": 0, token.EXP: 0}):
+        if token.JTI in doc:
+            ids.add(doc[token.JTI])
+        else:
+            users[doc[USERNAME]] = max(doc[token.IAT],
+                                       users.get(doc[USERNAME], 0))
+    with lock:
+        revoked_ids.clear()
+        revoked_ids.update(ids)
+        revoked_users.clear()
+        revoked_users.update(users)
+        refreshed = time.time()
+
+
+def is_revoked(claims):
+    """
+    whether a signed token has been revoked, going by the cached list
+    """
+    if time.time() - refreshed > REFRESH:
+        refresh()
+    with lock:
+        return claims[token.JTI] in revoked_ids or \
+            claims[token.IAT] <= revoked_users.get(claims[token.USER], -1)
+
+
+def on_revoke(username, fields):
+    """
+    reloads the revocations on next use when another process adds one
+    """
+    global refreshed
+    refreshed = 0
+
+
+ci.register(REVOKED, on_revoke)
+
+
+def empty():
+    """
+    empty out the sessions and revocations in the database
+    ONLY IF IN TEST_MODE
+    """
+    global refreshed
+    dbc.del_many(SESSIONS)
+    dbc.del_many(REVOKED)
+    refreshed = 0
@@ -7,6 +7,13 @@ Only for user related database calls
 
 import db.db_connect as dbc
 import db.data_playlists as dbp
+import db.data_sessions as ds
+import db.feed as feed
+import db.friend_index as fi
+import db.like_counters as lc
+import db.like_queue as lq
+import db.prefix_index as pi
+import db.recommend as rec
 import db.usertoken as token
 import hashlib
 
@@ -18,10 +25,29 @@ USERNAME = "userName"
 PASSWORD = "password"
 TOKEN = "token"
 
-client = dbc.get_client()
-if client is None:
-    print("FAILED TO CONNECT TO MONGODB")
-    exit(1)
+FRIENDS = "friends"
+FRIEND_COUNT = "friendCount"
+INCOMING = "incomingRequests"
+OUTGOING = "outgoingRequests"
+USER_ARRAYS = [OUTGOING, INCOMING, FRIENDS,
+               "ownedPlaylists", "likedPlaylists"]
+CONNECTIONS = {USERNAME: 1, FRIENDS: 1, INCOMING: 1, OUTGOING: 1, "_id": 0}
+
+OWNED = "ownedPlaylists"
+LIKED = "likedPlaylists"
+PROFILE = "user"
+TOTALS = "totals"
+PROFILE_LISTS = (FRIENDS, OWNED, LIKED)
+PROFILE_SECTIONS = (PROFILE,) + PROFILE_LISTS
+PROFILE_LIMIT = 10
+FRIEND_SUMMARY = {USERNAME: 1, FRIEND_COUNT: 1, "_id": 0}
+
+STATUS = "status"
+MUTUAL = "mutualFriends"
+ARE_FRIENDS = "friends"
+REQUESTED = "requested"
+RECEIVED = "received"
+STRANGERS = "none"
 
 OK = 0
 NOT_FOUND = 1
@@ -33,10 +59,15 @@ def sha(string):
     return hashlib.sha256(string.encode()).hexdigest()
 
 
-def get_users():
+def get_users(counts=False):
     """
     returns all users as a list
+    if counts is set, the users' arrays are left out
+    and only their counters are returned
     """
+    if counts:
+        hidden = {field: 0 for field in USER_ARRAYS + [PASSWORD]}
+        return dbc.fetch_all(USERS, USERNAME, hidden)
     ret = dbc.fetch_all(USERS, USERNAME)
     for user in ret:
         user.pop(PASSWORD)
@@ -68,11 +99,50 @@ def get_user(username):
     if user_exists(username):
         ret = dbc.fetch_one(USERS, filters={USERNAME: username})
         ret.pop(PASSWORD)
+        if lq.enabled():
+            ret[lq.LIKED] = lq.overlay(username, ret[lq.LIKED])
         return ret
     else:
         return NOT_FOUND
 
 
+def get_pair(usern1, usern2):
+    """
+    returns the friends and friend requests of two users
+    fetched together in one indexed query, else NOT_FOUND
+    """
+    dbc.ensure_index(USERS, [(USERNAME, 1)])
+    found = dbc.fetch_many(USERS, {USERNAME: {"$in": [usern1, usern2]}},
+                           CONNECTIONS)
+    users = {user[USERNAME]: user for user in found}
+    if usern1 not in users or usern2 not in users:
+        return NOT_FOUND
+    return users[usern1], users[usern2]
+
+
+def relationship(usern1, usern2):
+    """
+    returns how usern1 relates to usern2 and their mutual friends
+    else NOT_FOUND if either user doesn't exist
+    the status is friends, requested (usern1 sent usern2 a request),
+    received (usern2 sent usern1 a request) or none
+    """
+    pair = get_pair(usern1, usern2)
+    if pair == NOT_FOUND:
+        return NOT_FOUND
+    user1, user2 = pair
+    if usern2 in user1[FRIENDS] or usern1 in user2[FRIENDS]:
+        status = ARE_FRIENDS
+    elif usern2 in user1[OUTGOING] or usern1 in user2[INCOMING]:
+        status = REQUESTED
+    elif usern1 in user2[OUTGOING] or usern2 in user1[INCOMING]:
+        status = RECEIVED
+    else:
+        status = STRANGERS
+    mutual = set(user1[FRIENDS]) & set(user2[FRIENDS])
+    return {STATUS: status, MUTUAL: sorted(mutual)}
+
+
 def add_user(username, password):
     """
     adds a user, returns whether successful or not
@@ -84,11 +154,12 @@ def add_user(username, password):
                                PASSWORD: sha(password),
                                "outgoingRequests": [],
                                "incomingRequests": [],
-                               "friends": [],
+                               FRIENDS: [],
+                               FRIEND_COUNT: 0,
                                "ownedPlaylists": [],
                                "likedPlaylists": [],
-                               "token": token.blank(),
                                })
+        pi.add(username)
         return OK
 
 
@@ -103,26 +174,52 @@ def check_password(username, password):
 def login(username, password):
     """
     checks if password matches user, gen token if it does
+    the token is signed if TOKEN_KEYS is set, else it starts a new session
     """
     if not user_exists(username):
         return NOT_FOUND
     if not check_password(username, password):
         return NOT_ACCEPTABLE
+    elif token.signing():
+        return token.sign(username)
     else:
-        newtoken = token.new()
-        update_user(username, {"$set": {"token": newtoken}})
-        return newtoken['id']
+        newtoken = token.session()
+        ds.create(username, newtoken)
+        return newtoken[token.ID]
+
+
+def signed_claims(username, val):
+    """
+    returns the claims of a valid signed token for this user, else None
+    """
+    claims = token.verify(val)
+    if claims is None or claims[token.USER] != username:
+        return None
+    return claims
+
+
+def logout(username, val):
+    """
+    ends the session with this token, returns NOT_FOUND if there isn't one
+    """
+    if token.is_signed(val):
+        claims = signed_claims(username, val)
+        if claims is None or ds.is_revoked(claims):
+            return NOT_FOUND
+        ds.revoke(claims)
+        return OK
+    return OK if ds.end(username, val) else NOT_FOUND
 
 
 def check_auth(username, val):
     """
     check if user is who they claim to be
+    signed tokens are checked without going to the database
     """
-    valid = val == get_user(username)['token']['id']
-    if valid:
-        unexpired = token.check(get_user(username)['token'])
-        return valid and unexpired
-    return False
+    if token.is_signed(val):
+        claims = signed_claims(username, val)
+        return claims is not None and not ds.is_revoked(claims)
+    return ds.valid(username, val)
 
 
 def update_user(user_name, update):
@@ -141,6 +238,12 @@ def del_user(username):
     """
     if user_exists(username):
         dbc.del_one(USERS, filters={USERNAME: username})
+        fi.remove_user(username)
+        pi.remove(username)
+        ds.end_all(username)
+        if token.signing():
+            ds.revoke_user(username)
+        rec.forget(username)
         return OK
     else:
         return NOT_FOUND
@@ -151,12 +254,14 @@ def bef_user(usern1, usern2):
     befriends 2 users by adding each other to their friends list
     removes both users from existing friend request lists
     """
-    update_user(usern2, {"$push": {"friends": usern1}})
-    update_user(usern1, {"$push": {"friends": usern2}})
-    update_user(usern1, {"$pull": {"incomingRequests": usern2}})
-    update_user(usern1, {"$pull": {"outgoingRequests": usern2}})
-    update_user(usern2, {"$pull": {"incomingRequests": usern1}})
-    update_user(usern2, {"$pull": {"outgoingRequests": usern1}})
+    for user, friend in ((usern1, usern2), (usern2, usern1)):
+        dbc.update_doc(USERS, {USERNAME: user},
+                       {"$pull": {"incomingRequests": friend,
+                                  "outgoingRequests": friend}})
+        dbc.update_doc(USERS, {USERNAME: user, FRIENDS: {"$ne": friend}},
+                       {"$push": {FRIENDS: friend},
+                        "$inc": {FRIEND_COUNT: 1}})
+    fi.add_friendship(usern1, usern2)
 
 
 def req_user(usern1, usern2):
@@ -166,6 +271,7 @@ def req_user(usern1, usern2):
     """
     update_user(usern2, {"$push": {"incomingRequests": usern1}})
     update_user(usern1, {"$push": {"outgoingRequests": usern2}})
+    fi.invalidate(usern1, usern2)
 
 
 def dec_req(usern1, usern2):
@@ -175,14 +281,18 @@ def dec_req(usern1, usern2):
     """
     update_user(usern1, {"$pull": {"incomingRequests": usern2}})
     update_user(usern2, {"$pull": {"outgoingRequests": usern1}})
+    fi.invalidate(usern1, usern2)
 
 
 def unf_user(usern1, usern2):
     """
     unfriends 2 users by removing one another from their friends lists
     """
-    update_user(usern2, {"$pull": {"friends": usern1}})
-    update_user(usern1, {"$pull": {"friends": usern2}})
+    for user, friend in ((usern1, usern2), (usern2, usern1)):
+        dbc.update_doc(USERS, {USERNAME: user, FRIENDS: friend},
+                       {"$pull": {FRIENDS: friend},
+                        "$inc": {FRIEND_COUNT: -1}})
+    fi.remove_friendship(usern1, usern2)
 
 
 def get_users_entries(username, param):
@@ -204,7 +314,7 @@ def get_friends(username):
     """
     returns a complete list of a user's friends
     """
-    return get_users_entries(username, 'friends')
+    return get_users_entries(username, FRIENDS)
 
 
 def get_liked_playlists(username):
@@ -225,33 +335,119 @@ def get_users_playlists(username, param):
     """
     returns a complete list of all the playlists
     that a user has interacted with in some way
+    fetched with one query, without their songs
     """
-    if not user_exists(username):
+    user = get_user(username)
+    if user == NOT_FOUND:
         return NOT_FOUND
-    else:
-        ret = []
-        user = get_user(username)
-        for playlist in user[param]:
-            ret.append(dbp.get_playlist(playlist))
-        return ret
+    return lc.live_counts(dbc.fetch_in(PLAYLISTS, PLNAME, user[param]))
+
+
+def profile_pipeline(username, limits, full_likes):
+    """
+    pipeline fetching a user with the first few names of each list
+    and each list's full length, leaving out the password and requests
+    """
+    lists = {field: {"$ifNull": [f"${field}", []]} for field in PROFILE_LISTS}
+    firsts = {}
+    for field, names in lists.items():
+        limit = limits.get(field, PROFILE_LIMIT)
+        if field == LIKED and full_likes:
+            firsts[field] = names
+        elif limit:
+            firsts[field] = {"$slice": [names, limit]}
+        else:
+            firsts[field] = {"$literal": []}
+    return [{"$match": {USERNAME: username}},
+            {"$limit": 1},
+            {"$set": {TOTALS: {field: {"$size": names}
+                               for field, names in lists.items()}}},
+            {"$set": firsts},
+            {"$unset": ["_id", PASSWORD, INCOMING, OUTGOING]}]
+
+
+def get_profile(username, sections=PROFILE_SECTIONS, limits={}):
+    """
+    returns a user's profile page, else NOT_FOUND:
+    the user, their first friends, owned playlists and liked playlists,
+    and totals with how many of each they have
+    sections picks which of those come back, limits caps each list,
+    PROFILE_LIMIT by default
+    friends come back as their names and friend counts, and playlists
+    with counters in place of their arrays
+    it takes one query for the user and one more for each list asked
+    for, however long the lists are
+    """
+    full_likes = lq.enabled()
+    found = list(dbc.aggregate(USERS, profile_pipeline(username, limits,
+                                                       full_likes)))
+    if not found:
+        return NOT_FOUND
+    user = found[0]
+    totals = user.pop(TOTALS)
+    if full_likes:
+        liked = lq.overlay(username, user[LIKED])
+        totals[LIKED] = len(liked)
+        user[LIKED] = liked[:limits.get(LIKED, PROFILE_LIMIT)]
+    names = {field: user.pop(field) for field in PROFILE_LISTS}
+    ret = {TOTALS: totals}
+    if PROFILE in sections:
+        ret[PROFILE] = user
+    if FRIENDS in sections:
+        ret[FRIENDS] = dbc.fetch_in(USERS, USERNAME, names[FRIENDS],
+                                    FRIEND_SUMMARY)
+    for field in (OWNED, LIKED):
+        if field in sections:
+            ret[field] = dbp.get_playlists_named(names[field])
+    return ret
 
 
 def like_playlist(username, playlist_name):
     """
     likes a playlist by adding it to the user's playlists
-    also adds the user to the playlist's likes
+    also stores the like with the playlist's likes
+    with WRITE_BEHIND_LIKES set the like is queued instead
     """
-    dbp.update_playlist(playlist_name, {"$push": {"likes": username}})
-    update_user(username, {"$push": {"likedPlaylists": playlist_name}})
+    if lq.enabled():
+        lq.enqueue(username, playlist_name, True)
+        return
+    added = dbp.add_like(playlist_name, username)
+    update_user(username, {"$addToSet": {"likedPlaylists": playlist_name}})
+    rec.mark_stale(username)
+    if added:
+        rec.count_like(username, playlist_name, True)
+        feed.record(username, feed.LIKED, playlist_name)
 
 
 def unlike_playlist(username, playlist_name):
     """
     unlikes a playlist by removing it from the user's likes
-    also removing the user from the playlist's likes
+    also removing the like from the playlist's likes
+    with WRITE_BEHIND_LIKES set the unlike is queued instead
     """
-    dbp.update_playlist(playlist_name, {"$pull": {"likes": username}})
+    if lq.enabled():
+        lq.enqueue(username, playlist_name, False)
+        return
+    removed = dbp.remove_likes(playlist_name, [username])
     update_user(username, {"$pull": {"likedPlaylists": playlist_name}})
+    rec.mark_stale(username)
+    if removed:
+        rec.count_like(username, playlist_name, False)
+
+
+def drop_likes(playlist_name):
+    """
+    takes a deleted playlist out of the likes of every user who liked it,
+    found through an index on their liked playlists, and drops its
+    queued likes
+    """
+    dbc.ensure_index(USERS, [(LIKED, 1)])
+    names = [doc[USERNAME] for doc in dbc.fetch_iter(
+        USERS, {LIKED: playlist_name}, {USERNAME: 1, "_id": 0})]
+    dbc.update_many(USERS, {LIKED: playlist_name},
+                    {"$pull": {LIKED: playlist_name}})
+    dbc.del_matching(lq.QUEUE, {lq.PLNAME: playlist_name})
+    rec.mark_stale_many(names)
 
 
 def create_playlist(username, playlist_name):
@@ -259,6 +455,7 @@ def create_playlist(username, playlist_name):
     adds a playlist name to a user's created playlists
     """
     update_user(username, {"$push": {"ownedPlaylists": playlist_name}})
+    feed.record(username, feed.CREATED, playlist_name)
 
 
 def delete_playlist(username, playlist_name):
@@ -274,3 +471,6 @@ def empty():
     ONLY IF IN TEST_MODE
     """
     dbc.del_many(USERS)
+    ds.empty()
+    fi.reset()
+    feed.empty()
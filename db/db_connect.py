@@ -1,6 +1,16 @@
 import os
 import json
+import contextlib
+import contextvars
+import functools
+import random
+import threading
+import time
+from collections import deque
 import pymongo as pm
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import (BulkWriteError, ConnectionFailure,
+                            DuplicateKeyError, ExecutionTimeout, PyMongoError)
 import bson.json_util as bsutil
 
 USER_NM = os.environ.get("MONGO_UN", 'user')
@@ -15,78 +25,509 @@ if os.environ.get("TEST_MODE", ''):
 
 CONN_STR = f"{CLOUD_MDB}://{USER_NM}:{PASSWD}@{CLOUD_SVC}/{DB_NM}?{DB_PARAMS}"
 
+DUPLICATE_KEY = 11000
+
+# bounds on reaching mongo, whether or not a deadline is set
+# reads and writes have no socket timeout on the shared client: a
+# request's calls are bounded by its deadline, and the batch jobs'
+# long aggregations and bulk updates, which run without one, may
+# take as long as they need
+CONNECT_TIMEOUT_MS = 2000
+SERVER_SELECTION_TIMEOUT_MS = 3000
+
+# reads that fail for a transient reason are retried with jittered backoff
+RETRIES = 2
+BACKOFF = 0.05
+MAX_BACKOFF = 0.5
+
+# the breaker opens when FAILURE_RATE of the calls in the last WINDOW
+# seconds failed, and lets one call through again after COOL_DOWN
+WINDOW = 30
+MIN_CALLS = 20
+FAILURE_RATE = 0.5
+COOL_DOWN = 10
+# a probe that hasn't reported back by then is taken as lost
+PROBE_TIMEOUT = 30
+
+TIMEOUTS = {"connectTimeoutMS": CONNECT_TIMEOUT_MS,
+            "serverSelectionTimeoutMS": SERVER_SELECTION_TIMEOUT_MS}
+
 REMOTE = '1'
 LOCAL = '0'
 
 client = None
+client_pid = None
+client_lock = threading.Lock()
+indexed = set()
+
+budget_end = contextvars.ContextVar("budget_end", default=None)
+breaker_lock = threading.Lock()
+outcomes = deque()
+failures = 0
+opened = None
+# when the probe in flight was let through, else None
+probing = None
+
+
+class DatabaseUnavailable(Exception):
+    """
+    raised instead of calling mongo while it is failing or out of time
+    """
 
 
 def get_client():
     """
     Get and return client given environment variables
+    each process makes one client and shares it between its threads
     """
-    global client
-    if os.environ.get("LOCAL_MONGO", REMOTE) == LOCAL:
-        print("Connecting to local mongo")
-        client = pm.MongoClient()
-    else:
-        print("Connecting to remote mongo")
-        client = pm.MongoClient(CONN_STR)
+    global client, client_pid
+    if client is not None and client_pid == os.getpid():
+        return client
+    with client_lock:
+        if client is not None and client_pid == os.getpid():
+            return client
+        if os.environ.get("LOCAL_MONGO", REMOTE) == LOCAL:
+            print("Connecting to local mongo")
+            client = pm.MongoClient(**TIMEOUTS)
+        else:
+            print("Connecting to remote mongo")
+            client = pm.MongoClient(CONN_STR, **TIMEOUTS)
+        client_pid = os.getpid()
     return client
 
 
-def fetch_one(collect_nm, filters={}):
+def database():
+    """
+    the app's database, connecting the first time it is used
+    so importing the data modules doesn't wait on the network
+    """
+    return get_client()[DB_NM]
+
+
+def warm_up():
+    """
+    connects in the background, so the first request doesn't pay for
+    resolving and reaching the cluster and startup doesn't wait on it
+    """
+    def connect():
+        try:
+            get_client().admin.command("ping")
+        except PyMongoError as err:
+            print(f"Could not reach mongo yet: {err}")
+
+    threading.Thread(target=connect, name="mongo-warm-up",
+                     daemon=True).start()
+
+
+def after_fork():
+    """
+    a forked process can't use its parent's connections or locks,
+    so it gets a client and breaker of its own
+    """
+    global breaker_lock, client_lock
+    breaker_lock = threading.Lock()
+    client_lock = threading.Lock()
+    reset_breaker()
+    if client is not None:
+        get_client()
+
+
+os.register_at_fork(after_in_child=after_fork)
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """
+    gives every mongo call made inside it a share of one time budget
+    each call is sent with the time left as its maxTimeMS
+    """
+    token = budget_end.set(time.monotonic() + seconds)
+    try:
+        with pm.timeout(seconds):
+            yield
+    finally:
+        budget_end.reset(token)
+
+
+def allow():
+    """
+    raises DatabaseUnavailable while the breaker is open
+    once it has cooled down, one call is let through to probe,
+    and another if that one hasn't reported back in PROBE_TIMEOUT
+    """
+    global probing
+    now = time.monotonic()
+    with breaker_lock:
+        if opened is None:
+            return
+        if now - opened < COOL_DOWN or \
+                (probing is not None and now - probing < PROBE_TIMEOUT):
+            raise DatabaseUnavailable("DATABASE UNAVAILABLE")
+        probing = now
+
+
+def record(ok):
+    """
+    counts the outcome of a call and opens or closes the breaker
+    """
+    global failures, opened, probing
+    now = time.monotonic()
+    with breaker_lock:
+        if probing is not None:
+            probing = None
+            opened = None if ok else now
+            outcomes.clear()
+            failures = 0
+            return
+        outcomes.append((now, ok))
+        failures += not ok
+        while outcomes[0][0] < now - WINDOW:
+            failures -= not outcomes.popleft()[1]
+        if opened is None and len(outcomes) >= MIN_CALLS \
+                and failures >= FAILURE_RATE * len(outcomes):
+            opened = now
+
+
+def reset_breaker():
+    """
+    closes the breaker and forgets every outcome
+    """
+    global failures, opened, probing
+    with breaker_lock:
+        outcomes.clear()
+        failures = 0
+        opened = None
+        probing = None
+
+
+def transient(err):
+    """
+    whether an error says mongo is unreachable or slow,
+    rather than that the call itself was wrong
+    """
+    return isinstance(err, (ConnectionFailure, ExecutionTimeout)) \
+        or err.timeout
+
+
+def backoff(attempt):
+    """
+    sleeps before a retry, returns False if the deadline leaves no time
+    """
+    delay = random.uniform(0, min(MAX_BACKOFF, BACKOFF * 2 ** attempt))
+    end = budget_end.get()
+    if end is not None and time.monotonic() + delay >= end:
+        return False
+    time.sleep(delay)
+    return True
+
+
+def guarded(retries):
+    """
+    runs a call through the breaker, retrying transient errors
+    a call that still fails for a transient reason raises
+    DatabaseUnavailable; any other error means mongo answered,
+    so it counts as a success
+    """
+    def wrap(func):
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            attempt = 0
+            while True:
+                allow()
+                try:
+                    ret = func(*args, **kwargs)
+                except PyMongoError as err:
+                    if not transient(err):
+                        record(True)
+                        raise
+                    record(False)
+                    if err.timeout or attempt == retries \
+                            or not backoff(attempt):
+                        raise DatabaseUnavailable(str(err)) from err
+                    attempt += 1
+                    continue
+                except Exception:
+                    record(True)
+                    raise
+                record(True)
+                return ret
+        return call
+    return wrap
+
+
+def stream(cursor):
+    """
+    yields a cursor's docs one at a time through the breaker
+    a stream can't be retried once it has started
+    one the reader stops early, or that fails for a reason other than
+    mongo, counts as a success
+    """
+    allow()
+    try:
+        for doc in cursor:
+            yield json.loads(bsutil.dumps(doc))
+    except PyMongoError as err:
+        if not transient(err):
+            record(True)
+            raise
+        record(False)
+        raise DatabaseUnavailable(str(err)) from err
+    except BaseException:
+        record(True)
+        raise
+    record(True)
+
+
+@guarded(RETRIES)
+def fetch_one(collect_nm, filters={}, projection=None):
     """
     Fetch one record that meets filters.
+    projection optionally limits which fields come back
     """
-    doc = client[DB_NM][collect_nm].find_one(filters)
+    doc = database()[collect_nm].find_one(filters, projection)
     return json.loads(bsutil.dumps(doc))
 
 
+@guarded(0)
 def del_one(collect_nm, filters={}):
     """
     delete one record that meets filters.
     """
-    return client[DB_NM][collect_nm].delete_one(filters)
+    return database()[collect_nm].delete_one(filters)
+
+
+@guarded(0)
+def del_matching(collect_nm, filters):
+    """
+    delete every record that meets filters, outside of TEST_MODE too
+    """
+    return database()[collect_nm].delete_many(filters)
 
 
+@guarded(0)
 def del_many(collect_nm, filters={}):
     """
     delete all records for some filter
     """
     if os.environ.get("TEST_MODE", ''):
-        return client[DB_NM][collect_nm].delete_many(filters)
+        return database()[collect_nm].delete_many(filters)
 
 
-def fetch_all(collect_nm, key_nm):
+def fetch_iter(collect_nm, filters={}, projection=None, sort=None):
+    """
+    yield the records that meet filters one at a time
+    so large collections can be walked in bounded memory
+    optionally sorted by a list of (field, direction) pairs
+    """
+    return stream(database()[collect_nm].find(filters, projection,
+                                              sort=sort))
+
+
+def aggregate(collect_nm, pipeline):
+    """
+    yield the results of an aggregation pipeline one at a time
+    stages may spill to disk so large collections stay in bounded memory
+    """
+    return stream(database()[collect_nm].aggregate(pipeline,
+                                                   allowDiskUse=True))
+
+
+@guarded(RETRIES)
+def fetch_all(collect_nm, key_nm, projection=None):
     """
     fetch all records for a certain collection as a list
+    projection optionally limits which fields come back
     """
     all_docs = []
-    for doc in client[DB_NM][collect_nm].find():
+    for doc in database()[collect_nm].find({}, projection):
         all_docs.append(json.loads(bsutil.dumps(doc)))
     return all_docs
 
 
+@guarded(RETRIES)
+def fetch_many(collect_nm, filters={}, projection=None, sort=None, limit=0,
+               skip=0):
+    """
+    fetch the records that meet filters as a list
+    optionally sorted by a list of (field, direction) pairs,
+    skipping the first skip records and limited
+    """
+    cursor = database()[collect_nm].find(filters, projection, sort=sort,
+                                         limit=limit, skip=skip)
+    return [json.loads(bsutil.dumps(doc)) for doc in cursor]
+
+
+def fetch_in(collect_nm, key_nm, keys, projection=None):
+    """
+    fetch the records whose key_nm is one of keys with one query,
+    in the order of keys, leaving out keys with no record
+    projection has to keep key_nm
+    """
+    if not keys:
+        return []
+    found = {doc[key_nm]: doc for doc in
+             fetch_many(collect_nm, {key_nm: {"$in": list(keys)}},
+                        projection)}
+    return [found[key] for key in keys if key in found]
+
+
+@guarded(RETRIES)
 def fetch_all_dict(collect_nm, key_nm):
     """
     fetch all records for a certain collection as a dictionary
     """
     all_docs = {}
-    for doc in client[DB_NM][collect_nm].find():
+    for doc in database()[collect_nm].find():
         all_docs[doc[key_nm]] = json.loads(bsutil.dumps(doc))
     return all_docs
 
 
+@guarded(RETRIES)
+def count(collect_nm, filters={}):
+    """
+    count the records that meet filters
+    """
+    return database()[collect_nm].count_documents(filters)
+
+
+@guarded(0)
 def insert_doc(collect_nm, doc):
     """
     insert a doc into a certain collection
     """
-    client[DB_NM][collect_nm].insert_one(doc)
+    database()[collect_nm].insert_one(doc)
+
+
+@guarded(0)
+def insert_new(collect_nm, doc):
+    """
+    insert a doc unless it breaks a unique index
+    returns whether it was inserted
+    """
+    try:
+        database()[collect_nm].insert_one(doc)
+        return True
+    except DuplicateKeyError:
+        return False
 
 
-def update_doc(collect_nm, filters, update):
+@guarded(0)
+def insert_docs(collect_nm, docs):
+    """
+    insert many docs at once in no particular order,
+    skipping any that break a unique index
+    returns how many were inserted
+    """
+    if not docs:
+        return 0
+    try:
+        ret = database()[collect_nm].insert_many(docs, ordered=False)
+        return len(ret.inserted_ids)
+    except BulkWriteError as err:
+        if any(error["code"] != DUPLICATE_KEY
+               for error in err.details["writeErrors"]):
+            raise
+        return err.details["nInserted"]
+
+
+@guarded(0)
+def update_doc(collect_nm, filters, update, upsert=False):
     """
     updates a doc given filters and new values
+    upsert inserts the doc if none meets filters
+    """
+    return database()[collect_nm].update_one(filters, update,
+                                             upsert=upsert)
+
+
+@guarded(0)
+def update_and_fetch(collect_nm, filters, update, projection=None):
+    """
+    updates one doc and returns it as it is after the update,
+    else None if no doc meets filters
+    """
+    doc = database()[collect_nm].find_one_and_update(
+        filters, update, projection, return_document=ReturnDocument.AFTER)
+    return json.loads(bsutil.dumps(doc))
+
+
+@guarded(0)
+def update_many(collect_nm, filters, update):
+    """
+    updates every doc that meets filters
+    """
+    return database()[collect_nm].update_many(filters, update)
+
+
+@guarded(0)
+def replace_docs(collect_nm, key_nm, docs):
+    """
+    replaces (or inserts) each doc by its key in one bulk write
+    """
+    ops = [ReplaceOne({key_nm: doc[key_nm]}, doc, upsert=True)
+           for doc in docs]
+    if ops:
+        database()[collect_nm].bulk_write(ops, ordered=False)
+
+
+@guarded(0)
+def set_each(collect_nm, key_nm, docs):
+    """
+    sets the fields of each doc on the record with its key
+    in one bulk write
+    """
+    ops = [UpdateOne({key_nm: doc[key_nm]}, {"$set": doc}) for doc in docs]
+    if ops:
+        database()[collect_nm].bulk_write(ops, ordered=False)
+
+
+@guarded(0)
+def update_each(collect_nm, changes, upsert=False):
+    """
+    applies a list of (filters, update) pairs in one bulk write
+    upsert inserts a doc for each pair no doc meets
+    """
+    ops = [UpdateOne(filters, update, upsert=upsert)
+           for filters, update in changes]
+    if ops:
+        database()[collect_nm].bulk_write(ops, ordered=False)
+
+
+def watch(collect_nms, pipeline=[], resume_after=None):
+    """
+    opens a change stream on the named collections
+    changed docs are looked up so the pipeline can pick fields from them,
+    and deleted docs come with their last version where it was kept
+    resume_after picks up after the change with that resume token
+    """
+    match = {"$match": {"ns.coll": {"$in": list(collect_nms)}}}
+    return database().watch([match] + pipeline,
+                            full_document="updateLookup",
+                            full_document_before_change="whenAvailable",
+                            resume_after=resume_after,
+                            max_await_time_ms=1000)
+
+
+@guarded(0)
+def keep_pre_images(collect_nm):
+    """
+    has the server record each doc's last version with its change,
+    so change streams can say which doc a delete removed
+    """
+    names = database().list_collection_names(filter={"name": collect_nm})
+    if not names:
+        database().create_collection(collect_nm)
+    database().command("collMod", collect_nm,
+                       changeStreamPreAndPostImages={"enabled": True})
+
+
+@guarded(0)
+def ensure_index(collect_nm, keys, **options):
+    """
+    creates an index the first time it is needed in this process
+    keys is a list of (field, direction) pairs
     """
-    client[DB_NM][collect_nm].update_one(filters, update)
+    name = (collect_nm, tuple(keys))
+    if name not in indexed:
+        database()[collect_nm].create_index(keys, **options)
+        indexed.add(name)
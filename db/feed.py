@@ -0,0 +1,144 @@
+"""
+This file keeps each user's feed of what their friends have been doing:
+playlists created, playlists liked and songs added.
+An event is written once into each friend's inbox bucket for the day,
+so reading a feed is one indexed range query over a user's own buckets.
+Users with more than FANOUT_LIMIT friends write to their own outbox
+instead, and their friends merge those outboxes in when they read.
+Buckets hold at most MAX_EVENTS events and expire after KEEP.
+"""
+
+import datetime
+import heapq
+import itertools
+import time
+from collections import defaultdict
+import db.db_connect as dbc
+
+FEED = "feedBuckets"
+USERS = "users"
+USERNAME = "userName"
+FRIENDS = "friends"
+FRIEND_COUNT = "friendCount"
+
+OWNER = "owner"
+BOX = "box"
+DAY = "day"
+EVENTS = "events"
+EXP = "exp"
+INBOX = "in"
+OUTBOX = "out"
+
+ACTOR = "actor"
+KIND = "kind"
+PLNAME = "playlistName"
+SONG = "song"
+TS = "ts"
+CREATED = "created"
+LIKED = "liked"
+ADDED_SONG = "addedSong"
+
+DAY_SECONDS = 24 * 60 * 60
+MAX_EVENTS = 200
+FANOUT_LIMIT = 1000
+KEEP = datetime.timedelta(days=30)
+
+
+def ensure_indexes():
+    """
+    buckets are found by owner, box and day, and expire at their exp time
+    """
+    dbc.ensure_index(FEED, [(OWNER, 1), (BOX, 1), (DAY, -1)], unique=True)
+    dbc.ensure_index(FEED, [(EXP, 1)], expireAfterSeconds=0)
+
+
+def push(day, events):
+    """
+    the update that appends events to a bucket, keeping the newest ones
+    """
+    exp = datetime.datetime.utcfromtimestamp((day + 1) * DAY_SECONDS) + KEEP
+    return {"$push": {EVENTS: {"$each": events, "$slice": -MAX_EVENTS}},
+            "$setOnInsert": {EXP: exp}}
+
+
+def record(actor, kind, playlist_name, song=None):
+    """
+    writes an event into the feeds of the actor's friends,
+    or into the actor's outbox if they have too many friends
+    """
+    record_many([(actor, kind, playlist_name, song)])
+
+
+def record_many(events):
+    """
+    writes (actor, kind, playlist_name, song) events with one read of the
+    actors and one batch of updates, one per bucket however many events
+    land in it
+    """
+    actors = {user[USERNAME]: user for user in dbc.fetch_in(
+        USERS, USERNAME, sorted({event[0] for event in events}),
+        {USERNAME: 1, FRIENDS: 1, FRIEND_COUNT: 1, "_id": 0})}
+    if not actors:
+        return
+    ensure_indexes()
+    now = time.time()
+    day = int(now // DAY_SECONDS)
+    buckets = defaultdict(list)
+    for actor, kind, playlist_name, song in events:
+        if actor not in actors:
+            continue
+        event = {ACTOR: actor, KIND: kind, PLNAME: playlist_name, TS: now}
+        if song is not None:
+            event[SONG] = song
+        friends = actors[actor].get(FRIENDS, [])
+        if actors[actor].get(FRIEND_COUNT, len(friends)) > FANOUT_LIMIT:
+            buckets[actor, OUTBOX].append(event)
+        else:
+            for friend in friends:
+                buckets[friend, INBOX].append(event)
+    dbc.update_each(FEED, [({OWNER: owner, BOX: box, DAY: day},
+                            push(day, bucket))
+                           for (owner, box), bucket in buckets.items()],
+                    upsert=True)
+
+
+def newest_first(buckets):
+    """
+    yields the events of buckets sorted by day, newest first
+    buckets of the same day from different owners are merged
+    """
+    for day, same_day in itertools.groupby(buckets, lambda doc: doc[DAY]):
+        events = [event for doc in same_day for event in doc[EVENTS]]
+        yield from sorted(events, key=lambda event: -event[TS])
+
+
+def get_feed(username, limit, before=None):
+    """
+    returns up to limit events from a user's friends, newest first,
+    older than before if it is given, else None if the user doesn't exist
+    """
+    user = dbc.fetch_one(USERS, {USERNAME: username}, {FRIENDS: 1, "_id": 0})
+    if user is None:
+        return None
+    ensure_indexes()
+    day = int((time.time() if before is None else before) // DAY_SECONDS)
+    fields = {DAY: 1, EVENTS: 1, "_id": 0}
+    newest = [(DAY, -1)]
+    inbox = dbc.fetch_iter(FEED, {OWNER: username, BOX: INBOX,
+                                  DAY: {"$lte": day}}, fields, newest)
+    outboxes = dbc.fetch_iter(FEED, {OWNER: {"$in": user.get(FRIENDS, [])},
+                                     BOX: OUTBOX, DAY: {"$lte": day}},
+                              fields, newest)
+    events = heapq.merge(newest_first(inbox), newest_first(outboxes),
+                         key=lambda event: -event[TS])
+    if before is not None:
+        events = (event for event in events if event[TS] < before)
+    return list(itertools.islice(events, limit))
+
+
+def empty():
+    """
+    empty out every feed
+    ONLY IF IN TEST_MODE
+    """
+    dbc.del_many(FEED)
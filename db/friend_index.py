@@ -0,0 +1,231 @@
+"""
+This file keeps a compact in-memory index of who is friends with whom.
+It is built from the users collection the first time it is needed
+and kept current by the friend related calls in data_users,
+so friend-of-friend suggestions never have to load whole users.
+"""
+
+import heapq
+import sys
+import threading
+from collections import Counter
+import db.db_connect as dbc
+import db.cache_invalidation as ci
+
+USERS = "users"
+USERNAME = "userName"
+FRIENDS = "friends"
+INCOMING = "incomingRequests"
+OUTGOING = "outgoingRequests"
+MUTUAL = "mutualFriends"
+
+MAX_SUGGESTIONS = 100
+
+lock = threading.RLock()
+ids = {}
+names = []
+adjacency = []
+built = False
+building = False
+# users whose friends may have changed while a build read them
+touched = set()
+suggestions = {}
+generation = 0
+
+
+def node(username, table=None):
+    """
+    returns the int id of a user, giving it one if it is new
+    table is (ids, names, adjacency), the index itself unless given
+    """
+    to_ids, to_names, to_adjacency = table or (ids, names, adjacency)
+    if username not in to_ids:
+        to_ids[username] = len(to_names)
+        to_names.append(sys.intern(username))
+        to_adjacency.append(set())
+    return to_ids[username]
+
+
+def build():
+    """
+    loads every friendship from the users collection
+    only the names and friends arrays are fetched
+    the new index is made on the side and swapped in, so suggestions
+    are served from the old one meanwhile, and then the users whose
+    friends changed while it was read are read again
+    """
+    global ids, names, adjacency, built, building
+    with lock:
+        building = True
+        touched.clear()
+    try:
+        table = ({}, [], [])
+        for user in dbc.fetch_all(USERS, USERNAME,
+                                  {USERNAME: 1, FRIENDS: 1, "_id": 0}):
+            me = node(user[USERNAME], table)
+            for friend in user.get(FRIENDS, []):
+                them = node(friend, table)
+                table[2][me].add(them)
+                table[2][them].add(me)
+        with lock:
+            ids, names, adjacency = table
+            suggestions.clear()
+            built = True
+            changed = list(touched)
+    finally:
+        with lock:
+            building = False
+            touched.clear()
+    for username in changed:
+        sync(username)
+
+
+def reset():
+    """
+    throws the index away, it is rebuilt on next use
+    """
+    global built
+    with lock:
+        built = False
+        suggestions.clear()
+
+
+def invalidate(*usernames):
+    """
+    drops cached suggestions that changes to these users could affect:
+    their own and those of their friends
+    a friendship coming or going touches both its ends, so callers pass
+    both
+    """
+    global generation
+    with lock:
+        generation += 1
+        if building:
+            touched.update(usernames)
+        for username in usernames:
+            suggestions.pop(username, None)
+            if built and username in ids:
+                for friend in adjacency[ids[username]]:
+                    suggestions.pop(names[friend], None)
+
+
+def add_friendship(usern1, usern2):
+    """
+    records that two users became friends
+    """
+    with lock:
+        invalidate(usern1, usern2)
+        if built:
+            me, them = node(usern1), node(usern2)
+            adjacency[me].add(them)
+            adjacency[them].add(me)
+
+
+def remove_friendship(usern1, usern2):
+    """
+    records that two users are no longer friends
+    """
+    with lock:
+        invalidate(usern1, usern2)
+        if built and usern1 in ids and usern2 in ids:
+            me, them = ids[usern1], ids[usern2]
+            adjacency[me].discard(them)
+            adjacency[them].discard(me)
+
+
+def remove_user(username):
+    """
+    drops every friendship of a deleted user
+    its id is kept so existing ids stay valid
+    """
+    with lock:
+        invalidate(username)
+        if built and username in ids:
+            me = ids[username]
+            invalidate(*(names[friend] for friend in adjacency[me]))
+            for friend in adjacency[me]:
+                adjacency[friend].discard(me)
+            adjacency[me].clear()
+
+
+def rank(username, exclude):
+    """
+    ranks users two hops away by how many friends they share with username
+    """
+    if username not in ids:
+        return []
+    me = ids[username]
+    counts = Counter()
+    for friend in adjacency[me]:
+        counts.update(adjacency[friend])
+    skip = {ids[name] for name in exclude if name in ids}
+    skip.add(me)
+    skip.update(adjacency[me])
+    best = heapq.nsmallest(MAX_SUGGESTIONS,
+                           ((-count, names[user]) for user, count
+                            in counts.items() if user not in skip))
+    return [{USERNAME: name, MUTUAL: -count} for count, name in best]
+
+
+def suggest(username, limit):
+    """
+    returns up to limit friend suggestions for a user,
+    most mutual friends first, else None if the user doesn't exist
+    users with pending requests either way are left out
+    """
+    with lock:
+        if username in suggestions:
+            return suggestions[username][:limit]
+        seen = generation
+    user = dbc.fetch_one(USERS, {USERNAME: username},
+                         {INCOMING: 1, OUTGOING: 1})
+    if user is None:
+        return None
+    if not built:
+        build()
+    with lock:
+        ret = rank(username, user[INCOMING] + user[OUTGOING])
+        if seen == generation:
+            suggestions[username] = ret
+        return ret[:limit]
+
+
+def sync(username):
+    """
+    reloads one user's friends, for changes made by other processes
+    """
+    user = dbc.fetch_one(USERS, {USERNAME: username}, {FRIENDS: 1, "_id": 0})
+    with lock:
+        invalidate(username)
+        if not built:
+            return
+        if user is None:
+            remove_user(username)
+            return
+        me = node(username)
+        friends = {node(friend) for friend in user.get(FRIENDS, [])}
+        invalidate(*(names[them] for them in adjacency[me] ^ friends))
+        for them in adjacency[me] - friends:
+            adjacency[them].discard(me)
+        for them in friends - adjacency[me]:
+            adjacency[them].add(me)
+        adjacency[me] = friends
+        invalidate(username)
+
+
+def on_change(username, fields):
+    """
+    keeps the index current when the users collection changes
+    """
+    if username is None:
+        if built:
+            ci.in_background(build)
+    elif fields == ci.DELETED:
+        remove_user(username)
+    elif fields is None or FRIENDS in fields:
+        sync(username)
+    elif fields & {INCOMING, OUTGOING}:
+        invalidate(username)
+
+
+ci.register(USERS, on_change)
@@ -0,0 +1,255 @@
+"""
+This file finds and repairs references between docs that don't match up,
+as left behind when one half of a two-part write fails or a user is
+deleted: friendships and requests only one user has, likes only the user
+or only the playlist has, owned playlists that are missing or owned by
+someone else, and songs of deleted playlists.
+Each kind of reference is checked with one aggregation that lists every
+reference from both sides and groups them by pair, so only the pairs seen
+from one side come back; grouping spills to disk, so memory stays bounded
+however many references there are. Fixes are bulk written a batch at a
+time. One-sided references are dropped, except that a playlist's owner
+field wins over the owner's list of playlists. Playlists whose owner is
+gone are reported but kept.
+Run it from the project root; it only reports unless told to repair:
+`python -m db.integrity` or `python -m db.integrity --repair`
+"""
+
+import argparse
+import itertools
+import db.db_connect as dbc
+import db.data_playlists as dbp
+import db.data_users as dbu
+import db.friend_index as fi
+import db.recommend as rec
+
+OWNED = "ownedPlaylists"
+LIKED = "likedPlaylists"
+
+LEFT = "L"
+RIGHT = "R"
+BEFORE = "sizeBefore"
+
+# name: (left collection, key, field, right collection, key, field)
+# every name in a left doc's field should have a right doc whose field
+# holds the left doc's key, and the other way round
+RELATIONS = {
+    "friends": (dbu.USERS, dbu.USERNAME, dbu.FRIENDS,
+                dbu.USERS, dbu.USERNAME, dbu.FRIENDS),
+    "requests": (dbu.USERS, dbu.USERNAME, dbu.OUTGOING,
+                 dbu.USERS, dbu.USERNAME, dbu.INCOMING),
+    "likes": (dbu.USERS, dbu.USERNAME, LIKED,
+              dbp.LIKE_ITEMS, dbp.PLNAME, dbp.USERNAME),
+    "owners": (dbu.USERS, dbu.USERNAME, OWNED,
+               dbp.PLAYLISTS, dbp.PLNAME, dbp.OWNER),
+}
+# relations whose right side is the left side seen from the other end
+SYMMETRIC = {"friends"}
+# counters kept in step with the array they count
+COUNTERS = {(dbu.USERS, dbu.FRIENDS): dbu.FRIEND_COUNT}
+# right sides kept one doc per reference, with the docs they belong to
+ITEMS = {dbp.LIKE_ITEMS: (dbp.PLAYLISTS, dbp.PLNAME)}
+SONGS = "songs"
+
+BATCH = 1000
+EXAMPLES = 10
+
+DANGLING = "dangling"
+ONE_SIDED = "oneSided"
+KEPT = "kept"
+REPAIRED = "repaired"
+
+
+def one_sided(relation):
+    """
+    pipeline listing the references of a relation only one side has,
+    as {_id: {l, r}, sides: [L or R]}
+    """
+    lcoll, lkey, lfield, rcoll, rkey, rfield = RELATIONS[relation]
+    left = [{"$project": {"_id": 0, "l": f"${lkey}", "r": f"${lfield}"}},
+            {"$unwind": "$r"},
+            {"$set": {"side": LEFT}}]
+    right = [{"$project": {"_id": 0, "l": f"${rfield}", "r": f"${rkey}"}},
+             {"$unwind": "$l"},
+             {"$set": {"side": RIGHT}}]
+    seen_once = {"sides": [LEFT]} if relation in SYMMETRIC \
+        else {"sides": {"$size": 1}}
+    return left + [
+        {"$unionWith": {"coll": rcoll, "pipeline": right}},
+        {"$group": {"_id": {"l": "$l", "r": "$r"},
+                    "sides": {"$addToSet": "$side"}}},
+        {"$match": seen_once}]
+
+
+def orphan_songs():
+    """
+    pipeline listing the names of playlists that have songs but no doc
+    """
+    return [
+        {"$group": {"_id": f"${dbp.PLNAME}"}},
+        {"$set": {"side": LEFT}},
+        {"$unionWith": {"coll": dbp.PLAYLISTS, "pipeline": [
+            {"$project": {"_id": f"${dbp.PLNAME}",
+                          "side": {"$literal": RIGHT}}}]}},
+        {"$group": {"_id": "$_id", "sides": {"$addToSet": "$side"}}},
+        {"$match": {"sides": [LEFT]}}]
+
+
+def existing(collect_nm, key_nm, names):
+    """
+    which of the names have a doc, found with one query
+    """
+    if not names:
+        return set()
+    return {doc[key_nm] for doc in dbc.fetch_many(
+        collect_nm, {key_nm: {"$in": list(names)}}, {key_nm: 1, "_id": 0})}
+
+
+def rewrite(collect_nm, field, removes, adds):
+    """
+    pipeline update that takes names out of an array field and adds
+    others, keeping its order and any counter of it in step
+    """
+    current = {"$ifNull": [f"${field}", []]}
+    dropped = sorted(removes | adds)
+    keep = {"$filter": {"input": current, "cond": {
+        "$not": [{"$in": ["$$this", dropped]}]}}}
+    update = [{"$set": {BEFORE: {"$size": current}}},
+              {"$set": {field: {"$concatArrays": [keep, sorted(adds)]}}}]
+    counter = COUNTERS.get((collect_nm, field))
+    if counter is not None:
+        update.append({"$set": {counter: {"$add": [
+            {"$ifNull": [f"${counter}", 0]},
+            {"$subtract": [{"$size": f"${field}"}, f"${BEFORE}"]}]}}})
+    return update + [{"$unset": BEFORE}]
+
+
+def fixes(relation, pairs):
+    """
+    sorts a batch of one-sided references into what to repair
+    returns {(collection, key, field): {doc key: (removes, adds)}},
+    the count of each kind of problem and a few examples of them
+    """
+    lcoll, lkey, lfield, rcoll, rkey, rfield = RELATIONS[relation]
+    lefts = existing(lcoll, lkey, {pair["_id"]["l"] for pair in pairs
+                                   if pair["sides"] == [RIGHT]})
+    rights = existing(*ITEMS.get(rcoll, (rcoll, rkey)),
+                      {pair["_id"]["r"] for pair in pairs
+                       if pair["sides"] == [LEFT]})
+    changes = {}
+    found = {DANGLING: 0, ONE_SIDED: 0, KEPT: 0}
+    examples = []
+
+    def change(collect_nm, key_nm, field, name):
+        target = changes.setdefault((collect_nm, key_nm, field), {})
+        return target.setdefault(name, (set(), set()))
+
+    for pair in pairs:
+        left, right = pair["_id"]["l"], pair["_id"]["r"]
+        if pair["sides"] == [LEFT]:
+            kind = ONE_SIDED if right in rights else DANGLING
+            change(lcoll, lkey, lfield, left)[0].add(right)
+            example = f"{left} has {right} in {lfield}"
+        elif relation == "owners" and left in lefts:
+            kind = ONE_SIDED
+            change(lcoll, lkey, lfield, left)[1].add(right)
+            example = f"{left} owns {right} but doesn't list it"
+        elif relation == "owners":
+            kind = KEPT
+            example = f"{right} is owned by {left}, who doesn't exist"
+        else:
+            kind = ONE_SIDED if left in lefts else DANGLING
+            change(rcoll, rkey, rfield, right)[0].add(left)
+            example = f"{right} has {left} in {rfield}" \
+                if rcoll not in ITEMS else f"{right} has a like by {left}"
+        found[kind] += 1
+        if len(examples) < EXAMPLES:
+            examples.append(f"{kind}: {example}")
+    return changes, found, examples
+
+
+def apply(changes):
+    """
+    bulk writes a batch of repairs, one update per doc
+    stray likes are deleted and taken off their playlist's counts
+    """
+    for (collect_nm, key_nm, field), docs in changes.items():
+        if collect_nm == dbp.LIKE_ITEMS:
+            for name, (removes, _) in docs.items():
+                dbp.remove_likes(name, removes)
+            continue
+        dbc.update_each(collect_nm, [
+            ({key_nm: name}, rewrite(collect_nm, field, removes, adds))
+            for name, (removes, adds) in docs.items()])
+        if field == dbu.FRIENDS:
+            fi.reset()
+        if field == LIKED:
+            rec.mark_stale_many(list(docs))
+
+
+def check_relation(relation, repair=False, batch=BATCH):
+    """
+    finds, and if asked repairs, the one-sided references of a relation
+    returns a report of how many of each kind there were
+    """
+    lcoll = RELATIONS[relation][0]
+    report = {DANGLING: 0, ONE_SIDED: 0, KEPT: 0, REPAIRED: 0,
+              "examples": []}
+    pairs = dbc.aggregate(lcoll, one_sided(relation))
+    while chunk := list(itertools.islice(pairs, batch)):
+        changes, found, examples = fixes(relation, chunk)
+        for kind, count in found.items():
+            report[kind] += count
+        report["examples"] += examples[:EXAMPLES - len(report["examples"])]
+        if repair:
+            apply(changes)
+            report[REPAIRED] += found[DANGLING] + found[ONE_SIDED]
+    return report
+
+
+def check_songs(repair=False, batch=BATCH):
+    """
+    finds, and if asked deletes, the songs of playlists that are gone
+    """
+    report = {DANGLING: 0, REPAIRED: 0, "examples": []}
+    names = (group["_id"] for group in
+             dbc.aggregate(dbp.SONG_ITEMS, orphan_songs()))
+    while chunk := list(itertools.islice(names, batch)):
+        report[DANGLING] += len(chunk)
+        report["examples"] += [f"{DANGLING}: songs of {name}" for name in
+                               chunk[:EXAMPLES - len(report["examples"])]]
+        if repair:
+            dbc.del_matching(dbp.SONG_ITEMS, {dbp.PLNAME: {"$in": chunk}})
+            report[REPAIRED] += len(chunk)
+    return report
+
+
+def check(repair=False, batch=BATCH):
+    """
+    checks every relation, repairing them if asked
+    returns a report for each
+    """
+    report = {relation: check_relation(relation, repair, batch)
+              for relation in RELATIONS}
+    report[SONGS] = check_songs(repair, batch)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repair", action="store_true",
+                        help="fix what is found instead of only reporting")
+    parser.add_argument("--batch", type=int, default=BATCH)
+    args = parser.parse_args()
+    for relation, found in check(args.repair, args.batch).items():
+        counts = ", ".join(f"{count} {kind}" for kind, count in found.items()
+                           if kind != "examples")
+        print(f"{relation}: {counts}")
+        for example in found["examples"]:
+            print(f"    {example}")
+    if not args.repair:
+        print("Dry run, nothing was changed; rerun with --repair to fix")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+This file takes the likes of busy playlists off their playlist doc.
+A playlist's likeCount and trendScore are its base; once it is liked
+faster than GROW_RATE times a second it gets likeShards counter docs,
+and each like then goes to a random one of them, counted and added to
+the shard's own trend score, without writing the playlist at all.
+The shards double whenever the rate is passed again, up to MAX_SHARDS.
+Unlikes are rarer and take an average like out of the playlist's trend
+score, which needs its count, so they are still written to the playlist.
+Reads add the shards to likeCount, and a thread in every worker that
+writes shards folds them into likeCount and trendScore, which the top
+and trending playlists are sorted by, every FOLD_INTERVAL seconds;
+`python -m db.like_counters` folds them once.
+"""
+
+import atexit
+import random
+import threading
+import time
+from collections import Counter
+import db.db_connect as dbc
+
+PLAYLISTS = "playlists"
+COUNTERS = "likeCounters"
+PLNAME = "playlistName"
+LIKE_COUNT = "likeCount"
+TREND_SCORE = "trendScore"
+SHARDS = "likeShards"
+SHARD = "shard"
+COUNT = "count"
+
+FIRST_SHARDS = 4
+MAX_SHARDS = 64
+# likes a second on one playlist, in this process, that add shards
+GROW_RATE = 50
+RATE_WINDOW = 1.0
+# how long shard counts and sums are reused
+CACHE_TTL = 2.0
+FOLD_INTERVAL = 1.0
+
+lock = threading.Lock()
+shards = {}
+sums = {}
+writes = Counter()
+window_start = time.monotonic()
+thread = None
+stopping = threading.Event()
+
+
+def ensure_indexes():
+    """
+    one counter doc per playlist and shard
+    """
+    dbc.ensure_index(COUNTERS, [(PLNAME, 1), (SHARD, 1)], unique=True)
+
+
+def remember(playlist_name, count):
+    """
+    caches how many shards a playlist has
+    """
+    with lock:
+        shards[playlist_name] = (count, time.monotonic())
+
+
+def cached_shards(playlist_name):
+    """
+    the cached shard count of a playlist, else None
+    """
+    with lock:
+        if playlist_name in shards and \
+                time.monotonic() - shards[playlist_name][1] < CACHE_TTL:
+            return shards[playlist_name][0]
+    return None
+
+
+def shards_of(playlist_name):
+    """
+    how many shards a playlist's count is split over, 0 if it isn't
+    """
+    found = cached_shards(playlist_name)
+    if found is None:
+        doc = dbc.fetch_one(PLAYLISTS, {PLNAME: playlist_name},
+                            {SHARDS: 1, "_id": 0})
+        found = (doc or {}).get(SHARDS, 0)
+        remember(playlist_name, found)
+    return found
+
+
+def shard_for(playlist_name):
+    """
+    a random shard for a like of a playlist known to be sharded, else None
+    a playlist not known to be sharded is counted on its doc,
+    which is right either way since shards only add to it
+    """
+    count = cached_shards(playlist_name)
+    return random.randrange(count) if count else None
+
+
+def grow(playlist_name):
+    """
+    notes one like of a playlist and adds shards if it is too busy
+    """
+    global window_start
+    now = time.monotonic()
+    with lock:
+        if now - window_start > RATE_WINDOW:
+            writes.clear()
+            window_start = now
+        writes[playlist_name] += 1
+        busy = writes[playlist_name] == int(GROW_RATE * RATE_WINDOW)
+    if busy:
+        current = shards_of(playlist_name)
+        target = min(MAX_SHARDS, max(FIRST_SHARDS, current * 2))
+        if target > current:
+            dbc.update_doc(PLAYLISTS, {PLNAME: playlist_name},
+                           {"$max": {SHARDS: target}})
+            with lock:
+                shards[playlist_name] = (target, now)
+
+
+def counted(playlist_name, playlist):
+    """
+    notes a like counted on its playlist doc, as the update returned it
+    with its likeShards, or None if there was no such playlist
+    """
+    if playlist is not None:
+        remember(playlist_name, playlist.get(SHARDS, 0))
+        grow(playlist_name)
+
+
+def add(playlist_name, shard, trend):
+    """
+    counts a like in one of a playlist's shards
+    trend is the expression for the shard's trend score with it added
+    """
+    ensure_indexes()
+    dbc.update_doc(COUNTERS, {PLNAME: playlist_name, SHARD: shard},
+                   [{"$set": {COUNT: {"$add": [
+                       {"$ifNull": [f"${COUNT}", 0]}, 1]},
+                       TREND_SCORE: trend}}], upsert=True)
+    grow(playlist_name)
+    start()
+
+
+def log_sum(score, other):
+    """
+    aggregation expression for log2(2 ** score + 2 ** other), scores
+    being log2 of sums of likes, None standing for no likes
+    """
+    top = {"$max": [score, other]}
+    gap = {"$abs": {"$subtract": [score, other]}}
+    return {"$cond": [
+        {"$eq": [score, None]},
+        other,
+        {"$cond": [
+            {"$eq": [other, None]},
+            score,
+            {"$add": [top, {"$log": [{"$add": [1, {"$pow": [
+                2, {"$multiply": [-1, gap]}]}]}, 2]}]}]}]}
+
+
+def shard_sums(names):
+    """
+    the sum of the shards of each of the named playlists
+    """
+    now = time.monotonic()
+    with lock:
+        ret = {name: sums[name][0] for name in names
+               if name in sums and now - sums[name][1] < CACHE_TTL}
+    missing = [name for name in names if name not in ret]
+    if missing:
+        found = {name: 0 for name in missing}
+        total = {"$sum": f"${COUNT}"}
+        for group in dbc.aggregate(COUNTERS, [
+                {"$match": {PLNAME: {"$in": missing}}},
+                {"$group": {"_id": f"${PLNAME}", COUNT: total}}]):
+            found[group["_id"]] = group[COUNT]
+        with lock:
+            for name, count in found.items():
+                sums[name] = (count, now)
+        ret.update(found)
+    return ret
+
+
+def live_counts(playlists):
+    """
+    adds the shards of sharded playlists to their likeCount
+    """
+    sharded = [pl[PLNAME] for pl in playlists if pl.get(SHARDS)]
+    if sharded:
+        totals = shard_sums(sharded)
+        for pl in playlists:
+            if pl.get(SHARDS):
+                pl[LIKE_COUNT] = pl.get(LIKE_COUNT, 0) + totals[pl[PLNAME]]
+    return playlists
+
+
+def fold():
+    """
+    moves every shard's count and trend score into its playlist's
+    likeCount and trendScore, returns how many likes were moved
+    a shard is only taken if no like landed on it since it was read
+    """
+    moved = 0
+    for shard in dbc.fetch_iter(COUNTERS, {COUNT: {"$ne": 0}},
+                                {PLNAME: 1, SHARD: 1, COUNT: 1,
+                                 TREND_SCORE: 1, "_id": 0}):
+        trend = shard.get(TREND_SCORE)
+        taken = dbc.update_doc(COUNTERS, {PLNAME: shard[PLNAME],
+                                          SHARD: shard[SHARD],
+                                          COUNT: shard[COUNT],
+                                          TREND_SCORE: trend},
+                               {"$set": {COUNT: 0, TREND_SCORE: None}})
+        if taken.modified_count:
+            score = {"$ifNull": [f"${TREND_SCORE}", None]}
+            dbc.update_doc(PLAYLISTS, {PLNAME: shard[PLNAME]}, [{"$set": {
+                LIKE_COUNT: {"$add": [{"$ifNull": [f"${LIKE_COUNT}", 0]},
+                                      shard[COUNT]]},
+                TREND_SCORE: log_sum(score, {"$literal": trend})}}])
+            moved += shard[COUNT]
+    with lock:
+        sums.clear()
+    return moved
+
+
+def run():
+    """
+    folds the shards every FOLD_INTERVAL seconds until stopped,
+    and once more on the way out
+    """
+    while True:
+        stopped = stopping.wait(FOLD_INTERVAL)
+        try:
+            fold()
+        except Exception as err:
+            print(f"Failed to fold like shards: {err}")
+        if stopped:
+            return
+
+
+def start():
+    """
+    starts the folding thread unless it is already running
+    """
+    global thread
+    with lock:
+        if thread is not None and thread.is_alive():
+            return
+        stopping.clear()
+        thread = threading.Thread(target=run, name="like-counters",
+                                  daemon=True)
+        thread.start()
+
+
+def stop():
+    """
+    stops the folding thread after one last fold
+    """
+    stopping.set()
+    if thread is not None:
+        thread.join()
+
+
+def forget(playlist_name):
+    """
+    drops the shards of a deleted playlist
+    """
+    dbc.del_matching(COUNTERS, {PLNAME: playlist_name})
+    with lock:
+        shards.pop(playlist_name, None)
+        sums.pop(playlist_name, None)
+
+
+def reset():
+    """
+    drops every shard, for when likeCount has been recounted from likes
+    """
+    dbc.del_matching(COUNTERS, {})
+    with lock:
+        sums.clear()
+
+
+def empty():
+    """
+    empty out the counters
+    ONLY IF IN TEST_MODE
+    """
+    dbc.del_many(COUNTERS)
+    with lock:
+        shards.clear()
+        sums.clear()
+        writes.clear()
+
+
+atexit.register(stop)
+
+
+if __name__ == "__main__":
+    print(f"Folded {fold()} likes into their playlists")
@@ -0,0 +1,288 @@
+"""
+This file batches likes and unlikes when WRITE_BEHIND_LIKES is set.
+Instead of updating the playlist and the user on every like, each like
+is upserted into the likeQueue collection, one doc per user and playlist,
+and a background thread in every worker folds the queue into one update
+per playlist and per user every FLUSH_INTERVAL seconds, so thousands of
+likes on one hot playlist become one write.
+The queue lives in mongo, so every worker sees every queued like: users
+see their own straight away through overlay() whichever worker serves
+them, and likes queued by a worker that dies are written by the others.
+A flush leases the docs it takes for LEASE seconds so two workers don't
+write the same likes at once, and a write is safe to repeat: the like
+docs are read first, and the counters move by what actually changed.
+"""
+
+import atexit
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+import db.db_connect as dbc
+import db.data_playlists as dbp
+import db.feed as feed
+import db.recommend as rec
+
+USERS = "users"
+PLAYLISTS = "playlists"
+QUEUE = "likeQueue"
+USERNAME = "userName"
+PLNAME = "playlistName"
+LIKED = "likedPlaylists"
+LIKE = "liked"
+AT = "at"
+VERSION = "version"
+UNTIL = "until"
+OWNER = "owner"
+
+FLUSH_INTERVAL = 1.0
+# likes one flush takes, and how long others leave them to it
+BATCH = 1000
+LEASE = 60
+
+lock = threading.Lock()
+flush_lock = threading.Lock()
+thread = None
+stopping = threading.Event()
+
+
+def enabled():
+    """
+    whether likes are queued rather than written straight away
+    """
+    return bool(os.environ.get("WRITE_BEHIND_LIKES", ''))
+
+
+def ensure_indexes():
+    """
+    one queued change per user and playlist, found by age or by owner
+    """
+    dbc.ensure_index(QUEUE, [(USERNAME, 1), (PLNAME, 1)], unique=True)
+    dbc.ensure_index(QUEUE, [(UNTIL, 1), (AT, 1)])
+    dbc.ensure_index(QUEUE, [(OWNER, 1)])
+
+
+def enqueue(username, playlist_name, liked):
+    """
+    queues a like, or an unlike if liked is False
+    a later like or unlike of the same playlist by the same user
+    replaces it, so only the last one is written
+    """
+    ensure_indexes()
+    dbc.update_doc(QUEUE, {USERNAME: username, PLNAME: playlist_name},
+                   {"$set": {LIKE: liked, AT: time.time()},
+                    "$inc": {VERSION: 1}, "$setOnInsert": {UNTIL: 0}},
+                   upsert=True)
+    start()
+
+
+def pending_like(username, playlist_name):
+    """
+    the queued like (True) or unlike (False) of a playlist, else None
+    """
+    doc = dbc.fetch_one(QUEUE, {USERNAME: username, PLNAME: playlist_name},
+                        {LIKE: 1, "_id": 0})
+    return None if doc is None else doc[LIKE]
+
+
+def overlay(username, liked):
+    """
+    a user's liked playlists with their queued likes and unlikes applied
+    """
+    changes = {doc[PLNAME]: doc[LIKE] for doc in dbc.fetch_many(
+        QUEUE, {USERNAME: username}, {PLNAME: 1, LIKE: 1, "_id": 0})}
+    ret = [pl for pl in liked if changes.get(pl, True)]
+    return ret + [pl for pl, like in changes.items()
+                  if like and pl not in liked]
+
+
+def liked_by(playlist_name, username):
+    """
+    whether a user likes a playlist counting their own queued like or
+    unlike, None if the playlist doesn't exist
+    """
+    liked = dbp.liked_by(playlist_name, username)
+    like = pending_like(username, playlist_name)
+    return liked if like is None or liked is None else like
+
+
+def merge(field, adds, removes):
+    """
+    pipeline update that adds and removes names from an array field
+    """
+    current = {"$ifNull": [f"${field}", []]}
+    return [{"$set": {field: {"$setUnion": [
+        {"$setDifference": [current, {"$literal": sorted(removes)}]},
+        {"$literal": sorted(adds)}]}}}]
+
+
+def already_liked(by_playlist):
+    """
+    the (user, playlist) pairs of a batch that are already liked,
+    read from the like docs with one query
+    """
+    return {(doc[USERNAME], doc[PLNAME]) for doc in dbc.fetch_many(
+        dbp.LIKE_ITEMS, {"$or": [
+            {PLNAME: name, USERNAME: {"$in": sorted(adds | removes)}}
+            for name, (adds, removes) in by_playlist.items()]},
+        {USERNAME: 1, PLNAME: 1, "_id": 0})}
+
+
+def write(batch):
+    """
+    writes a batch of likes with one update per playlist and per user
+    only likes of playlists that exist and aren't there already are
+    stored, and only unlikes of ones that were are deleted; likeCount
+    and the trend score move by those, so writing a batch again changes
+    nothing
+    the new likes go to the feed, in one batch, and with the unlikes to
+    the co-like counts
+    """
+    if not batch:
+        return
+    by_playlist = defaultdict(lambda: (set(), set()))
+    by_user = defaultdict(lambda: (set(), set()))
+    for (username, playlist_name), like in batch.items():
+        by_playlist[playlist_name][0 if like else 1].add(username)
+        by_user[username][0 if like else 1].add(playlist_name)
+    before = already_liked(by_playlist)
+    live = {doc[PLNAME] for doc in dbc.fetch_in(
+        PLAYLISTS, PLNAME, list(by_playlist), {PLNAME: 1, "_id": 0})}
+    changed = defaultdict(lambda: (set(), set()))
+    counts = defaultdict(lambda: [0, 0])
+    for (username, playlist_name), like in batch.items():
+        if playlist_name in live and \
+                like != ((username, playlist_name) in before):
+            changed[username][0 if like else 1].add(playlist_name)
+            counts[playlist_name][0 if like else 1] += 1
+    dbp.ensure_like_indexes()
+    dbc.insert_docs(dbp.LIKE_ITEMS, [
+        {PLNAME: playlist_name, USERNAME: name}
+        for name, (adds, _) in changed.items()
+        for playlist_name in sorted(adds)])
+    gone = [{USERNAME: name, PLNAME: {"$in": sorted(removes)}}
+            for name, (_, removes) in changed.items() if removes]
+    if gone:
+        dbc.del_matching(dbp.LIKE_ITEMS, {"$or": gone})
+    dbc.update_each(PLAYLISTS, [
+        ({PLNAME: name}, dbp.count_update(added, removed))
+        for name, (added, removed) in counts.items()])
+    dbc.update_each(USERS, [
+        ({USERNAME: name}, merge(LIKED, adds & live, removes))
+        for name, (adds, removes) in by_user.items()])
+    rec.mark_stale_many(list(by_user))
+    now = {doc[USERNAME]: doc.get(LIKED, []) for doc in dbc.fetch_in(
+        USERS, USERNAME, list(changed), {USERNAME: 1, LIKED: 1, "_id": 0})}
+    rec.count_likes([(now[name], adds, removes)
+                     for name, (adds, removes) in changed.items()
+                     if name in now])
+    feed.record_many([(name, feed.LIKED, playlist_name, None)
+                      for name, (adds, _) in changed.items()
+                      for playlist_name in sorted(adds)])
+
+
+def claim():
+    """
+    leases up to about BATCH of the oldest queued likes no other flush
+    holds, returns the lease's owner token and the docs it got
+    """
+    ensure_indexes()
+    token = uuid.uuid4().hex
+    now = time.time()
+    free = {UNTIL: {"$lt": now}}
+    edge = dbc.fetch_many(QUEUE, free, {AT: 1, "_id": 0}, sort=[(AT, 1)],
+                          skip=BATCH - 1, limit=1)
+    oldest = {AT: {"$lte": edge[0][AT]}} if edge else {}
+    dbc.update_many(QUEUE, {**free, **oldest},
+                    {"$set": {UNTIL: now + LEASE, OWNER: token}})
+    return token, dbc.fetch_many(QUEUE, {OWNER: token},
+                                 {USERNAME: 1, PLNAME: 1, LIKE: 1,
+                                  VERSION: 1, "_id": 0})
+
+
+def finish(token, docs):
+    """
+    drops the leased docs that were written, and hands back the ones
+    liked or unliked again since, for the next flush to write
+    """
+    if docs:
+        dbc.del_matching(QUEUE, {"$or": [
+            {USERNAME: doc[USERNAME], PLNAME: doc[PLNAME],
+             VERSION: doc[VERSION]} for doc in docs]})
+    release(token)
+
+
+def release(token):
+    """
+    ends a lease early
+    """
+    dbc.update_many(QUEUE, {OWNER: token},
+                    {"$set": {UNTIL: 0}, "$unset": {OWNER: ""}})
+
+
+def flush():
+    """
+    writes a batch of queued likes, returns how many there were
+    if writing fails they stay queued for the next flush
+    """
+    with flush_lock:
+        token, docs = claim()
+        try:
+            write({(doc[USERNAME], doc[PLNAME]): doc[LIKE] for doc in docs})
+        except Exception:
+            release(token)
+            raise
+        finish(token, docs)
+        return len(docs)
+
+
+def run():
+    """
+    flushes the queue every FLUSH_INTERVAL seconds until stopped,
+    and once more on the way out
+    a flush that comes back full is followed straight away by another
+    """
+    while True:
+        stopped = stopping.wait(FLUSH_INTERVAL)
+        try:
+            while flush() >= BATCH and not stopping.is_set():
+                pass
+        except Exception as err:
+            print(f"Failed to write queued likes: {err}")
+        if stopped:
+            return
+
+
+def start():
+    """
+    starts the flushing thread unless it is already running
+    """
+    global thread
+    with lock:
+        if thread is not None and thread.is_alive():
+            return
+        stopping.clear()
+        thread = threading.Thread(target=run, name="like-queue",
+                                  daemon=True)
+        thread.start()
+
+
+def stop():
+    """
+    stops the flushing thread after one last flush
+    """
+    stopping.set()
+    if thread is not None:
+        thread.join()
+
+
+def empty():
+    """
+    empty out the queue
+    ONLY IF IN TEST_MODE
+    """
+    dbc.del_many(QUEUE)
+
+
+atexit.register(stop)
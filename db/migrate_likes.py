@@ -0,0 +1,40 @@
+"""
+One-off job that moves likes out of the likes array on older playlists
+and into the playlistLikes collection, one doc per user and playlist.
+Run it from the project root with `python -m db.migrate_likes`
+It is safe to run again if it is interrupted.
+"""
+
+import db.db_connect as dbc
+import db.data_playlists as dbp
+
+
+def migrate_playlist(pl_name, likes):
+    """
+    moves one playlist's embedded likes, skipping any already moved
+    """
+    dbc.insert_docs(dbp.LIKE_ITEMS, [{dbp.PLNAME: pl_name,
+                                      dbp.USERNAME: username}
+                                     for username in dict.fromkeys(likes)])
+    n_likes = dbc.count(dbp.LIKE_ITEMS, {dbp.PLNAME: pl_name})
+    dbc.update_doc(dbp.PLAYLISTS, {dbp.PLNAME: pl_name},
+                   {"$unset": {dbp.LIKES: ""},
+                    "$set": {dbp.LIKE_COUNT: n_likes}})
+
+
+def migrate():
+    """
+    moves the likes of every playlist that still embeds them
+    returns how many playlists were migrated
+    """
+    dbp.ensure_like_indexes()
+    moved = 0
+    for pl in dbc.fetch_iter(dbp.PLAYLISTS, {dbp.LIKES: {"$exists": True}},
+                             {dbp.PLNAME: 1, dbp.LIKES: 1, "_id": 0}):
+        migrate_playlist(pl[dbp.PLNAME], pl[dbp.LIKES])
+        moved += 1
+    return moved
+
+
+if __name__ == "__main__":
+    print(f"Migrated the likes of {migrate()} playlists")
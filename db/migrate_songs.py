@@ -0,0 +1,43 @@
+"""
+One-off job that moves songs out of the songs array on older playlists
+and into the playlistSongs collection, keeping their order.
+Run it from the project root with `python -m db.migrate_songs`
+It is safe to run again if it is interrupted.
+"""
+
+import db.db_connect as dbc
+import db.data_playlists as dbp
+
+
+def migrate_playlist(pl_name, songs):
+    """
+    moves one playlist's embedded songs after any it already has
+    """
+    start = dbc.update_and_fetch(dbp.PLAYLISTS, {dbp.PLNAME: pl_name},
+                                 {"$inc": {dbp.SONG_SEQ: len(songs)}},
+                                 {dbp.SONG_SEQ: 1})[dbp.SONG_SEQ] - len(songs)
+    dbc.insert_docs(dbp.SONG_ITEMS, [{dbp.PLNAME: pl_name, dbp.SONG: song,
+                                      dbp.POS: float(start + i)}
+                                     for i, song in enumerate(songs, 1)])
+    n_songs = dbc.count(dbp.SONG_ITEMS, {dbp.PLNAME: pl_name})
+    dbc.update_doc(dbp.PLAYLISTS, {dbp.PLNAME: pl_name},
+                   {"$unset": {dbp.SONGS: ""},
+                    "$set": {dbp.SONG_COUNT: n_songs}})
+
+
+def migrate():
+    """
+    moves the songs of every playlist that still embeds them
+    returns how many playlists were migrated
+    """
+    dbp.ensure_song_indexes()
+    moved = 0
+    for pl in dbc.fetch_iter(dbp.PLAYLISTS, {dbp.SONGS: {"$exists": True}},
+                             {dbp.PLNAME: 1, dbp.SONGS: 1, "_id": 0}):
+        migrate_playlist(pl[dbp.PLNAME], pl[dbp.SONGS])
+        moved += 1
+    return moved
+
+
+if __name__ == "__main__":
+    print(f"Migrated the songs of {migrate()} playlists")
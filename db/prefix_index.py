@@ -0,0 +1,225 @@
+"""
+This file keeps every username in memory, sorted, for search-as-you-type.
+Matching is by case-insensitive prefix: the names with a prefix sit next
+to each other in the sorted order, so two binary searches find them and
+only the first few are decoded.
+The names are packed into one utf-8 byte string with an array of where
+each one starts, so a name costs its bytes and four more rather than
+a str object of its own.
+Names added or removed since it was packed are kept on the side, and
+folded in by a background repack once there are REPACK_AT of them.
+It is loaded on start or first use and kept current by add_user and
+del_user, and by the change stream for other workers' changes.
+"""
+
+import bisect
+import heapq
+import itertools
+import threading
+from array import array
+import db.db_connect as dbc
+import db.cache_invalidation as ci
+
+USERS = "users"
+USERNAME = "userName"
+
+REPACK_AT = 4096
+
+lock = threading.Lock()
+blob = b""
+# where each packed name starts in blob, and where the last one ends
+starts = array("I", [0])
+# (key, name) of names added since the last pack, sorted
+recent = []
+removed = set()
+built = False
+building = False
+packing = False
+
+
+def key(name):
+    """
+    what names are sorted and matched by
+    """
+    return name.casefold()
+
+
+def pack(names):
+    """
+    packs names, already sorted by key, into a blob and its offsets
+    """
+    encoded = [name.encode() for name in names]
+    offsets = array("I", [0])
+    offsets.extend(itertools.accumulate(map(len, encoded)))
+    return b"".join(encoded), offsets
+
+
+def packed_name(i, packed=None, offsets=None):
+    """
+    the i-th packed name
+    """
+    packed = blob if packed is None else packed
+    offsets = starts if offsets is None else offsets
+    return packed[offsets[i]:offsets[i + 1]].decode()
+
+
+def first_at_least(prefix):
+    """
+    the position of the first packed name whose key isn't below prefix
+    """
+    low, high = 0, len(starts) - 1
+    while low < high:
+        mid = (low + high) // 2
+        if key(packed_name(mid)) < prefix:
+            low = mid + 1
+        else:
+            high = mid
+    return low
+
+
+def load(names):
+    """
+    replaces the index with names
+    changes recorded while they were being read are kept on top
+    """
+    global blob, starts, built, building
+    # sorting by name, then stably by key, orders by (key, name)
+    ordered = sorted(sorted(set(names)), key=key)
+    packed, offsets = pack(ordered)
+    with lock:
+        blob, starts = packed, offsets
+        built = True
+        building = False
+
+
+def build():
+    """
+    loads every username from the users collection
+    the old names keep being served until the new ones are in
+    """
+    global building
+    with lock:
+        building = True
+    try:
+        load(user[USERNAME] for user in
+             dbc.fetch_iter(USERS, {}, {USERNAME: 1, "_id": 0}))
+    finally:
+        with lock:
+            building = False
+
+
+def reset():
+    """
+    throws the index away, it is rebuilt on next use
+    """
+    global built, blob, starts
+    with lock:
+        built = False
+        blob, starts = b"", array("I", [0])
+        recent.clear()
+        removed.clear()
+
+
+def repack():
+    """
+    folds the names added and removed since the last pack into it,
+    outside the lock, then drops the changes it folded in
+    """
+    global blob, starts, packing
+    with lock:
+        packed, offsets = blob, starts
+        adds = list(recent)
+        drops = set(removed)
+    old = ((key(name), name) for name in
+           (packed_name(i, packed, offsets) for i in range(len(offsets) - 1))
+           if name not in drops)
+    names = [name for name, group in itertools.groupby(
+        name for sort_key, name in heapq.merge(old, adds))]
+    packed, offsets = pack(names)
+    folded = set(adds)
+    with lock:
+        blob, starts = packed, offsets
+        recent[:] = [entry for entry in recent if entry not in folded]
+        removed.difference_update(drops)
+        packing = False
+
+
+def changed():
+    """
+    starts a repack once enough changes have piled up
+    call with the lock held
+    """
+    global packing
+    if built and not packing and len(recent) + len(removed) >= REPACK_AT:
+        packing = True
+        threading.Thread(target=repack, name="prefix-repack",
+                         daemon=True).start()
+
+
+def add(username):
+    """
+    records a new username
+    """
+    with lock:
+        if not (built or building):
+            return
+        removed.discard(username)
+        entry = (key(username), username)
+        spot = bisect.bisect_left(recent, entry)
+        if spot == len(recent) or recent[spot] != entry:
+            recent.insert(spot, entry)
+        changed()
+
+
+def remove(username):
+    """
+    records that a username is gone
+    """
+    with lock:
+        if not (built or building):
+            return
+        entry = (key(username), username)
+        spot = bisect.bisect_left(recent, entry)
+        if spot < len(recent) and recent[spot] == entry:
+            del recent[spot]
+        removed.add(username)
+        changed()
+
+
+def complete(prefix, limit):
+    """
+    up to limit usernames starting with prefix, ignoring case,
+    in alphabetical order
+    """
+    if not built:
+        build()
+    prefix = key(prefix)
+    with lock:
+        packed = (packed_name(i) for i in
+                  range(first_at_least(prefix), len(starts) - 1))
+        matches = heapq.merge(
+            ((key(name), name) for name in packed),
+            itertools.islice(recent, bisect.bisect_left(recent, (prefix,)),
+                             None))
+        names = (name for sort_key, name in itertools.takewhile(
+            lambda entry: entry[0].startswith(prefix), matches)
+            if name not in removed)
+        return [name for name, group in
+                itertools.islice(itertools.groupby(names), limit)]
+
+
+def on_change(username, fields):
+    """
+    keeps the index current when the users collection changes
+    a username never changes, so only inserts and deletes matter
+    """
+    if username is None:
+        if built:
+            ci.in_background(build)
+    elif fields == ci.DELETED:
+        remove(username)
+    elif fields is None:
+        add(username)
+
+
+ci.register(USERS, on_change)
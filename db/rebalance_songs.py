@@ -0,0 +1,25 @@
+"""
+Job that renumbers the song positions of every playlist
+flagged as running out of room between positions.
+Run it from the project root with `python -m db.rebalance_songs`
+"""
+
+import db.db_connect as dbc
+import db.data_playlists as dbp
+
+
+def rebalance_flagged():
+    """
+    renumbers every flagged playlist
+    returns how many were renumbered
+    """
+    done = 0
+    for pl in dbc.fetch_iter(dbp.PLAYLISTS, {dbp.REBALANCE: True},
+                             {dbp.PLNAME: 1, "_id": 0}):
+        dbp.rebalance(pl[dbp.PLNAME])
+        done += 1
+    return done
+
+
+if __name__ == "__main__":
+    print(f"Rebalanced {rebalance_flagged()} playlists")
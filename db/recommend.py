@@ -0,0 +1,360 @@
+"""
+This file builds playlist recommendations from the likes users have made.
+A rebuild works out which playlists are liked by the same people and
+stores each playlist's closest neighbors; the pairs are counted by mongo
+into the coLikes collection, so no worker holds them all in memory.
+Between rebuilds each like and unlike moves the pair counts it changes
+and patches the neighbors of the playlists involved; the rebuild then
+corrects what patching leaves out, the slight drift of playlists that
+merely have a liked playlist among their neighbors. It runs from
+`python -m db.recommend`, or with RECOMMEND_EVERY set, every that many
+seconds in whichever worker takes the turn first.
+A user's picks are scored from their likes' neighbors when first asked for
+and kept until the user likes or unlikes something.
+"""
+
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from collections import Counter
+from pymongo.errors import PyMongoError
+import db.db_connect as dbc
+
+USERS = "users"
+USERNAME = "userName"
+PLNAME = "playlistName"
+LIKED = "likedPlaylists"
+OWNED = "ownedPlaylists"
+
+SIMILAR = "similarPlaylists"
+RECOMMENDATIONS = "recommendations"
+CO_LIKES = "coLikes"
+JOBS = "jobs"
+NEIGHBORS = "similar"
+PICKS = "playlists"
+SCORE = "score"
+STALE = "stale"
+BUILT = "built"
+FIRST = "first"
+SECOND = "second"
+COUNT = "count"
+JOB = "job"
+REBUILD = "recommend"
+NEXT = "next"
+
+MAX_NEIGHBORS = 50
+MAX_PICKS = 50
+MAX_USER_LIKES = 500
+BATCH = 1000
+# how often a worker checks whether a scheduled rebuild is due
+CHECK_EVERY = 60
+
+thread = None
+stopping = threading.Event()
+
+
+def co_likes():
+    """
+    has mongo count how many users liked each pair of playlists into
+    the coLikes collection, the group stage spilling to disk if need be
+    a playlist paired with itself counts the users who liked it
+    a user's likes past MAX_USER_LIKES are ignored to bound the work
+    """
+    liked = {"$slice": [{"$ifNull": [f"${LIKED}", []]}, MAX_USER_LIKES]}
+    for done in dbc.aggregate(USERS, [
+            {"$project": {"_id": 0, FIRST: liked, SECOND: liked}},
+            {"$unwind": f"${FIRST}"},
+            {"$unwind": f"${SECOND}"},
+            {"$group": {"_id": {FIRST: f"${FIRST}", SECOND: f"${SECOND}"},
+                        COUNT: {"$sum": 1}}},
+            {"$project": {"_id": 0, FIRST: f"$_id.{FIRST}",
+                          SECOND: f"$_id.{SECOND}", COUNT: 1}},
+            {"$out": CO_LIKES}]):
+        pass
+    ensure_indexes()
+
+
+def ensure_indexes():
+    """
+    one count per pair, found by its first playlist
+    """
+    dbc.ensure_index(CO_LIKES, [(FIRST, 1), (SECOND, 1)], unique=True)
+
+
+def likers():
+    """
+    how many users liked each playlist, from the counted pairs
+    """
+    return {pair[FIRST]: pair[COUNT] for pair in dbc.fetch_iter(
+        CO_LIKES, {"$expr": {"$eq": [f"${FIRST}", f"${SECOND}"]}},
+        {"_id": 0})}
+
+
+def neighbors(counts):
+    """
+    yields each playlist's MAX_NEIGHBORS most similar playlists
+    using the cosine similarity of the sets of users who liked them
+    counts are likers(); the pairs are read one playlist at a time
+    """
+    pairs = dbc.fetch_iter(CO_LIKES, {}, {"_id": 0}, sort=[(FIRST, 1)])
+    for name, together in itertools.groupby(pairs, lambda p: p[FIRST]):
+        scored = ((pair[COUNT] / math.sqrt(counts[name]
+                                           * counts[pair[SECOND]]),
+                   pair[SECOND])
+                  for pair in together if pair[SECOND] != name)
+        best = heapq.nlargest(MAX_NEIGHBORS, scored)
+        if best:
+            yield name, [[other, round(sim, 4)] for sim, other in best]
+
+
+def rebuild():
+    """
+    recomputes the neighbor table from scratch
+    and marks every stored recommendation as stale
+    returns how many playlists have neighbors
+    """
+    co_likes()
+    stamp = time.time()
+    found = 0
+    batch = []
+    for name, similar in neighbors(likers()):
+        batch.append({PLNAME: name, NEIGHBORS: similar, BUILT: stamp})
+        found += 1
+        if len(batch) == BATCH:
+            dbc.replace_docs(SIMILAR, PLNAME, batch)
+            batch = []
+    dbc.replace_docs(SIMILAR, PLNAME, batch)
+    dbc.del_matching(SIMILAR, {BUILT: {"$ne": stamp}})
+    dbc.update_many(RECOMMENDATIONS, {}, {"$set": {STALE: True}})
+    return found
+
+
+def pair_changes(liked, added, removed):
+    """
+    how a user's likes moving from before to liked change each ordered
+    pair's count, a playlist paired with itself included
+    """
+    before = (set(liked) - set(added)) | set(removed)
+    delta = Counter()
+    for names, moved, step in ((liked, added, 1), (before, removed, -1)):
+        for first in moved:
+            for second in names:
+                delta[first, second] += step
+                if second not in moved:
+                    delta[second, first] += step
+    return delta
+
+
+def count_likes(changes):
+    """
+    moves the pair counts by users' new and dropped likes, given as
+    (likes now, added, removed) for each user, in one bulk write, then
+    patches the neighbors of the playlists whose similarity changed
+    users with more than MAX_USER_LIKES likes are left to the rebuild,
+    which only counts their first ones
+    """
+    delta = Counter()
+    touched = set()
+    affected = set()
+    for liked, added, removed in changes:
+        if len(set(liked) | set(removed)) > MAX_USER_LIKES:
+            continue
+        delta.update(pair_changes(liked, added, removed))
+        touched.update(added, removed)
+        affected.update(liked, removed)
+    if not touched:
+        return
+    ensure_indexes()
+    dbc.update_each(CO_LIKES, [({FIRST: first, SECOND: second},
+                                {"$inc": {COUNT: step}})
+                               for (first, second), step in delta.items()
+                               if step], upsert=True)
+    patch(touched, affected, delta)
+
+
+def patch(touched, affected, delta):
+    """
+    rewrites the neighbors of the touched playlists and of the playlists
+    liked alongside them from the pair counts as they are now
+    a touched playlist's other neighbors are rescaled by its new likers
+    two likes patching the same playlist at once may lose one patch
+    until the next rebuild
+    """
+    affected = sorted(affected)
+    counts = {(pair[FIRST], pair[SECOND]): pair[COUNT]
+              for pair in dbc.fetch_many(
+                  CO_LIKES, {FIRST: {"$in": sorted(touched)},
+                             SECOND: {"$in": affected}}, {"_id": 0})}
+    users = {pair[FIRST]: pair[COUNT] for pair in dbc.fetch_many(
+        CO_LIKES, {FIRST: {"$in": affected},
+                   "$expr": {"$eq": [f"${FIRST}", f"${SECOND}"]}},
+        {"_id": 0})}
+    similar = {doc[PLNAME]: dict(doc[NEIGHBORS]) for doc in dbc.fetch_in(
+        SIMILAR, PLNAME, affected, {PLNAME: 1, NEIGHBORS: 1, "_id": 0})}
+    for name in touched:
+        now = users.get(name, 0)
+        before = now - delta[name, name]
+        scale = math.sqrt(before / now) if before > 0 and now > 0 else 1
+        similar[name] = {other: sim * scale for other, sim
+                         in similar.get(name, {}).items()}
+        for other in affected:
+            if other == name:
+                continue
+            together = counts.get((name, other), 0)
+            sim = (together / math.sqrt(now * users[other])
+                   if together > 0 and now > 0 and users.get(other) else 0)
+            for one, two in ((name, other), (other, name)):
+                if sim:
+                    similar.setdefault(one, {})[two] = sim
+                else:
+                    similar.setdefault(one, {}).pop(two, None)
+    dbc.update_each(SIMILAR, [
+        ({PLNAME: name}, {"$set": {NEIGHBORS: [
+            [other, round(sim, 4)] for sim, other in heapq.nlargest(
+                MAX_NEIGHBORS, ((sim, other) for other, sim
+                                in near.items()))]}})
+        for name, near in similar.items()], upsert=True)
+
+
+def count_like(username, playlist_name, liked):
+    """
+    count_likes for one user's like, or unlike if liked is False,
+    once it is written
+    """
+    user = dbc.fetch_one(USERS, {USERNAME: username}, {LIKED: 1, "_id": 0})
+    if user is None:
+        return
+    moved = {playlist_name}
+    count_likes([(user.get(LIKED, []), moved if liked else set(),
+                  set() if liked else moved)])
+
+
+def every():
+    """
+    seconds between scheduled rebuilds, 0 if they aren't scheduled
+    """
+    return float(os.environ.get("RECOMMEND_EVERY", 0) or 0)
+
+
+def take_turn(interval):
+    """
+    claims the scheduled rebuild if it is due, so one worker runs it
+    returns whether this one should
+    """
+    dbc.ensure_index(JOBS, [(JOB, 1)], unique=True)
+    dbc.insert_new(JOBS, {JOB: REBUILD, NEXT: 0})
+    now = time.time()
+    taken = dbc.update_doc(JOBS, {JOB: REBUILD, NEXT: {"$lte": now}},
+                           {"$set": {NEXT: now + interval}})
+    return taken.modified_count == 1
+
+
+def run(interval):
+    """
+    rebuilds whenever it is this worker's turn until stopped
+    """
+    while not stopping.wait(min(interval, CHECK_EVERY)):
+        try:
+            if take_turn(interval):
+                print(f"Found neighbors for {rebuild()} playlists")
+        except (PyMongoError, dbc.DatabaseUnavailable) as err:
+            print(f"Failed to rebuild recommendations: {err}")
+
+
+def start():
+    """
+    schedules rebuilds every RECOMMEND_EVERY seconds
+    """
+    global thread
+    if thread is not None and thread.is_alive():
+        return
+    stopping.clear()
+    thread = threading.Thread(target=run, args=(every(),),
+                              name="recommend", daemon=True)
+    thread.start()
+
+
+def stop():
+    """
+    stops the scheduled rebuilds
+    """
+    stopping.set()
+    if thread is not None:
+        thread.join()
+
+
+def mark_stale(username):
+    """
+    makes a user's picks get rescored the next time they're asked for
+    """
+    dbc.update_doc(RECOMMENDATIONS, {USERNAME: username},
+                   {"$set": {STALE: True}})
+
+
+def mark_stale_many(usernames):
+    """
+    mark_stale for many users in one write
+    """
+    dbc.update_many(RECOMMENDATIONS, {USERNAME: {"$in": usernames}},
+                    {"$set": {STALE: True}})
+
+
+def forget(username):
+    """
+    drops the stored picks of a deleted user
+    """
+    dbc.del_one(RECOMMENDATIONS, {USERNAME: username})
+
+
+def score(liked, skip):
+    """
+    adds up the similarity of every neighbor of the liked playlists
+    returns the MAX_PICKS best playlists that aren't in skip
+    """
+    scores = Counter()
+    for doc in dbc.fetch_many(SIMILAR, {PLNAME: {"$in": liked}},
+                              {NEIGHBORS: 1, "_id": 0}):
+        for name, sim in doc[NEIGHBORS]:
+            if name not in skip:
+                scores[name] += sim
+    best = heapq.nsmallest(MAX_PICKS, ((-total, name) for name, total
+                                       in scores.items()))
+    return [{PLNAME: name, SCORE: round(-total, 4)} for total, name in best]
+
+
+def recommend(username, limit):
+    """
+    returns up to limit recommended playlists for a user, best first,
+    else None if the user doesn't exist
+    playlists the user already likes or owns are left out
+    """
+    dbc.ensure_index(RECOMMENDATIONS, [(USERNAME, 1)], unique=True)
+    dbc.ensure_index(SIMILAR, [(PLNAME, 1)], unique=True)
+    stored = dbc.fetch_one(RECOMMENDATIONS, {USERNAME: username})
+    if stored is not None and not stored[STALE]:
+        return stored[PICKS][:limit]
+    user = dbc.fetch_one(USERS, {USERNAME: username}, {LIKED: 1, OWNED: 1})
+    if user is None:
+        return None
+    picks = score(user[LIKED], set(user[LIKED]) | set(user[OWNED]))
+    dbc.update_doc(RECOMMENDATIONS, {USERNAME: username},
+                   {"$set": {PICKS: picks, STALE: False}}, upsert=True)
+    return picks[:limit]
+
+
+def empty():
+    """
+    empty out the neighbor table and stored picks
+    ONLY IF IN TEST_MODE
+    """
+    dbc.del_many(SIMILAR)
+    dbc.del_many(RECOMMENDATIONS)
+    dbc.del_many(CO_LIKES)
+    dbc.del_many(JOBS)
+
+
+if __name__ == "__main__":
+    print(f"Found neighbors for {rebuild()} playlists")
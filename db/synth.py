@@ -0,0 +1,280 @@
+"""
+This file makes a large, realistic and repeatable dataset for load tests.
+The same seed and settings always give the same users, friendships,
+requests, playlists, likes and songs. Friend counts follow a power law,
+so a few users have thousands of friends and most have a handful;
+likes and songs follow Zipf's law, so a few playlists and songs take
+most of them. Docs have the same shape as the ones the app writes.
+Run it from the project root, into the database with bulk inserts:
+`python -m db.synth --users 1000000 --seed 1`
+or into NDJSON files that `python -m db.bulk_io import` can load later:
+`python -m db.synth --users 1000000 --seed 1 --out synth/`
+"""
+
+import argparse
+import gzip
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import db.bulk_io as bio
+import db.data_playlists as dbp
+import db.data_users as dbu
+
+PASSWORD = "password"
+
+# tail exponent of the friend count distribution
+FRIEND_EXPONENT = 2.2
+AVG_FRIENDS = 10
+# share of sampled pairs left as pending friend requests
+REQUEST_SHARE = 0.1
+PLAYLISTS_PER_USER = 0.3
+LIKES_PER_USER = 5
+LIKE_SKEW = 1.1
+# songs per playlist are this many times a Pareto draw, up to MAX_SONGS
+MIN_SONGS = 5
+SONG_TAIL = 1.5
+MAX_SONGS = 500
+CATALOG = 100000
+SONG_SKEW = 1.0
+
+WORDS = ["blue", "late", "night", "summer", "drive", "rain", "gold",
+         "quiet", "city", "wild", "slow", "neon", "lost", "sun", "road",
+         "dream", "cold", "fire", "vinyl", "echo", "river", "static"]
+
+
+def zipf_weights(count, skew):
+    """
+    cumulative weights of ranks 1 to count under Zipf's law
+    """
+    return list(itertools.accumulate(1 / rank ** skew
+                                     for rank in range(1, count + 1)))
+
+
+def power_weights(count, exponent, rng):
+    """
+    cumulative weights whose draws give each index a share of pairs that
+    follows a power law with the exponent, shuffled so hubs are spread out
+    """
+    weights = [(rank + 1) ** (-1 / (exponent - 1)) for rank in range(count)]
+    rng.shuffle(weights)
+    return list(itertools.accumulate(weights))
+
+
+def names(prefix, count, rng):
+    """
+    readable unique names, two words and the index
+    """
+    return [f"{prefix}{rng.choice(WORDS)}{rng.choice(WORDS).title()}{i}"
+            for i in range(count)]
+
+
+def build(users, seed, avg_friends=AVG_FRIENDS,
+          playlists_per_user=PLAYLISTS_PER_USER,
+          likes_per_user=LIKES_PER_USER):
+    """
+    makes everything but the songs for a dataset of users
+    returns a dict of the user and playlist names, and for every user
+    and playlist the indexes of their friends, requests, owners and likes
+    """
+    rng = random.Random(seed)
+    ids = range(users)
+    user_names = names("", users, rng)
+    activity = power_weights(users, FRIEND_EXPONENT, rng)
+    friends = [[] for i in ids]
+    outgoing = {}
+    incoming = {}
+    pairs = users * avg_friends // 2
+    ends = rng.choices(ids, cum_weights=activity, k=2 * pairs)
+    for user, other in zip(ends[::2], ends[1::2]):
+        if user == other:
+            continue
+        if rng.random() < REQUEST_SHARE:
+            outgoing.setdefault(user, []).append(other)
+            incoming.setdefault(other, []).append(user)
+        else:
+            friends[user].append(other)
+            friends[other].append(user)
+    del ends
+    count = int(users * playlists_per_user)
+    playlist_names = names("", count, rng)
+    owners = rng.choices(ids, cum_weights=activity, k=count)
+    popularity = list(range(count))
+    rng.shuffle(popularity)
+    likes = [[] for i in range(count)]
+    liked = rng.choices(popularity, cum_weights=zipf_weights(count,
+                                                             LIKE_SKEW),
+                        k=int(users * likes_per_user)) if count else []
+    for playlist in liked:
+        likes[playlist].append(rng.randrange(users))
+    return {"seed": seed, "users": user_names, "friends": friends,
+            "outgoing": outgoing, "incoming": incoming,
+            "playlists": playlist_names, "owners": owners, "likes": likes}
+
+
+def user_docs(world):
+    """
+    yields a users doc for every user, like the ones add_user makes
+    a pair that is both friends and requested is kept as friends,
+    and a pair that requested each other is dropped
+    """
+    users = world["users"]
+    owned = [[] for name in users]
+    for playlist, owner in enumerate(world["owners"]):
+        owned[owner].append(playlist)
+    liked = [[] for name in users]
+    for playlist, fans in enumerate(world["likes"]):
+        for fan in set(fans):
+            liked[fan].append(playlist)
+    password = dbu.sha(PASSWORD)
+    for user, name in enumerate(users):
+        friends = set(world["friends"][user])
+        asked = set(world["outgoing"].get(user, []))
+        asked_by = set(world["incoming"].get(user, []))
+        yield {dbu.USERNAME: name,
+               dbu.PASSWORD: password,
+               dbu.OUTGOING: [users[i] for i in sorted(asked - friends
+                                                       - asked_by)],
+               dbu.INCOMING: [users[i] for i in sorted(asked_by - friends
+                                                       - asked)],
+               dbu.FRIENDS: [users[i] for i in sorted(friends)],
+               dbu.FRIEND_COUNT: len(friends),
+               "ownedPlaylists": [world["playlists"][i]
+                                  for i in owned[user]],
+               "likedPlaylists": [world["playlists"][i]
+                                  for i in liked[user]]}
+
+
+def song_counts(world):
+    """
+    how many songs each playlist gets, a heavy tailed number
+    """
+    rng = random.Random(world["seed"] + 1)
+    return [min(MAX_SONGS, int(MIN_SONGS * rng.paretovariate(SONG_TAIL)))
+            for name in world["playlists"]]
+
+
+def playlist_docs(world):
+    """
+    yields a playlists doc for every playlist, like add_playlist makes,
+    with its likes and songs counted in
+    """
+    for playlist, n_songs in enumerate(song_counts(world)):
+        yield {dbp.PLNAME: world["playlists"][playlist],
+               dbp.LIKE_COUNT: len(set(world["likes"][playlist])),
+               dbp.SONG_COUNT: n_songs,
+               dbp.SONG_SEQ: n_songs,
+               dbp.OWNER: world["users"][world["owners"][playlist]]}
+
+
+def like_docs(world):
+    """
+    yields the playlistLikes docs of every playlist
+    """
+    for playlist, fans in enumerate(world["likes"]):
+        name = world["playlists"][playlist]
+        for fan in sorted(set(fans)):
+            yield {dbp.PLNAME: name, dbp.USERNAME: world["users"][fan]}
+
+
+def song_docs(world):
+    """
+    yields the playlistSongs docs of every playlist,
+    songs being drawn from a catalog with Zipf's law
+    """
+    rng = random.Random(world["seed"] + 2)
+    catalog = zipf_weights(CATALOG, SONG_SKEW)
+    songs = range(CATALOG)
+    for playlist, n_songs in enumerate(song_counts(world)):
+        picked = set()
+        while len(picked) < n_songs:
+            picked.update(rng.choices(songs, cum_weights=catalog,
+                                      k=n_songs - len(picked)))
+        name = world["playlists"][playlist]
+        for pos, song in enumerate(sorted(picked), 1):
+            yield {dbp.PLNAME: name, dbp.SONG: f"song {song}",
+                   dbp.POS: float(pos)}
+
+
+def collections(world):
+    """
+    the docs of a dataset as (collection, docs) pairs
+    """
+    return [(dbu.USERS, user_docs(world)),
+            (dbp.PLAYLISTS, playlist_docs(world)),
+            (dbp.LIKE_ITEMS, like_docs(world)),
+            (dbp.SONG_ITEMS, song_docs(world))]
+
+
+def chunks(docs, size):
+    """
+    groups docs into lists of size
+    """
+    docs = iter(docs)
+    while batch := list(itertools.islice(docs, size)):
+        yield batch
+
+
+def to_mongo(world, batch=bio.BATCH, workers=bio.WORKERS):
+    """
+    bulk inserts a dataset, returns how many docs went into each collection
+    """
+    dbp.ensure_song_indexes()
+    dbp.ensure_like_indexes()
+    inserted = {}
+    for collect_nm, docs in collections(world):
+        inserted[collect_nm] = bio.insert_batches(
+            collect_nm, chunks(docs, batch), workers,
+            bio.reporter(collect_nm))[1]
+    return inserted
+
+
+def to_files(world, out_dir):
+    """
+    writes a dataset to one gzipped NDJSON file per collection,
+    returns how many docs went into each
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    written = {}
+    for collect_nm, docs in collections(world):
+        path = os.path.join(out_dir, f"{collect_nm}.ndjson.gz")
+        with gzip.open(path, "wt") as out:
+            written[collect_nm] = 0
+            for doc in docs:
+                out.write(json.dumps(doc) + "\n")
+                written[collect_nm] += 1
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--friends", type=int, default=AVG_FRIENDS,
+                        help="average friends per user")
+    parser.add_argument("--playlists", type=float,
+                        default=PLAYLISTS_PER_USER,
+                        help="playlists per user")
+    parser.add_argument("--likes", type=float, default=LIKES_PER_USER,
+                        help="likes per user")
+    parser.add_argument("--out", help="directory to write NDJSON to "
+                        "instead of the database")
+    parser.add_argument("--batch", type=int, default=bio.BATCH)
+    parser.add_argument("--workers", type=int, default=bio.WORKERS)
+    args = parser.parse_args()
+    start = time.monotonic()
+    world = build(args.users, args.seed, args.friends, args.playlists,
+                  args.likes)
+    if args.out:
+        counts = to_files(world, args.out)
+    else:
+        counts = to_mongo(world, args.batch, args.workers)
+    made = ", ".join(f"{n} {collect_nm}" for collect_nm, n in counts.items())
+    print(f"Made {made} in {time.monotonic() - start:.1f} s",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
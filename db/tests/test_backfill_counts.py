@@ -0,0 +1,57 @@
+"""
+This file holds the tests for backfill_counts.py
+"""
+
+from unittest import TestCase
+
+import db.backfill_counts as bfc
+import db.db_connect as dbc
+import db.data_playlists as dbp
+import db.data_users as dbu
+
+FAKE_USER = "Fake user"
+FAKE_FRIEND = "Fake friend"
+FAKE_PLAYLIST = "Fake playlist"
+
+
+class DBTestCase(TestCase):
+    def setUp(self):
+        dbu.empty()
+        dbp.empty()
+
+    def tearDown(self):
+        pass
+
+    def test_backfill_users(self):
+        """
+        users without a friend count get one matching their friends
+        """
+        dbc.insert_doc(dbu.USERS, {dbu.USERNAME: FAKE_USER,
+                                   dbu.FRIENDS: [FAKE_FRIEND]})
+        bfc.backfill()
+        user = dbc.fetch_one(dbu.USERS, {dbu.USERNAME: FAKE_USER})
+        self.assertEqual(user[dbu.FRIEND_COUNT], 1)
+
+    def test_backfill_playlists(self):
+        """
+        playlists without counters get ones matching their likes and songs
+        """
+        dbc.insert_doc(dbp.PLAYLISTS, {dbp.PLNAME: FAKE_PLAYLIST})
+        dbc.insert_doc(dbp.LIKE_ITEMS, {dbp.PLNAME: FAKE_PLAYLIST,
+                                        dbp.USERNAME: FAKE_USER})
+        for pos, song in enumerate(["a", "b"]):
+            dbc.insert_doc(dbp.SONG_ITEMS, {dbp.PLNAME: FAKE_PLAYLIST,
+                                            dbp.SONG: song, dbp.POS: pos})
+        bfc.backfill()
+        pl = dbp.get_playlist(FAKE_PLAYLIST)
+        self.assertEqual(pl[dbp.LIKE_COUNT], 1)
+        self.assertEqual(pl[dbp.SONG_COUNT], 2)
+
+    def test_backfill_fixes_drift(self):
+        """
+        counters that drifted from their arrays are corrected
+        """
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        dbp.update_playlist(FAKE_PLAYLIST, {"$set": {dbp.LIKE_COUNT: 7}})
+        bfc.backfill()
+        self.assertEqual(dbp.get_playlist(FAKE_PLAYLIST)[dbp.LIKE_COUNT], 0)
@@ -0,0 +1,67 @@
+"""
+This file holds the tests for bulk_io.py
+"""
+
+import gzip
+import io
+from unittest import TestCase
+
+import bson
+import db.bulk_io as bio
+import db.data_playlists as dbp
+import db.data_users as dbu
+import db.db_connect as dbc
+
+FAKE_PASSWORD = "FakePassword"
+
+
+class DBTestCase(TestCase):
+    def setUp(self):
+        dbu.empty()
+        dbp.empty()
+
+    def tearDown(self):
+        dbu.empty()
+        dbp.empty()
+
+    def test_batches(self):
+        """
+        lines are read back as docs with their bson types, in batches
+        """
+        oid = bson.ObjectId()
+        source = [f'{{"_id": {{"$oid": "{oid}"}}, "n": {i}}}\n'
+                  for i in range(5)] + ["\n"]
+        found = list(bio.batches(source, 2))
+        self.assertEqual([2, 2, 1], [len(batch) for batch in found])
+        self.assertEqual(oid, found[0][0]["_id"])
+
+    def test_gzipped(self):
+        """
+        gzipped chunks unpack to the text they were made from
+        """
+        text = ["a line\n", "another line\n"] * 100
+        packed = b"".join(bio.gzipped(text))
+        self.assertEqual("".join(text), gzip.decompress(packed).decode())
+
+    def test_round_trip(self):
+        """
+        an exported collection imports back whole, and only once
+        """
+        for i in range(25):
+            dbu.add_user(f"user {i}", FAKE_PASSWORD)
+        out = io.StringIO()
+        self.assertEqual(25, bio.export(dbu.USERS, out))
+        dbu.empty()
+        source = io.StringIO(out.getvalue())
+        self.assertEqual((25, 25), bio.import_docs(dbu.USERS, source, 10, 2))
+        self.assertEqual(25, dbc.count(dbu.USERS))
+        source = io.StringIO(out.getvalue())
+        self.assertEqual((25, 0), bio.import_docs(dbu.USERS, source, 10, 2))
+        self.assertEqual(25, dbc.count(dbu.USERS))
+
+    def test_other_collections(self):
+        """
+        only users, playlists and their songs can be moved
+        """
+        with self.assertRaises(ValueError):
+            bio.import_docs("sessions", io.StringIO(""))
@@ -0,0 +1,121 @@
+"""
+This file holds the tests for cache_invalidation.py
+"""
+
+import time
+from unittest import TestCase, skipUnless
+
+from pymongo.errors import PyMongoError
+
+import db.cache_invalidation as ci
+import db.db_connect as dbc
+import db.data_users as dbu
+
+FAKE_USER = "Fake user"
+FAKE_PASSWORD = "Fake password"
+USERS = "users"
+
+
+def replica_set():
+    """
+    whether the test database can serve change streams
+    """
+    try:
+        hello = dbc.get_client().admin.command("hello")
+    except PyMongoError:
+        return False
+    return hello.get("setName") is not None
+
+
+class CacheInvalidationTestCase(TestCase):
+    def setUp(self):
+        self.seen = []
+        ci.register(USERS, self.handler)
+
+    def tearDown(self):
+        ci.handlers[USERS].remove(self.handler)
+
+    def handler(self, name, fields):
+        self.seen.append((name, fields))
+
+    def test_dispatch_update(self):
+        """
+        an update passes on the doc's key and the top level fields touched
+        """
+        ci.dispatch({"operationType": "update", "ns": {"coll": USERS},
+                     "fullDocument": {"userName": FAKE_USER},
+                     ci.FIELDS: ["friends.2", "friendCount"]})
+        self.assertIn((FAKE_USER, {"friends", "friendCount"}), self.seen)
+
+    def test_dispatch_delete(self):
+        """
+        a delete is named from its pre-image, and only without one
+        does it say anything may have changed
+        """
+        ci.dispatch({"operationType": "delete", "ns": {"coll": USERS},
+                     ci.BEFORE: {"userName": FAKE_USER}})
+        self.assertIn((FAKE_USER, ci.DELETED), self.seen)
+        ci.dispatch({"operationType": "delete", "ns": {"coll": USERS}})
+        self.assertIn((None, None), self.seen)
+
+    def test_dispatch_unavailable(self):
+        """
+        a change a handler couldn't apply for want of the database
+        is handed to it again later
+        """
+        down = [True]
+
+        def handler(name, fields):
+            self.seen.append((name, fields))
+            if down[0]:
+                raise dbc.DatabaseUnavailable()
+        ci.handlers[USERS].append(handler)
+        try:
+            ci.dispatch({"operationType": "insert", "ns": {"coll": USERS},
+                         "fullDocument": {"userName": FAKE_USER}})
+            self.assertEqual([(handler, FAKE_USER, None)], ci.failed)
+            down[0] = False
+            ci.retry_failed()
+        finally:
+            ci.handlers[USERS].remove(handler)
+            ci.failed.clear()
+        self.assertEqual([], ci.failed)
+        self.assertNotIn((None, None), self.seen)
+        self.assertEqual((FAKE_USER, None), self.seen[-1])
+
+    def test_handler_error(self):
+        """
+        a handler that fails on a change for another reason than the
+        database is reset instead of being handed the change again
+        """
+        def handler(name, fields):
+            self.seen.append((name, fields))
+            if name is not None:
+                raise KeyError(name)
+        ci.handlers[USERS].append(handler)
+        try:
+            ci.dispatch({"operationType": "insert", "ns": {"coll": USERS},
+                         "fullDocument": {"userName": FAKE_USER}})
+        finally:
+            ci.handlers[USERS].remove(handler)
+        self.assertEqual([], ci.failed)
+        self.assertEqual((None, None), self.seen[-1])
+
+    @skipUnless(replica_set(), "change streams need a replica set")
+    def test_follow(self):
+        """
+        a change made through the database reaches the handler
+        """
+        ci.start()
+        try:
+            time.sleep(1)
+            dbu.add_user(FAKE_USER, FAKE_PASSWORD)
+            for i in range(50):
+                if (FAKE_USER, None) in self.seen:
+                    break
+                time.sleep(0.1)
+            self.assertIn((FAKE_USER, None), self.seen)
+            self.assertIsNotNone(ci.resume_token)
+        finally:
+            ci.stop()
+            dbu.empty()
@@ -0,0 +1,56 @@
+"""
+This file holds the tests for data_idempotency.py
+"""
+
+from unittest import TestCase
+
+import db.data_idempotency as dbi
+
+FAKE_KEY = "POST /fake fake-key"
+
+
+class DBTestCase(TestCase):
+    def setUp(self):
+        dbi.empty()
+
+    def tearDown(self):
+        dbi.empty()
+
+    def test_claim(self):
+        """
+        the first claim runs, a second one sees it still running
+        """
+        self.assertIsNone(dbi.claim(FAKE_KEY, "a"))
+        stored = dbi.claim(FAKE_KEY, "a")
+        self.assertFalse(stored[dbi.DONE])
+
+    def test_save(self):
+        """
+        a saved response is returned to later claims
+        """
+        dbi.claim(FAKE_KEY, "a")
+        dbi.save(FAKE_KEY, 200, "done")
+        stored = dbi.claim(FAKE_KEY, "a")
+        self.assertTrue(stored[dbi.DONE])
+        self.assertEqual(200, stored[dbi.STATUS])
+        self.assertEqual("done", stored[dbi.BODY])
+
+    def test_forget(self):
+        """
+        a forgotten key can be claimed again
+        """
+        dbi.claim(FAKE_KEY, "a")
+        dbi.forget(FAKE_KEY)
+        self.assertIsNone(dbi.claim(FAKE_KEY, "a"))
+
+    def test_stale(self):
+        """
+        a claim left running too long is taken over
+        """
+        pending = dbi.PENDING
+        dbi.PENDING = -1
+        try:
+            dbi.claim(FAKE_KEY, "a")
+            self.assertIsNone(dbi.claim(FAKE_KEY, "a"))
+        finally:
+            dbi.PENDING = pending
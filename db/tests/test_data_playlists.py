@@ -2,6 +2,7 @@
 This file holds the tests for data_playlists.py
 """
 
+import math
 from unittest import TestCase, skip
 
 import data_playlists as dbp
@@ -41,6 +42,33 @@ class DBTestCase(TestCase):
         playlist = dbp.get_playlist(FAKE_PLAYLIST)
         self.assertIsInstance(playlist, dict)
 
+    def test_get_playlist_songs(self):
+        """
+        a playlist comes with its first songs only, and its fields alone
+        without any
+        """
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        for i in range(3):
+            dbp.add_song(FAKE_PLAYLIST, f"song {i}")
+        playlist = dbp.get_playlist(FAKE_PLAYLIST, songs=2)
+        self.assertEqual(playlist[dbp.SONGS], ["song 0", "song 1"])
+        self.assertEqual(playlist[dbp.SONG_COUNT], 3)
+        self.assertEqual(dbp.get_playlist_fields(FAKE_PLAYLIST, [dbp.OWNER]),
+                         {dbp.PLNAME: FAKE_PLAYLIST, dbp.OWNER: FAKE_USER})
+        self.assertEqual(dbp.get_playlist_fields("nope", [dbp.OWNER]),
+                         dbp.NOT_FOUND)
+
+    def test_liked_by(self):
+        """
+        a like is found without reading the likes
+        """
+        dbu.add_user(FAKE_USER, "FakePassword")
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        self.assertFalse(dbp.liked_by(FAKE_PLAYLIST, FAKE_USER))
+        dbu.like_playlist(FAKE_USER, FAKE_PLAYLIST)
+        self.assertTrue(dbp.liked_by(FAKE_PLAYLIST, FAKE_USER))
+        self.assertIsNone(dbp.liked_by("nope", FAKE_USER))
+
     def test_add_playlist(self):
         """
         Can we write to the playlist db?
@@ -72,14 +100,12 @@ class DBTestCase(TestCase):
         Can we update a playlist?
         """
         dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
-        dbp.update_playlist(FAKE_PLAYLIST, {"$push": {"songs":"FAKE SONG"}})
-        dbp.update_playlist(FAKE_PLAYLIST, {"$push": {"likes":"FAKE USER"}})
+        dbp.update_playlist(FAKE_PLAYLIST, {"$push": {"tags":"FAKE TAG"}})
         pl = dbp.get_playlist(FAKE_PLAYLIST)
-        self.assertIn("FAKE SONG", pl["songs"])
-        self.assertIn("FAKE USER", pl["likes"])
-        dbp.update_playlist(FAKE_PLAYLIST, {"$pull": {"songs":"FAKE SONG"}})
+        self.assertIn("FAKE TAG", pl["tags"])
+        dbp.update_playlist(FAKE_PLAYLIST, {"$pull": {"tags":"FAKE TAG"}})
         pl = dbp.get_playlist(FAKE_PLAYLIST)
-        self.assertNotIn("FAKE SONG", pl["songs"])
+        self.assertNotIn("FAKE TAG", pl["tags"])
 
 
     def test_add_song(self):
@@ -109,6 +135,165 @@ class DBTestCase(TestCase):
         self.assertNotIn(newsong, pl['songs'])
 
 
+    def test_add_song_status(self):
+        """
+        adding a song reports whether anything changed
+        """
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        self.assertEqual(dbp.add_song(FAKE_PLAYLIST, "SONG"), dbp.OK)
+        self.assertEqual(dbp.add_song(FAKE_PLAYLIST, "SONG"), dbp.DUPLICATE)
+        self.assertEqual(dbp.add_song("FOO TRACKS", "SONG"), dbp.NOT_FOUND)
+
+    def test_rem_song_status(self):
+        """
+        removing a song reports whether anything changed
+        """
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        dbp.add_song(FAKE_PLAYLIST, "SONG")
+        self.assertEqual(dbp.rem_song(FAKE_PLAYLIST, "SONG"), dbp.OK)
+        self.assertEqual(dbp.rem_song(FAKE_PLAYLIST, "SONG"),
+                         dbp.NOT_IN_PLAYLIST)
+        self.assertEqual(dbp.rem_song("FOO TRACKS", "SONG"), dbp.NOT_FOUND)
+
+    def test_get_songs(self):
+        """
+        songs come back in the order they were added, a page at a time
+        """
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        for i in range(5):
+            dbp.add_song(FAKE_PLAYLIST, f"SONG{i}")
+        page = dbp.get_songs(FAKE_PLAYLIST, offset=1, limit=2)
+        self.assertEqual([item[dbp.SONG] for item in page], ["SONG1", "SONG2"])
+        page = dbp.get_songs(FAKE_PLAYLIST, limit=2, after=page[-1][dbp.POS])
+        self.assertEqual([item[dbp.SONG] for item in page], ["SONG3", "SONG4"])
+        self.assertEqual(dbp.get_playlist(FAKE_PLAYLIST)["songs"],
+                         [f"SONG{i}" for i in range(5)])
+
+    def test_del_playlist_songs(self):
+        """
+        deleting a playlist deletes its songs
+        """
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        dbp.add_song(FAKE_PLAYLIST, "SONG")
+        dbp.del_playlist(FAKE_PLAYLIST)
+        self.assertEqual(dbp.get_songs(FAKE_PLAYLIST), [])
+
+    def test_move_song(self):
+        """
+        songs can be moved in front of another song or to the end
+        """
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        for song in ["a", "b", "c"]:
+            dbp.add_song(FAKE_PLAYLIST, song)
+        self.assertEqual(dbp.move_song(FAKE_PLAYLIST, "c", "a"), dbp.OK)
+        self.assertEqual(dbp.get_playlist(FAKE_PLAYLIST)[dbp.SONGS],
+                         ["c", "a", "b"])
+        self.assertEqual(dbp.move_song(FAKE_PLAYLIST, "c"), dbp.OK)
+        self.assertEqual(dbp.get_playlist(FAKE_PLAYLIST)[dbp.SONGS],
+                         ["a", "b", "c"])
+        self.assertEqual(dbp.move_song(FAKE_PLAYLIST, "d"),
+                         dbp.NOT_IN_PLAYLIST)
+        self.assertEqual(dbp.move_song(FAKE_PLAYLIST, "a", "d"),
+                         dbp.NOT_IN_PLAYLIST)
+        self.assertEqual(dbp.move_song("FOO TRACKS", "a"), dbp.NOT_FOUND)
+
+    def test_move_song_rebalance(self):
+        """
+        moving into the same gap over and over keeps the order right
+        """
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        for song in ["a", "b", "c"]:
+            dbp.add_song(FAKE_PLAYLIST, song)
+        for i in range(60):
+            dbp.move_song(FAKE_PLAYLIST, "b" if i % 2 else "c", "a")
+        dbp.rebalance(FAKE_PLAYLIST)
+        self.assertEqual(dbp.get_playlist(FAKE_PLAYLIST)[dbp.SONGS],
+                         ["c", "b", "a"])
+        self.assertEqual([item[dbp.POS] for item
+                          in dbp.get_songs(FAKE_PLAYLIST)], [1, 2, 3])
+
+    def test_song_count(self):
+        """
+        adding and removing songs keeps the song count in step
+        """
+        newpl = "PLAYLIST"
+        newsong = "SONG"
+        dbp.add_playlist(newpl, FAKE_USER)
+        dbp.add_song(newpl, newsong)
+        dbp.add_song(newpl, newsong)
+        self.assertEqual(dbp.get_playlist(newpl)[dbp.SONG_COUNT], 1)
+        dbp.rem_song(newpl, newsong)
+        dbp.rem_song(newpl, newsong)
+        self.assertEqual(dbp.get_playlist(newpl)[dbp.SONG_COUNT], 0)
+
+    def test_get_playlists_counts(self):
+        """
+        playlists can be listed with counters instead of arrays
+        """
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        for pl in dbp.get_playlists(counts=True):
+            self.assertIn(dbp.LIKE_COUNT, pl)
+            self.assertNotIn(dbp.LIKES, pl)
+            self.assertNotIn(dbp.SONGS, pl)
+
+    def test_top_playlists(self):
+        """
+        the most liked playlists come first
+        """
+        for i in range(3):
+            dbp.add_playlist(FAKE_PLAYLIST + str(i), FAKE_USER)
+            dbp.update_playlist(FAKE_PLAYLIST + str(i),
+                                {"$set": {dbp.LIKE_COUNT: i}})
+        top = dbp.top_playlists(2)
+        self.assertEqual([pl[dbp.PLNAME] for pl in top],
+                         [FAKE_PLAYLIST + "2", FAKE_PLAYLIST + "1"])
+        self.assertNotIn(dbp.LIKES, top[0])
+
+    def test_record_likes(self):
+        """
+        recent likes add up in the trend score and unlikes take them away
+        """
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        dbp.record_likes(FAKE_PLAYLIST, 3)
+        dbp.record_likes(FAKE_PLAYLIST, 1)
+        trending = dbp.trending_playlists(1)
+        self.assertAlmostEqual(trending[0][dbp.RECENT_LIKES], 4, places=2)
+        dbp.update_playlist(FAKE_PLAYLIST, {"$set": {dbp.LIKE_COUNT: 4}})
+        dbp.record_likes(FAKE_PLAYLIST, -1)
+        trending = dbp.trending_playlists(1)
+        self.assertAlmostEqual(trending[0][dbp.RECENT_LIKES], 3, places=2)
+
+    def test_unlike_decayed(self):
+        """
+        an unlike takes off an average like, not a brand new one,
+        and the last unlike stops the playlist trending
+        """
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        # one like a half-life ago, worth 0.5 now, and one just made
+        dbp.update_playlist(FAKE_PLAYLIST, {"$set": {
+            dbp.LIKE_COUNT: 2,
+            dbp.TREND_SCORE: dbp.trend_now() + math.log2(1.5)}})
+        dbp.record_likes(FAKE_PLAYLIST, -1)
+        trending = dbp.trending_playlists(1)
+        self.assertAlmostEqual(trending[0][dbp.RECENT_LIKES], 0.75, places=2)
+        dbp.update_playlist(FAKE_PLAYLIST, {"$set": {dbp.LIKE_COUNT: 1}})
+        dbp.record_likes(FAKE_PLAYLIST, -1)
+        self.assertEqual([], dbp.trending_playlists(1))
+
+    def test_trending_playlists(self):
+        """
+        playlists with more recent likes trend higher
+        and playlists nobody liked don't trend at all
+        """
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        dbp.add_playlist("hot", FAKE_USER)
+        dbp.add_playlist("unliked", FAKE_USER)
+        dbp.record_likes(FAKE_PLAYLIST, 1)
+        dbp.record_likes("hot", 5)
+        trending = dbp.trending_playlists(10)
+        self.assertEqual([pl[dbp.PLNAME] for pl in trending],
+                         ["hot", FAKE_PLAYLIST])
+
     def test_empty(self):
         """
         we can empty the playlist collection
@@ -0,0 +1,72 @@
+"""
+This file holds the tests for data_sessions.py
+"""
+
+import datetime
+import time
+from unittest import TestCase
+
+import db.data_sessions as ds
+import db.usertoken as token
+
+FAKE_USER = "Fake user"
+
+
+class DBTestCase(TestCase):
+    def setUp(self):
+        ds.empty()
+
+    def tearDown(self):
+        pass
+
+    def test_create(self):
+        """
+        a new session is valid for its user
+        """
+        session = token.session()
+        ds.create(FAKE_USER, session)
+        self.assertTrue(ds.valid(FAKE_USER, session[token.ID]))
+
+    def test_expired(self):
+        """
+        an expired session is not valid even before mongo sweeps it
+        """
+        session = token.session()
+        session[token.EXP] -= datetime.timedelta(days=5)
+        ds.create(FAKE_USER, session)
+        self.assertFalse(ds.valid(FAKE_USER, session[token.ID]))
+
+    def test_end_all(self):
+        """
+        ending every session of a user invalidates all of them
+        """
+        sessions = [token.session() for i in range(3)]
+        for session in sessions:
+            ds.create(FAKE_USER, session)
+        ds.end_all(FAKE_USER)
+        for session in sessions:
+            self.assertFalse(ds.valid(FAKE_USER, session[token.ID]))
+
+    def test_revoke(self):
+        """
+        a revoked signed token is revoked, others aren't
+        """
+        now = int(time.time())
+        claims = {token.USER: FAKE_USER, token.IAT: now,
+                  token.EXP: now + 60, token.JTI: "a"}
+        ds.revoke(claims)
+        self.assertTrue(ds.is_revoked(claims))
+        self.assertFalse(ds.is_revoked({**claims, token.JTI: "b"}))
+        ds.refresh()
+        self.assertTrue(ds.is_revoked(claims))
+
+    def test_revoke_user(self):
+        """
+        revoking a user revokes the tokens issued before it only
+        """
+        now = int(time.time())
+        claims = {token.USER: FAKE_USER, token.IAT: now - 10,
+                  token.EXP: now + 60, token.JTI: "a"}
+        ds.revoke_user(FAKE_USER)
+        self.assertTrue(ds.is_revoked(claims))
+        self.assertFalse(ds.is_revoked({**claims, token.IAT: now + 10}))
@@ -12,10 +12,11 @@ FAKE_PLAYLIST = "Fake playlist"
 
 class DBTestCase(TestCase):
     def setUp(self):
-        pass
-    
+        self.keys = token.KEYS
+        token.KEYS = {"k1": b"secret"}
+
     def tearDown(self):
-        pass
+        token.KEYS = self.keys
 
     def test_blank(self):
         """
@@ -53,4 +54,63 @@ class DBTestCase(TestCase):
         make sure authorization succeeds when token doesn't expire
         """
         new = token.new()
-        self.assertTrue(token.check(new))
\ No newline at end of file
+        self.assertTrue(token.check(new))
+
+    def test_session(self):
+        """
+        make sure a session token stores its expiration as a datetime
+        """
+        new = token.session()
+        self.assertEqual(22, len(new[token.ID]))
+        self.assertIsInstance(new[token.EXP], datetime.datetime)
+        self.assertGreater(new[token.EXP], datetime.datetime.utcnow())
+
+    def test_parse_keys(self):
+        """
+        keys are read in order from kid:secret pairs
+        """
+        keys = token.parse_keys("k2:new, k1:old:part")
+        self.assertEqual(["k2", "k1"], list(keys))
+        self.assertEqual(b"old:part", keys["k1"])
+        self.assertEqual({}, token.parse_keys(""))
+
+    def test_sign(self):
+        """
+        a signed token verifies and carries its user
+        """
+        val = token.sign(FAKE_USER)
+        self.assertTrue(token.is_signed(val))
+        self.assertEqual(FAKE_USER, token.verify(val)[token.USER])
+
+    def test_tampered(self):
+        """
+        a token with a changed payload or unknown key doesn't verify
+        """
+        kid, payload, sig = token.sign(FAKE_USER).split(".")
+        other = token.sign("other").split(".")[1]
+        self.assertIsNone(token.verify(f"{kid}.{other}.{sig}"))
+        self.assertIsNone(token.verify(f"k9.{payload}.{sig}"))
+        self.assertIsNone(token.verify(f"{kid}.{payload}.!!"))
+
+    def test_rotation(self):
+        """
+        tokens signed with an older key verify while it is still listed
+        """
+        val = token.sign(FAKE_USER)
+        token.KEYS = {"k2": b"newer", "k1": b"secret"}
+        self.assertIsNotNone(token.verify(val))
+        self.assertTrue(token.sign(FAKE_USER).startswith("k2."))
+        token.KEYS = {"k2": b"newer"}
+        self.assertIsNone(token.verify(val))
+
+    def test_signed_expired(self):
+        """
+        an expired signed token doesn't verify
+        """
+        lifetime = token.LIFETIME
+        token.LIFETIME = datetime.timedelta(seconds=-1)
+        try:
+            val = token.sign(FAKE_USER)
+        finally:
+            token.LIFETIME = lifetime
+        self.assertIsNone(token.verify(val))
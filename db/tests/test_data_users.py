@@ -99,6 +99,38 @@ class DBTestCase(TestCase):
         self.assertIn(new1, u2["friends"])
         self.assertIn(new2, u1["friends"])
     
+    def test_bef_user_count(self):
+        """
+        befriending keeps both users' friend counts in step
+        """
+        new1 = "new1"
+        new2 = "new2"
+        dbu.add_user(new1, FAKE_PASSWORD)
+        dbu.add_user(new2, FAKE_PASSWORD)
+        dbu.bef_user(new1, new2)
+        dbu.bef_user(new1, new2)
+        self.assertEqual(dbu.get_user(new1)[dbu.FRIEND_COUNT], 1)
+        self.assertEqual(dbu.get_user(new2)[dbu.FRIEND_COUNT], 1)
+        dbu.unf_user(new1, new2)
+        dbu.unf_user(new1, new2)
+        self.assertEqual(dbu.get_user(new1)[dbu.FRIEND_COUNT], 0)
+        self.assertEqual(dbu.get_user(new2)[dbu.FRIEND_COUNT], 0)
+
+    def test_bef_user_requests(self):
+        """
+        befriending clears pending requests even between friends
+        """
+        new1 = "new1"
+        new2 = "new2"
+        dbu.add_user(new1, FAKE_PASSWORD)
+        dbu.add_user(new2, FAKE_PASSWORD)
+        dbu.bef_user(new1, new2)
+        dbu.req_user(new1, new2)
+        dbu.bef_user(new1, new2)
+        self.assertEqual(dbu.get_user(new1)["outgoingRequests"], [])
+        self.assertEqual(dbu.get_user(new2)["incomingRequests"], [])
+        self.assertEqual(dbu.get_user(new1)[dbu.FRIEND_COUNT], 1)
+
     def test_unf_user(self):
         """
         db can unfriend two users
@@ -129,6 +161,38 @@ class DBTestCase(TestCase):
         self.assertNotIn(user2["incomingRequests"], new1)
 
 
+    def test_get_pair(self):
+        """
+        two users' connections come back together, else NOT_FOUND
+        """
+        dbu.add_user("new1", FAKE_PASSWORD)
+        dbu.add_user("new2", FAKE_PASSWORD)
+        user1, user2 = dbu.get_pair("new1", "new2")
+        self.assertEqual(user1[dbu.USERNAME], "new1")
+        self.assertEqual(user2[dbu.USERNAME], "new2")
+        self.assertNotIn(dbu.PASSWORD, user1)
+        self.assertEqual(dbu.get_pair("new1", "new3"), dbu.NOT_FOUND)
+
+    def test_relationship(self):
+        """
+        the status follows a request through to a friendship
+        """
+        for user in ("new1", "new2", "mutual"):
+            dbu.add_user(user, FAKE_PASSWORD)
+        ret = dbu.relationship("new1", "new2")
+        self.assertEqual(ret[dbu.STATUS], dbu.STRANGERS)
+        dbu.req_user("new1", "new2")
+        self.assertEqual(dbu.relationship("new1", "new2")[dbu.STATUS],
+                         dbu.REQUESTED)
+        self.assertEqual(dbu.relationship("new2", "new1")[dbu.STATUS],
+                         dbu.RECEIVED)
+        dbu.bef_user("new2", "new1")
+        dbu.bef_user("new1", "mutual")
+        dbu.bef_user("new2", "mutual")
+        ret = dbu.relationship("new1", "new2")
+        self.assertEqual(ret[dbu.STATUS], dbu.ARE_FRIENDS)
+        self.assertEqual(ret[dbu.MUTUAL], ["mutual"])
+
     def test_like_playlist(self):
         """
         a user can like a playlist
@@ -158,6 +222,33 @@ class DBTestCase(TestCase):
         self.assertNotIn(newpl, u["likedPlaylists"])
         self.assertNotIn(newuser, pl["likes"])
 
+    def test_like_count(self):
+        """
+        liking and unliking keeps the playlist's like count in step
+        """
+        newpl = "playlist"
+        newuser = "user"
+        dbp.add_playlist(newpl, FAKE_USER)
+        dbu.add_user(newuser, FAKE_PASSWORD)
+        dbu.like_playlist(newuser, newpl)
+        dbu.like_playlist(newuser, newpl)
+        self.assertEqual(dbp.get_playlist(newpl)[dbp.LIKE_COUNT], 1)
+        self.assertEqual(dbu.get_user(newuser)["likedPlaylists"], [newpl])
+        dbu.unlike_playlist(newuser, newpl)
+        dbu.unlike_playlist(newuser, newpl)
+        self.assertEqual(dbp.get_playlist(newpl)[dbp.LIKE_COUNT], 0)
+        self.assertEqual(dbu.get_user(newuser)["likedPlaylists"], [])
+
+    def test_get_users_counts(self):
+        """
+        users can be listed with counters instead of arrays
+        """
+        dbu.add_user(FAKE_USER, FAKE_PASSWORD)
+        for user in dbu.get_users(counts=True):
+            self.assertIn(dbu.FRIEND_COUNT, user)
+            self.assertNotIn(dbu.FRIENDS, user)
+            self.assertNotIn(dbu.PASSWORD, user)
+
     def test_empty(self):
         """
         we can empty the user collection
@@ -200,6 +291,50 @@ class DBTestCase(TestCase):
         ret = dbu.check_auth(FAKE_USER, val)
         self.assertFalse(ret)
 
+    def test_auth3(self):
+        """
+        a user can be logged in more than once and log out of one session
+        """
+        dbu.add_user(FAKE_USER, FAKE_PASSWORD)
+        first = dbu.login(FAKE_USER, FAKE_PASSWORD)
+        second = dbu.login(FAKE_USER, FAKE_PASSWORD)
+        self.assertTrue(dbu.check_auth(FAKE_USER, first))
+        self.assertTrue(dbu.check_auth(FAKE_USER, second))
+        self.assertEqual(dbu.logout(FAKE_USER, first), dbu.OK)
+        self.assertFalse(dbu.check_auth(FAKE_USER, first))
+        self.assertTrue(dbu.check_auth(FAKE_USER, second))
+        self.assertEqual(dbu.logout(FAKE_USER, first), dbu.NOT_FOUND)
+
+    def test_auth4(self):
+        """
+        a token only authorizes the user it was made for
+        """
+        dbu.add_user(FAKE_USER, FAKE_PASSWORD)
+        dbu.add_user("other", FAKE_PASSWORD)
+        token = dbu.login(FAKE_USER, FAKE_PASSWORD)
+        self.assertFalse(dbu.check_auth("other", token))
+
+    def test_signed_auth(self):
+        """
+        with signing keys set, a signed token authorizes its user
+        until they log out of it
+        """
+        keys = dbu.token.KEYS
+        dbu.token.KEYS = {"k1": b"secret"}
+        try:
+            dbu.add_user(FAKE_USER, FAKE_PASSWORD)
+            first = dbu.login(FAKE_USER, FAKE_PASSWORD)
+            second = dbu.login(FAKE_USER, FAKE_PASSWORD)
+            self.assertTrue(dbu.token.is_signed(first))
+            self.assertTrue(dbu.check_auth(FAKE_USER, first))
+            self.assertFalse(dbu.check_auth("other", first))
+            self.assertEqual(dbu.logout(FAKE_USER, first), dbu.OK)
+            self.assertFalse(dbu.check_auth(FAKE_USER, first))
+            self.assertTrue(dbu.check_auth(FAKE_USER, second))
+            self.assertEqual(dbu.logout(FAKE_USER, first), dbu.NOT_FOUND)
+        finally:
+            dbu.token.KEYS = keys
+
     def test_getfriends(self):
         """
         a user can get all its friends
@@ -211,3 +346,30 @@ class DBTestCase(TestCase):
             dbu.bef_user(FAKE_USER, FAKE_USER+str(i))
             ret.append(dbu.get_user(FAKE_USER+str(i)))
         self.assertEqual(dbu.get_friends(FAKE_USER), ret)
+
+    def test_get_profile(self):
+        """
+        a profile holds the user, the first of each list and their totals
+        """
+        dbp.empty()
+        dbu.add_user(FAKE_USER, FAKE_PASSWORD)
+        for i in range(3):
+            dbu.add_user(FAKE_USER + str(i), FAKE_PASSWORD)
+            dbu.bef_user(FAKE_USER, FAKE_USER + str(i))
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        dbu.create_playlist(FAKE_USER, FAKE_PLAYLIST)
+        dbu.like_playlist(FAKE_USER, FAKE_PLAYLIST)
+        ret = dbu.get_profile(FAKE_USER, limits={dbu.FRIENDS: 2})
+        self.assertEqual(ret[dbu.PROFILE][dbu.USERNAME], FAKE_USER)
+        self.assertNotIn(dbu.PASSWORD, ret[dbu.PROFILE])
+        self.assertEqual([{dbu.USERNAME: FAKE_USER + str(i),
+                           dbu.FRIEND_COUNT: 1} for i in range(2)],
+                         ret[dbu.FRIENDS])
+        self.assertEqual(ret[dbu.TOTALS], {dbu.FRIENDS: 3, dbu.OWNED: 1,
+                                           dbu.LIKED: 1})
+        self.assertEqual([FAKE_PLAYLIST],
+                         [pl[dbp.PLNAME] for pl in ret[dbu.LIKED]])
+        self.assertNotIn(dbp.LIKES, ret[dbu.OWNED][0])
+        ret = dbu.get_profile(FAKE_USER, [dbu.OWNED])
+        self.assertEqual({dbu.TOTALS, dbu.OWNED}, set(ret))
+        self.assertEqual(dbu.get_profile("nobody"), dbu.NOT_FOUND)
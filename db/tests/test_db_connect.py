@@ -0,0 +1,121 @@
+"""
+This file holds the tests for the breaker and retries in db_connect.py
+"""
+
+from unittest import TestCase
+from pymongo.errors import AutoReconnect, OperationFailure
+
+import db.db_connect as dbc
+
+
+def flaky(errors):
+    """
+    a call that raises each of errors in turn, then returns "ok"
+    """
+    errors = list(errors)
+
+    @dbc.guarded(dbc.RETRIES)
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+    return call
+
+
+class DBConnectTestCase(TestCase):
+    def setUp(self):
+        dbc.reset_breaker()
+
+    def tearDown(self):
+        dbc.reset_breaker()
+
+    def test_retry(self):
+        """
+        a transient error is retried
+        """
+        self.assertEqual("ok", flaky([AutoReconnect("down")])())
+
+    def test_give_up(self):
+        """
+        a call that keeps failing raises DatabaseUnavailable
+        """
+        call = flaky([AutoReconnect("down")] * (dbc.RETRIES + 1))
+        self.assertRaises(dbc.DatabaseUnavailable, call)
+
+    def test_not_transient(self):
+        """
+        an error in the call itself is raised as is, without retrying
+        """
+        call = flaky([OperationFailure("bad query")])
+        self.assertRaises(OperationFailure, call)
+        self.assertIsNone(dbc.opened)
+
+    def test_no_time_left(self):
+        """
+        a retry that can't fit in the deadline isn't tried
+        """
+        call = flaky([AutoReconnect("down")])
+        with dbc.deadline(0):
+            self.assertRaises(dbc.DatabaseUnavailable, call)
+
+    def test_breaker(self):
+        """
+        the breaker opens once enough calls fail, then fails fast
+        until a probe succeeds
+        """
+        for i in range(dbc.MIN_CALLS):
+            dbc.record(False)
+        self.assertRaises(dbc.DatabaseUnavailable, flaky([]))
+        dbc.opened -= dbc.COOL_DOWN
+        self.assertEqual("ok", flaky([])())
+        self.assertIsNone(dbc.opened)
+
+    def test_failed_probe(self):
+        """
+        a failed probe keeps the breaker open
+        """
+        for i in range(dbc.MIN_CALLS):
+            dbc.record(False)
+        dbc.opened -= dbc.COOL_DOWN
+        dbc.allow()
+        dbc.record(False)
+        self.assertRaises(dbc.DatabaseUnavailable, dbc.allow)
+
+    def test_partly_read_probe(self):
+        """
+        a probe that is a stream read only in part still closes the breaker
+        """
+        for i in range(dbc.MIN_CALLS):
+            dbc.record(False)
+        dbc.opened -= dbc.COOL_DOWN
+        docs = dbc.stream(iter([{"n": 1}, {"n": 2}]))
+        self.assertEqual({"n": 1}, next(docs))
+        docs.close()
+        self.assertIsNone(dbc.opened)
+        dbc.allow()
+
+    def test_probe_error(self):
+        """
+        a probe that fails for a reason other than mongo closes the breaker
+        """
+        @dbc.guarded(dbc.RETRIES)
+        def broken():
+            raise KeyError("field")
+
+        for i in range(dbc.MIN_CALLS):
+            dbc.record(False)
+        dbc.opened -= dbc.COOL_DOWN
+        self.assertRaises(KeyError, broken)
+        self.assertIsNone(dbc.opened)
+
+    def test_lost_probe(self):
+        """
+        a probe that never reports back lets another through in time
+        """
+        for i in range(dbc.MIN_CALLS):
+            dbc.record(False)
+        dbc.opened -= dbc.COOL_DOWN
+        dbc.allow()
+        self.assertRaises(dbc.DatabaseUnavailable, dbc.allow)
+        dbc.probing -= dbc.PROBE_TIMEOUT
+        dbc.allow()
@@ -0,0 +1,97 @@
+"""
+This file holds the tests for feed.py
+"""
+
+from unittest import TestCase
+
+import db.data_playlists as dbp
+import db.data_users as dbu
+import db.feed as feed
+
+FAKE_USER = "Fake user"
+FAKE_FRIEND = "Fake friend"
+FAKE_PASSWORD = "FakePassword"
+FAKE_PLAYLIST = "Fake playlist"
+FAKE_SONG = "Fake song"
+
+
+class DBTestCase(TestCase):
+    def setUp(self):
+        dbu.empty()
+        dbp.empty()
+        dbu.add_user(FAKE_USER, FAKE_PASSWORD)
+        dbu.add_user(FAKE_FRIEND, FAKE_PASSWORD)
+        dbu.bef_user(FAKE_USER, FAKE_FRIEND)
+
+    def tearDown(self):
+        pass
+
+    def act(self):
+        """
+        the friend creates a playlist, adds a song to it and likes it
+        """
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_FRIEND)
+        dbu.create_playlist(FAKE_FRIEND, FAKE_PLAYLIST)
+        dbp.add_song(FAKE_PLAYLIST, FAKE_SONG, FAKE_FRIEND)
+        dbu.like_playlist(FAKE_FRIEND, FAKE_PLAYLIST)
+
+    def test_missing_user(self):
+        """
+        a user that doesn't exist has no feed
+        """
+        self.assertIsNone(feed.get_feed("nobody", 10))
+
+    def test_fan_out_on_write(self):
+        """
+        a friend's events show up newest first
+        """
+        self.act()
+        events = feed.get_feed(FAKE_USER, 10)
+        self.assertEqual([feed.LIKED, feed.ADDED_SONG, feed.CREATED],
+                         [event[feed.KIND] for event in events])
+        self.assertEqual(FAKE_SONG, events[1][feed.SONG])
+        self.assertEqual([], feed.get_feed(FAKE_FRIEND, 10))
+
+    def test_fan_out_on_read(self):
+        """
+        events of users with too many friends are read from their outbox
+        """
+        limit = feed.FANOUT_LIMIT
+        feed.FANOUT_LIMIT = 0
+        try:
+            self.act()
+        finally:
+            feed.FANOUT_LIMIT = limit
+        events = feed.get_feed(FAKE_USER, 10)
+        self.assertEqual(3, len(events))
+
+    def test_pages(self):
+        """
+        passing the last event's time back as before gets the next page
+        """
+        self.act()
+        first = feed.get_feed(FAKE_USER, 2)
+        rest = feed.get_feed(FAKE_USER, 2, first[-1][feed.TS])
+        self.assertEqual([feed.CREATED], [event[feed.KIND] for event in rest])
+
+    def test_newest_first(self):
+        """
+        buckets of one day are merged by time
+        """
+        buckets = [{feed.DAY: 2, feed.EVENTS: [{feed.TS: 1}, {feed.TS: 5}]},
+                   {feed.DAY: 2, feed.EVENTS: [{feed.TS: 3}]},
+                   {feed.DAY: 1, feed.EVENTS: [{feed.TS: 0}]}]
+        self.assertEqual([5, 3, 1, 0], [event[feed.TS] for event
+                                        in feed.newest_first(buckets)])
+
+    def test_song_by_adder(self):
+        """
+        a song added to someone else's playlist is the adder's event
+        """
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        dbu.create_playlist(FAKE_USER, FAKE_PLAYLIST)
+        dbp.add_song(FAKE_PLAYLIST, FAKE_SONG, FAKE_FRIEND)
+        events = feed.get_feed(FAKE_USER, 10)
+        self.assertEqual([feed.ADDED_SONG], [event[feed.KIND]
+                                             for event in events])
+        self.assertEqual(FAKE_FRIEND, events[0][feed.ACTOR])
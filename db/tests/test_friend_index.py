@@ -0,0 +1,82 @@
+"""
+This file holds the tests for friend_index.py
+"""
+
+from unittest import TestCase
+
+import db.data_users as dbu
+import db.friend_index as fi
+
+FAKE_USER = "Fake user"
+FAKE_PASSWORD = "FakePassword"
+
+
+def befriend(*pairs):
+    for usern1, usern2 in pairs:
+        for user in (usern1, usern2):
+            if not dbu.user_exists(user):
+                dbu.add_user(user, FAKE_PASSWORD)
+        dbu.bef_user(usern1, usern2)
+
+
+class DBTestCase(TestCase):
+    def setUp(self):
+        dbu.empty()
+
+    def tearDown(self):
+        pass
+
+    def test_suggest_missing_user(self):
+        """
+        a user that doesn't exist gets no suggestions
+        """
+        self.assertIsNone(fi.suggest(FAKE_USER, 10))
+
+    def test_suggest_ranks_by_mutual_friends(self):
+        """
+        friends of friends come back, most mutual friends first
+        """
+        befriend(("me", "a"), ("me", "b"), ("a", "x"), ("b", "x"),
+                 ("a", "y"))
+        self.assertEqual(fi.suggest("me", 10),
+                         [{fi.USERNAME: "x", fi.MUTUAL: 2},
+                          {fi.USERNAME: "y", fi.MUTUAL: 1}])
+        self.assertEqual(len(fi.suggest("me", 1)), 1)
+
+    def test_suggest_excludes_friends_and_requests(self):
+        """
+        existing friends and pending requests are never suggested
+        """
+        befriend(("me", "a"), ("me", "b"), ("a", "b"), ("a", "x"))
+        dbu.add_user("y", FAKE_PASSWORD)
+        befriend(("a", "y"))
+        dbu.req_user("y", "me")
+        self.assertEqual(fi.suggest("me", 10),
+                         [{fi.USERNAME: "x", fi.MUTUAL: 1}])
+
+    def test_suggest_follows_changes(self):
+        """
+        befriending, unfriending and deleting update cached suggestions
+        """
+        befriend(("me", "a"), ("a", "x"))
+        self.assertEqual(len(fi.suggest("me", 10)), 1)
+        befriend(("me", "x"))
+        self.assertEqual(fi.suggest("me", 10), [])
+        dbu.unf_user("me", "x")
+        self.assertEqual(len(fi.suggest("me", 10)), 1)
+        dbu.del_user("x")
+        self.assertEqual(fi.suggest("me", 10), [])
+
+    def test_sync(self):
+        """
+        a friendship made by another process shows up once it is synced
+        """
+        befriend(("me", "a"), ("b", "x"))
+        fi.build()
+        dbu.dbc.update_doc(dbu.USERS, {dbu.USERNAME: "a"},
+                           {"$push": {dbu.FRIENDS: "b"}})
+        dbu.dbc.update_doc(dbu.USERS, {dbu.USERNAME: "b"},
+                           {"$push": {dbu.FRIENDS: "a"}})
+        self.assertEqual([], fi.suggest("me", 10))
+        fi.on_change("a", {dbu.FRIENDS})
+        self.assertEqual(["b"], [s[fi.USERNAME] for s in fi.suggest("me", 10)])
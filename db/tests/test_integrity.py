@@ -0,0 +1,108 @@
+"""
+This file holds the tests for integrity.py
+"""
+
+from unittest import TestCase
+
+import db.data_playlists as dbp
+import db.data_users as dbu
+import db.db_connect as dbc
+import db.integrity as integ
+
+FAKE_PASSWORD = "FakePassword"
+FAKE_PLAYLIST = "Fake playlist"
+USER1 = "user 1"
+USER2 = "user 2"
+GONE = "gone"
+
+
+def user(name):
+    """
+    a user's doc
+    """
+    return dbc.fetch_one(dbu.USERS, {dbu.USERNAME: name})
+
+
+class DBTestCase(TestCase):
+    def setUp(self):
+        dbu.empty()
+        dbp.empty()
+        dbu.add_user(USER1, FAKE_PASSWORD)
+        dbu.add_user(USER2, FAKE_PASSWORD)
+        dbp.add_playlist(FAKE_PLAYLIST, USER1)
+        dbu.create_playlist(USER1, FAKE_PLAYLIST)
+
+    def tearDown(self):
+        dbu.empty()
+        dbp.empty()
+
+    def test_clean(self):
+        """
+        references made the usual way are all matched up
+        """
+        dbu.req_user(USER1, USER2)
+        dbu.bef_user(USER1, USER2)
+        dbu.like_playlist(USER2, FAKE_PLAYLIST)
+        for found in integ.check().values():
+            self.assertEqual(0, found[integ.DANGLING])
+            self.assertEqual(0, found.get(integ.ONE_SIDED, 0))
+
+    def test_one_sided_friend(self):
+        """
+        a friendship only one user has is reported, then dropped
+        """
+        dbu.update_user(USER1, {"$push": {dbu.FRIENDS: USER2},
+                                "$inc": {dbu.FRIEND_COUNT: 1}})
+        found = integ.check_relation("friends")
+        self.assertEqual(1, found[integ.ONE_SIDED])
+        self.assertIn(USER2, user(USER1)[dbu.FRIENDS])
+        integ.check_relation("friends", repair=True)
+        self.assertEqual([], user(USER1)[dbu.FRIENDS])
+        self.assertEqual(0, user(USER1)[dbu.FRIEND_COUNT])
+
+    def test_dangling_like(self):
+        """
+        likes of and by missing docs are dropped, with the like count
+        """
+        dbp.add_like(FAKE_PLAYLIST, GONE)
+        dbu.update_user(USER2, {"$push": {integ.LIKED: GONE}})
+        found = integ.check_relation("likes", repair=True)
+        self.assertEqual(2, found[integ.DANGLING])
+        self.assertEqual(2, found[integ.REPAIRED])
+        self.assertEqual(0, dbp.get_playlist(FAKE_PLAYLIST)[dbp.LIKE_COUNT])
+        self.assertEqual([], user(USER2)[integ.LIKED])
+
+    def test_owners(self):
+        """
+        owned playlists follow the playlist's owner field,
+        and playlists of missing owners are only reported
+        """
+        dbu.delete_playlist(USER1, FAKE_PLAYLIST)
+        dbu.update_user(USER2, {"$push": {integ.OWNED: FAKE_PLAYLIST}})
+        dbp.add_playlist("orphan", GONE)
+        found = integ.check_relation("owners", repair=True)
+        self.assertEqual(2, found[integ.ONE_SIDED])
+        self.assertEqual(1, found[integ.KEPT])
+        self.assertEqual([FAKE_PLAYLIST], user(USER1)[integ.OWNED])
+        self.assertEqual([], user(USER2)[integ.OWNED])
+        self.assertIsNotNone(dbp.get_playlist("orphan"))
+
+    def test_orphan_songs(self):
+        """
+        songs of deleted playlists are deleted
+        """
+        dbc.insert_doc(dbp.SONG_ITEMS, {dbp.PLNAME: GONE, dbp.SONG: "a",
+                                        dbp.POS: 1.0})
+        self.assertEqual(1, integ.check_songs()[integ.DANGLING])
+        integ.check_songs(repair=True)
+        self.assertEqual(0, dbc.count(dbp.SONG_ITEMS, {dbp.PLNAME: GONE}))
+
+    def test_dry_run(self):
+        """
+        without repair nothing is written
+        """
+        dbu.update_user(USER2, {"$push": {dbu.INCOMING: GONE}})
+        report = integ.check()
+        self.assertEqual(1, report["requests"][integ.DANGLING])
+        self.assertEqual(0, report["requests"][integ.REPAIRED])
+        self.assertEqual([GONE], user(USER2)[dbu.INCOMING])
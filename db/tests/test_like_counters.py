@@ -0,0 +1,105 @@
+"""
+This file holds the tests for like_counters.py
+"""
+
+from unittest import TestCase
+
+import db.data_playlists as dbp
+import db.data_users as dbu
+import db.db_connect as dbc
+import db.like_counters as lc
+
+FAKE_PASSWORD = "FakePassword"
+FAKE_PLAYLIST = "Fake playlist"
+
+
+def like_by(count):
+    """
+    makes count new users and has each of them like the playlist
+    """
+    for i in range(count):
+        dbu.add_user(f"user {i}", FAKE_PASSWORD)
+        dbu.like_playlist(f"user {i}", FAKE_PLAYLIST)
+
+
+class DBTestCase(TestCase):
+    def setUp(self):
+        dbu.empty()
+        dbp.empty()
+        self.interval = lc.FOLD_INTERVAL
+        lc.FOLD_INTERVAL = 3600
+        dbp.add_playlist(FAKE_PLAYLIST, "owner")
+
+    def tearDown(self):
+        lc.stop()
+        lc.FOLD_INTERVAL = self.interval
+        dbp.empty()
+
+    def shard(self, count):
+        dbc.update_doc(lc.PLAYLISTS, {lc.PLNAME: FAKE_PLAYLIST},
+                       {"$set": {lc.SHARDS: count}})
+        lc.remember(FAKE_PLAYLIST, count)
+
+    def base(self):
+        return dbc.fetch_one(lc.PLAYLISTS, {lc.PLNAME: FAKE_PLAYLIST})
+
+    def test_unsharded(self):
+        """
+        a quiet playlist counts its likes on its doc
+        """
+        like_by(3)
+        self.assertEqual(0, dbc.count(lc.COUNTERS))
+        self.assertEqual(3, dbp.get_playlist(FAKE_PLAYLIST)[dbp.LIKE_COUNT])
+
+    def test_sharded(self):
+        """
+        likes of a sharded playlist leave its doc alone and are added up
+        on read, unlikes still go to the doc
+        """
+        self.shard(4)
+        like_by(5)
+        self.assertEqual(0, self.base()[dbp.LIKE_COUNT])
+        self.assertNotIn(dbp.TREND_SCORE, self.base())
+        dbu.unlike_playlist("user 0", FAKE_PLAYLIST)
+        self.assertEqual(-1, self.base()[dbp.LIKE_COUNT])
+        lc.sums.clear()
+        playlist = dbp.get_playlist(FAKE_PLAYLIST)
+        self.assertEqual(4, playlist[dbp.LIKE_COUNT])
+        self.assertEqual(4, len(playlist[dbp.LIKES]))
+
+    def test_fold(self):
+        """
+        folding moves the shards into likeCount and the trend score
+        without changing the total
+        """
+        self.shard(4)
+        like_by(3)
+        self.assertEqual(3, lc.fold())
+        self.assertEqual(3, dbp.top_playlists(1)[0][dbp.LIKE_COUNT])
+        trending = dbp.trending_playlists(1)
+        self.assertAlmostEqual(trending[0][dbp.RECENT_LIKES], 3, places=2)
+        self.assertEqual(0, lc.fold())
+
+    def test_grow(self):
+        """
+        a playlist liked faster than GROW_RATE gets shards
+        """
+        rate = lc.GROW_RATE
+        lc.GROW_RATE = 2
+        try:
+            like_by(3)
+        finally:
+            lc.GROW_RATE = rate
+        self.assertEqual(lc.FIRST_SHARDS, lc.shards_of(FAKE_PLAYLIST))
+        lc.sums.clear()
+        self.assertEqual(3, dbp.get_playlist(FAKE_PLAYLIST)[dbp.LIKE_COUNT])
+
+    def test_forget(self):
+        """
+        deleting a playlist drops its shards with its likes
+        """
+        self.shard(4)
+        like_by(2)
+        dbp.del_playlist(FAKE_PLAYLIST)
+        self.assertEqual(0, dbc.count(lc.COUNTERS))
+        self.assertEqual(0, dbc.count(dbp.LIKE_ITEMS))
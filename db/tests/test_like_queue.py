@@ -0,0 +1,120 @@
+"""
+This file holds the tests for like_queue.py
+"""
+
+import os
+from unittest import TestCase
+
+import db.data_playlists as dbp
+import db.data_users as dbu
+import db.db_connect as dbc
+import db.feed as feed
+import db.like_queue as lq
+
+FAKE_USER = "Fake user"
+FAKE_FRIEND = "Fake friend"
+FAKE_PASSWORD = "FakePassword"
+FAKE_PLAYLIST = "Fake playlist"
+
+
+class DBTestCase(TestCase):
+    def setUp(self):
+        dbu.empty()
+        dbp.empty()
+        lq.empty()
+        self.interval = lq.FLUSH_INTERVAL
+        lq.FLUSH_INTERVAL = 3600
+        os.environ["WRITE_BEHIND_LIKES"] = "1"
+
+    def tearDown(self):
+        del os.environ["WRITE_BEHIND_LIKES"]
+        lq.stop()
+        lq.FLUSH_INTERVAL = self.interval
+        lq.empty()
+
+    def test_overlay(self):
+        """
+        a user sees their own queued likes and unlikes, and only theirs
+        """
+        lq.enqueue(FAKE_USER, "a", True)
+        lq.enqueue(FAKE_USER, "b", False)
+        lq.enqueue("other", "c", True)
+        self.assertEqual(["a"], lq.overlay(FAKE_USER, ["b"]))
+
+    def test_coalesce(self):
+        """
+        a like and an unlike of the same playlist cancel out
+        """
+        lq.enqueue(FAKE_USER, FAKE_PLAYLIST, True)
+        lq.enqueue(FAKE_USER, FAKE_PLAYLIST, False)
+        self.assertFalse(lq.pending_like(FAKE_USER, FAKE_PLAYLIST))
+        self.assertEqual(1, dbc.count(lq.QUEUE))
+
+    def test_flush(self):
+        """
+        flushed likes land on both the playlist and the user
+        """
+        dbu.add_user(FAKE_USER, FAKE_PASSWORD)
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        dbu.like_playlist(FAKE_USER, FAKE_PLAYLIST)
+        self.assertIn(FAKE_PLAYLIST, dbu.get_user(FAKE_USER)["likedPlaylists"])
+        self.assertEqual(1, lq.flush())
+        self.assertEqual([FAKE_USER],
+                         dbp.get_playlist(FAKE_PLAYLIST)[dbp.LIKES])
+        self.assertEqual(1, dbp.get_playlist(FAKE_PLAYLIST)[dbp.LIKE_COUNT])
+        self.assertEqual(0, dbc.count(lq.QUEUE))
+
+    def test_replay(self):
+        """
+        writing the same batch twice counts its likes once
+        """
+        dbu.add_user(FAKE_USER, FAKE_PASSWORD)
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        for like in (True, False):
+            for i in range(2):
+                lq.write({(FAKE_USER, FAKE_PLAYLIST): like})
+            playlist = dbp.get_playlist(FAKE_PLAYLIST)
+            self.assertEqual(int(like), playlist[dbp.LIKE_COUNT])
+            self.assertEqual(int(like), len(dbp.trending_playlists(1)))
+        self.assertEqual(0, len(playlist[dbp.LIKES]))
+
+    def test_lease(self):
+        """
+        queued likes are written by one flush at a time, and ones changed
+        while being written stay queued
+        """
+        lq.enqueue(FAKE_USER, "a", True)
+        lq.enqueue(FAKE_USER, "b", True)
+        token, docs = lq.claim()
+        self.assertEqual(2, len(docs))
+        self.assertEqual([], lq.claim()[1])
+        lq.enqueue(FAKE_USER, "a", False)
+        lq.finish(token, docs)
+        self.assertFalse(lq.pending_like(FAKE_USER, "a"))
+        self.assertIsNone(lq.pending_like(FAKE_USER, "b"))
+        self.assertEqual(1, len(lq.claim()[1]))
+
+    def test_feed_once(self):
+        """
+        a like written again doesn't show up in the feed again
+        """
+        feed.empty()
+        dbu.add_user(FAKE_USER, FAKE_PASSWORD)
+        dbu.add_user(FAKE_FRIEND, FAKE_PASSWORD)
+        dbu.bef_user(FAKE_USER, FAKE_FRIEND)
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        for i in range(2):
+            lq.write({(FAKE_FRIEND, FAKE_PLAYLIST): True})
+        self.assertEqual([feed.LIKED], [event[feed.KIND] for event
+                                        in feed.get_feed(FAKE_USER, 10)])
+
+    def test_liked_by(self):
+        """
+        a queued like or unlike overrides what the playlist says
+        """
+        dbp.add_playlist(FAKE_PLAYLIST, FAKE_USER)
+        self.assertFalse(lq.liked_by(FAKE_PLAYLIST, FAKE_USER))
+        lq.enqueue(FAKE_USER, FAKE_PLAYLIST, True)
+        self.assertTrue(lq.liked_by(FAKE_PLAYLIST, FAKE_USER))
+        lq.enqueue(FAKE_USER, "nope", True)
+        self.assertIsNone(lq.liked_by("nope", FAKE_USER))
@@ -0,0 +1,48 @@
+"""
+This file holds the tests for migrate_likes.py
+"""
+
+from unittest import TestCase
+
+import db.db_connect as dbc
+import db.data_playlists as dbp
+import db.migrate_likes as ml
+
+FAKE_USER = "Fake user"
+FAKE_PLAYLIST = "Fake playlist"
+
+
+class DBTestCase(TestCase):
+    def setUp(self):
+        dbp.empty()
+
+    def tearDown(self):
+        pass
+
+    def test_migrate(self):
+        """
+        embedded likes move to their own collection and are counted
+        """
+        dbc.insert_doc(dbp.PLAYLISTS, {dbp.PLNAME: FAKE_PLAYLIST,
+                                       dbp.LIKES: ["b", "a", "b"],
+                                       dbp.LIKE_COUNT: 3})
+        self.assertEqual(ml.migrate(), 1)
+        pl = dbp.get_playlist(FAKE_PLAYLIST)
+        self.assertEqual(pl[dbp.LIKES], ["b", "a"])
+        self.assertEqual(pl[dbp.LIKE_COUNT], 2)
+        self.assertNotIn(dbp.LIKES, dbc.fetch_one(
+            dbp.PLAYLISTS, {dbp.PLNAME: FAKE_PLAYLIST}))
+        self.assertEqual(ml.migrate(), 0)
+
+    def test_migrate_again(self):
+        """
+        likes already moved by an interrupted run aren't moved twice
+        """
+        dbp.ensure_like_indexes()
+        dbc.insert_doc(dbp.LIKE_ITEMS, {dbp.PLNAME: FAKE_PLAYLIST,
+                                        dbp.USERNAME: FAKE_USER})
+        dbc.insert_doc(dbp.PLAYLISTS, {dbp.PLNAME: FAKE_PLAYLIST,
+                                       dbp.LIKES: [FAKE_USER, "other"]})
+        ml.migrate()
+        self.assertTrue(dbp.liked_by(FAKE_PLAYLIST, "other"))
+        self.assertEqual(dbp.get_playlist(FAKE_PLAYLIST)[dbp.LIKE_COUNT], 2)
@@ -0,0 +1,44 @@
+"""
+This file holds the tests for migrate_songs.py
+"""
+
+from unittest import TestCase
+
+import db.db_connect as dbc
+import db.data_playlists as dbp
+import db.migrate_songs as ms
+
+FAKE_USER = "Fake user"
+FAKE_PLAYLIST = "Fake playlist"
+
+
+class DBTestCase(TestCase):
+    def setUp(self):
+        dbp.empty()
+
+    def tearDown(self):
+        pass
+
+    def test_migrate(self):
+        """
+        embedded songs move to their own collection in the same order
+        """
+        dbc.insert_doc(dbp.PLAYLISTS, {dbp.PLNAME: FAKE_PLAYLIST,
+                                       dbp.LIKES: [],
+                                       dbp.SONGS: ["b", "a", "c"]})
+        self.assertEqual(ms.migrate(), 1)
+        pl = dbp.get_playlist(FAKE_PLAYLIST)
+        self.assertEqual(pl[dbp.SONGS], ["b", "a", "c"])
+        self.assertEqual(pl[dbp.SONG_COUNT], 3)
+        self.assertEqual(ms.migrate(), 0)
+
+    def test_migrate_then_add(self):
+        """
+        songs added after migrating go on the end
+        """
+        dbc.insert_doc(dbp.PLAYLISTS, {dbp.PLNAME: FAKE_PLAYLIST,
+                                       dbp.SONGS: ["a"]})
+        ms.migrate()
+        dbp.add_song(FAKE_PLAYLIST, "b")
+        self.assertEqual(dbp.get_playlist(FAKE_PLAYLIST)[dbp.SONGS],
+                         ["a", "b"])
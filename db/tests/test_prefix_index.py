@@ -0,0 +1,96 @@
+"""
+This file holds the tests for prefix_index.py
+"""
+
+import time
+from unittest import TestCase
+
+import db.cache_invalidation as ci
+import db.data_users as dbu
+import db.prefix_index as pi
+
+NAMES = ["bob", "Bobby", "alice", "bobcat", "carol", "BOB", "al"]
+FAKE_PASSWORD = "FakePassword"
+
+
+class PrefixIndexTestCase(TestCase):
+    def setUp(self):
+        pi.reset()
+        pi.load(NAMES)
+
+    def tearDown(self):
+        pi.reset()
+
+    def test_complete(self):
+        """
+        names starting with the prefix come back in order, ignoring case
+        """
+        self.assertEqual(["BOB", "bob", "Bobby", "bobcat"],
+                         pi.complete("bo", 10))
+        self.assertEqual(["al", "alice"], pi.complete("AL", 10))
+        self.assertEqual([], pi.complete("dave", 10))
+
+    def test_limit(self):
+        """
+        only the first limit names come back
+        """
+        self.assertEqual(["BOB", "bob"], pi.complete("b", 2))
+
+    def test_add_remove(self):
+        """
+        added names show up and removed ones don't, before a repack
+        """
+        pi.add("Bobo")
+        pi.remove("bobcat")
+        pi.remove("bob")
+        self.assertEqual(["BOB", "Bobby", "Bobo"], pi.complete("bo", 10))
+        pi.add("bob")
+        self.assertIn("bob", pi.complete("bo", 10))
+
+    def test_on_change(self):
+        """
+        another worker's inserts and deletes change only those names
+        """
+        pi.on_change("bobo", None)
+        pi.on_change("bobcat", ci.DELETED)
+        self.assertEqual(["BOB", "bob", "Bobby", "bobo"],
+                         pi.complete("bo", 10))
+        self.assertTrue(pi.built)
+
+    def test_repack(self):
+        """
+        changes are folded into the packed names once enough pile up
+        """
+        limit = pi.REPACK_AT
+        pi.REPACK_AT = 2
+        try:
+            pi.add("bobo")
+            pi.remove("alice")
+            while pi.packing:
+                time.sleep(0.01)
+        finally:
+            pi.REPACK_AT = limit
+        self.assertEqual([], pi.recent)
+        self.assertEqual(set(), pi.removed)
+        self.assertEqual(len(NAMES), len(pi.starts) - 1)
+        self.assertEqual(["al"], pi.complete("al", 10))
+        self.assertIn("bobo", pi.complete("bob", 10))
+
+    def test_unicode(self):
+        """
+        names outside ascii are packed and matched like any other
+        """
+        pi.load(["Zoë", "zoe", "Ölaf"])
+        self.assertEqual(["Zoë"], pi.complete("zoë", 10))
+        self.assertEqual(["Ölaf"], pi.complete("öl", 10))
+
+    def test_users(self):
+        """
+        adding and deleting users keeps the index current
+        """
+        dbu.empty()
+        pi.build()
+        dbu.add_user("typeahead user", FAKE_PASSWORD)
+        self.assertEqual(["typeahead user"], pi.complete("type", 10))
+        dbu.del_user("typeahead user")
+        self.assertEqual([], pi.complete("type", 10))
@@ -0,0 +1,96 @@
+"""
+This file holds the tests for recommend.py
+"""
+
+from unittest import TestCase
+
+import db.data_playlists as dbp
+import db.data_users as dbu
+import db.recommend as rec
+
+FAKE_USER = "Fake user"
+FAKE_PASSWORD = "FakePassword"
+
+
+def likes(**liked):
+    for username, playlists in liked.items():
+        dbu.add_user(username, FAKE_PASSWORD)
+        for playlist in playlists:
+            if not dbp.playlist_exists(playlist):
+                dbp.add_playlist(playlist, FAKE_USER)
+            dbu.like_playlist(username, playlist)
+
+
+class DBTestCase(TestCase):
+    def setUp(self):
+        dbu.empty()
+        dbp.empty()
+        rec.empty()
+
+    def tearDown(self):
+        pass
+
+    def test_recommend_missing_user(self):
+        """
+        a user that doesn't exist gets no recommendations
+        """
+        self.assertIsNone(rec.recommend(FAKE_USER, 10))
+
+    def test_rebuild(self):
+        """
+        playlists liked by the same users become neighbors
+        """
+        likes(u1=["a", "b"], u2=["a", "b"], u3=["c"])
+        self.assertEqual(rec.rebuild(), 2)
+
+    def test_recommend(self):
+        """
+        a user is recommended what people with the same likes liked,
+        best match first, leaving out what they already like
+        """
+        likes(u1=["a", "b", "c"], u2=["a", "b"], u3=["a", "c"],
+              u4=["a", "b"], me=["a"])
+        rec.rebuild()
+        picks = rec.recommend("me", 10)
+        self.assertEqual([pick[rec.PLNAME] for pick in picks], ["b", "c"])
+        self.assertEqual(len(rec.recommend("me", 1)), 1)
+
+    def test_recommend_refreshes_on_like(self):
+        """
+        liking a recommended playlist takes it off the user's picks
+        """
+        likes(u1=["a", "b"], me=["a"])
+        rec.rebuild()
+        self.assertEqual(len(rec.recommend("me", 10)), 1)
+        dbu.like_playlist("me", "b")
+        self.assertEqual(rec.recommend("me", 10), [])
+
+    def test_pair_changes(self):
+        """
+        a new like pairs the playlist with each of the user's likes,
+        both ways, and with itself
+        """
+        self.assertEqual(rec.pair_changes(["a", "b"], ["b"], []),
+                         {("b", "a"): 1, ("a", "b"): 1, ("b", "b"): 1})
+        self.assertEqual(rec.pair_changes(["a"], [], ["b"]),
+                         {("b", "a"): -1, ("a", "b"): -1, ("b", "b"): -1})
+
+    def test_likes_between_rebuilds(self):
+        """
+        likes made after a rebuild change the neighbors straight away
+        """
+        likes(u1=["a", "b"], u3=["a", "b"], me=["a"])
+        rec.rebuild()
+        likes(u2=["a", "c"])
+        picks = rec.recommend("me", 10)
+        self.assertEqual([pick[rec.PLNAME] for pick in picks], ["b", "c"])
+        dbu.unlike_playlist("u2", "c")
+        dbu.like_playlist("me", "b")
+        self.assertEqual(rec.recommend("me", 10), [])
+
+    def test_take_turn(self):
+        """
+        a scheduled rebuild is taken by one worker until the next is due
+        """
+        self.assertTrue(rec.take_turn(3600))
+        self.assertFalse(rec.take_turn(3600))
@@ -0,0 +1,73 @@
+"""
+This file holds the tests for synth.py
+"""
+
+from unittest import TestCase
+
+import db.data_playlists as dbp
+import db.data_users as dbu
+import db.db_connect as dbc
+import db.synth as synth
+
+USERS = 2000
+SEED = 7
+
+
+class SynthTestCase(TestCase):
+    def setUp(self):
+        self.world = synth.build(USERS, SEED)
+        self.users = {user[dbu.USERNAME]: user
+                      for user in synth.user_docs(self.world)}
+
+    def test_repeatable(self):
+        """
+        the same seed gives the same dataset, another seed another one
+        """
+        again = synth.build(USERS, SEED)
+        self.assertEqual(list(self.users.values()),
+                         list(synth.user_docs(again)))
+        self.assertEqual(list(synth.song_docs(self.world)),
+                         list(synth.song_docs(again)))
+        other = synth.build(USERS, SEED + 1)
+        self.assertNotEqual(list(self.users.values()),
+                            list(synth.user_docs(other)))
+
+    def test_consistent(self):
+        """
+        friendships and requests are recorded on both sides
+        """
+        for name, user in self.users.items():
+            self.assertEqual(len(user[dbu.FRIENDS]), user[dbu.FRIEND_COUNT])
+            for friend in user[dbu.FRIENDS]:
+                self.assertIn(name, self.users[friend][dbu.FRIENDS])
+            for other in user[dbu.OUTGOING]:
+                self.assertIn(name, self.users[other][dbu.INCOMING])
+                self.assertNotIn(other, user[dbu.FRIENDS])
+
+    def test_heavy_tails(self):
+        """
+        a few users have far more friends, and a few playlists far more
+        likes, than the typical one
+        """
+        friends = sorted(user[dbu.FRIEND_COUNT]
+                         for user in self.users.values())
+        self.assertGreater(friends[-1], 10 * friends[len(friends) // 2])
+        likes = sorted(pl[dbp.LIKE_COUNT]
+                       for pl in synth.playlist_docs(self.world))
+        self.assertGreater(likes[-1], 10 * max(1, likes[len(likes) // 2]))
+
+    def test_to_mongo(self):
+        """
+        a dataset is bulk inserted into every collection
+        """
+        dbu.empty()
+        dbp.empty()
+        world = synth.build(100, SEED)
+        inserted = synth.to_mongo(world)
+        self.assertEqual(100, inserted[dbu.USERS])
+        self.assertEqual(100, dbc.count(dbu.USERS))
+        self.assertEqual(sum(synth.song_counts(world)),
+                         dbc.count(dbp.SONG_ITEMS))
+        self.assertEqual(sum(pl[dbp.LIKE_COUNT]
+                             for pl in synth.playlist_docs(world)),
+                         dbc.count(dbp.LIKE_ITEMS))
@@ -0,0 +1,122 @@
+"""
+This file holds the tests for trigram_index.py
+"""
+
+from unittest import TestCase
+
+import db.cache_invalidation as ci
+import db.data_playlists as dbp
+import db.trigram_index as ti
+
+NAMES = ["Chill Vibes", "Chill Vibes 2", "Road Trip", "Rainy Day Jazz",
+         "Morning Coffee", "Workout Mix"]
+FAKE_USER = "trigram user"
+
+
+class TrigramIndexTestCase(TestCase):
+    def setUp(self):
+        ti.reset()
+        ti.load(NAMES)
+
+    def tearDown(self):
+        ti.reset()
+
+    def test_typos(self):
+        """
+        names are found with letters missing, swapped or changed
+        """
+        self.assertEqual("Chill Vibes", ti.search("chil vibez", 10)[0][0])
+        self.assertEqual("Rainy Day Jazz",
+                         ti.search("rainy dya jaz", 10)[0][0])
+        self.assertEqual("Morning Coffee",
+                         ti.search("mornin cofee", 10)[0][0])
+
+    def test_scores(self):
+        """
+        an exact name scores 1 and comes before ones that only look like it
+        """
+        self.assertEqual([("Chill Vibes", 1.0), ("Chill Vibes 2", 1.0)],
+                         ti.search("Chill Vibes", 10))
+        self.assertLess(ti.search("chil vibes", 10)[0][1], 1.0)
+
+    def test_contained(self):
+        """
+        a query found whole in a longer name matches it fully
+        """
+        ti.add("Best Rock Songs Of All Time")
+        ti.add("Chill Vibes Summer Mix 2021")
+        self.assertEqual([("Best Rock Songs Of All Time", 1.0)],
+                         ti.search("rock", 10))
+        found = [name for name, score in ti.search("chill", 10)]
+        self.assertEqual(["Chill Vibes", "Chill Vibes 2",
+                          "Chill Vibes Summer Mix 2021"], found)
+
+    def test_limit_threshold(self):
+        """
+        no more than limit names come back, and none that are too unlike
+        """
+        self.assertEqual(1, len(ti.search("chill vibes", 1)))
+        self.assertEqual([], ti.search("zzzzzz", 10))
+        self.assertEqual([], ti.search("  !! ", 10))
+        self.assertGreater(len(ti.search("chill", 10, threshold=0)),
+                           len(ti.search("chill", 10)))
+
+    def test_add_remove(self):
+        """
+        added names are found and removed ones aren't
+        """
+        ti.add("Chill Hop")
+        ti.remove("Chill Vibes")
+        found = [name for name, score in ti.search("chill", 10)]
+        self.assertIn("Chill Hop", found)
+        self.assertNotIn("Chill Vibes", found)
+        ti.remove("Chill Vibes")
+        ti.add("Chill Vibes")
+        self.assertEqual("Chill Vibes", ti.search("chill vibes", 10)[0][0])
+
+    def test_scan_limit(self):
+        """
+        no more than SCAN_LIMIT ids are read, even from the rarest piece
+        """
+        limit = ti.SCAN_LIMIT
+        ti.SCAN_LIMIT = 1
+        try:
+            self.assertEqual([("Chill Vibes", 1.0)],
+                             ti.search("Chill Vibes", 10))
+        finally:
+            ti.SCAN_LIMIT = limit
+
+    def test_on_change(self):
+        """
+        another worker's inserts and deletes change only those names
+        """
+        ti.on_change("Chill Hop", None)
+        ti.on_change("Chill Vibes", ci.DELETED)
+        found = [name for name, score in ti.search("chill", 10)]
+        self.assertIn("Chill Hop", found)
+        self.assertNotIn("Chill Vibes", found)
+        self.assertTrue(ti.built)
+
+    def test_changes_during_load(self):
+        """
+        changes made while a reload reads the names are kept
+        """
+        ti.building = True
+        ti.add("Chill Hop")
+        ti.remove("Road Trip")
+        ti.load(NAMES)
+        found = [name for name, score in ti.search("chill hop", 10)]
+        self.assertEqual("Chill Hop", found[0])
+        self.assertEqual([], ti.search("road trip", 10))
+
+    def test_playlists(self):
+        """
+        adding and deleting playlists keeps the index current
+        """
+        dbp.empty()
+        ti.build()
+        dbp.add_playlist("Sunday Morning", FAKE_USER)
+        found = dbp.search_playlists("sundya mornign", 10)
+        self.assertEqual("Sunday Morning", found[0][dbp.PLNAME])
+        dbp.del_playlist("Sunday Morning")
+        self.assertEqual([], dbp.search_playlists("sunday morning", 10))
@@ -1,13 +1,43 @@
 """
 This file contains the methods for managing user tokens
+Setting TOKEN_KEYS turns on signed tokens, which carry the username
+and expiry and can be checked without going to the database.
+TOKEN_KEYS is a comma separated list of kid:secret pairs; the first key
+signs new tokens and the others are still accepted, so keys can be
+rotated by putting the new key first and dropping the old one a day later.
 """
 
+import base64
+import hashlib
+import hmac
+import json
+import os
 import secrets
 import datetime
+import time
 
 
 ID = "id"
 EXP = "exp"
+USER = "u"
+IAT = "iat"
+JTI = "jti"
+LIFETIME = datetime.timedelta(days=1)
+
+
+def parse_keys(spec):
+    """
+    reads signing keys from kid:secret pairs separated by commas
+    """
+    keys = {}
+    for pair in spec.split(","):
+        if pair.strip():
+            kid, secret = pair.strip().split(":", 1)
+            keys[kid] = secret.encode()
+    return keys
+
+
+KEYS = parse_keys(os.environ.get("TOKEN_KEYS", ""))
 
 
 def blank():
@@ -20,14 +50,31 @@ def blank():
     }
 
 
+def expiry():
+    """
+    when a token made right now expires
+    """
+    return datetime.datetime.utcnow() + LIFETIME
+
+
 def new():
     """
     generates a new token when for when a user is logged in
     """
     return {
         ID: secrets.token_urlsafe(16),
-        EXP: (datetime.datetime.utcnow() +
-              datetime.timedelta(days=1)).isoformat()
+        EXP: expiry().isoformat()
+    }
+
+
+def session():
+    """
+    generates a new token whose expiration is a datetime,
+    so mongo can expire it by itself
+    """
+    return {
+        ID: secrets.token_urlsafe(16),
+        EXP: expiry()
     }
 
 
@@ -37,3 +84,71 @@ def check(val):
     """
     return (datetime.datetime.fromisoformat(val[EXP]) >
             datetime.datetime.utcnow())
+
+
+def signing():
+    """
+    whether new tokens are signed rather than stored sessions
+    """
+    return bool(KEYS)
+
+
+def encode(raw):
+    """
+    url safe base64 without padding
+    """
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode(text):
+    """
+    undoes encode
+    """
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def signature(kid, body):
+    """
+    the HMAC-SHA256 of a token body under one of the keys
+    """
+    return hmac.new(KEYS[kid], body.encode(), hashlib.sha256).digest()
+
+
+def sign(username):
+    """
+    generates a signed token for a user, signed with the first key
+    """
+    kid = next(iter(KEYS))
+    now = int(time.time())
+    claims = {USER: username, IAT: now,
+              EXP: now + int(LIFETIME.total_seconds()),
+              JTI: secrets.token_urlsafe(8)}
+    body = f"{kid}.{encode(json.dumps(claims).encode())}"
+    return f"{body}.{encode(signature(kid, body))}"
+
+
+def is_signed(val):
+    """
+    signed tokens have three dot separated parts, session ids have none
+    """
+    return isinstance(val, str) and val.count(".") == 2
+
+
+def verify(val):
+    """
+    returns the claims of a signed token if it was signed by a known key
+    and hasn't expired, else None
+    """
+    if not is_signed(val):
+        return None
+    kid, payload, sig = val.split(".")
+    if kid not in KEYS:
+        return None
+    try:
+        if not hmac.compare_digest(decode(sig),
+                                   signature(kid, f"{kid}.{payload}")):
+            return None
+        claims = json.loads(decode(payload))
+    except ValueError:
+        return None
+    return claims if claims[EXP] > time.time() else None
@@ -0,0 +1,50 @@
+"""
+Gunicorn settings for the API, read by `gunicorn API.endpoints:app`.
+Every request spends most of its time waiting on Mongo, so each worker
+runs several threads. The defaults haven't been measured yet: they are
+a starting point until bench/sweep.sh has been run against a database
+and its best row copied here, and can be overridden per dyno through
+the environment.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# gthread by default, or sync; admission is sized from threads, which
+# only these two use for the requests a worker runs at once
+WORKER_CLASSES = ("gthread", "sync")
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+if worker_class not in WORKER_CLASSES:
+    raise ValueError(f"GUNICORN_WORKER_CLASS must be one of "
+                     f"{', '.join(WORKER_CLASSES)}, not {worker_class}")
+workers = int(os.environ.get("WEB_CONCURRENCY",
+                             multiprocessing.cpu_count() * 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+# longer than REQUEST_BUDGET, so a request runs out of database time
+# and answers 503 before gunicorn kills the worker under it
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# the app is loaded after the fork, so each worker makes its own
+# Mongo client and starts its own background threads
+preload_app = False
+
+max_requests = 10000
+max_requests_jitter = 1000
+
+
+def post_worker_init(worker):
+    """
+    sizes the admission limits for the requests this worker runs at once,
+    then connects to mongo and builds the swagger spec in the background,
+    so a new worker serves requests without waiting on either
+    """
+    import API.admission
+    import API.endpoints
+    API.admission.configure(1 if worker_class == "sync"
+                            else worker.cfg.threads)
+    API.endpoints.warm_up()